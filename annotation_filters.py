@@ -0,0 +1,117 @@
+"""
+Per-annotation predicate filters applied before any image is fetched.
+
+Keeping every annotation of a target class also keeps crowd regions and
+boxes of a few pixels, which add label noise and cost download bandwidth for
+images that contribute almost nothing. FilteredIndex therefore stores a few
+derived columns next to each annotation row (computed once and cached with
+the index):
+
+    rel_area     box area / image area
+    rel_width    box width / image width
+    rel_height   box height / image height
+    aspect       box width / box height
+    border_dist  distance in pixels from the box to the nearest image border
+                 (0 for boxes touching the border, i.e. truncated objects)
+
+Filters such as --min-area 0.001 --exclude-crowd are evaluated as one
+boolean mask over the whole split; annotations that fail are removed from
+the index and images left without any annotation are dropped with them.
+"""
+
+import numpy as np
+
+
+PREDICATE_COLUMNS = ('rel_area', 'rel_width', 'rel_height', 'aspect', 'border_dist')
+# Boxes closer than this many pixels to an image edge count as truncated
+TRUNCATION_MARGIN = 1.0
+
+
+def predicate_columns(annotations):
+    """
+    Derived per-annotation columns used by the filters.
+
+    Args:
+        annotations: Annotation table as returned by yolo_labels.build_annotation_table
+
+    Returns:
+        Dict with one float64 array per name in PREDICATE_COLUMNS
+    """
+    bbox = annotations['bbox']
+    x, y, w, h = bbox[:, 0], bbox[:, 1], bbox[:, 2], bbox[:, 3]
+    img_w, img_h = annotations['width'], annotations['height']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aspect = np.where(h > 0, w / h, np.inf)
+    border_dist = np.minimum.reduce([x, y, img_w - (x + w), img_h - (y + h)])
+    return {
+        'rel_area': (w * h) / (img_w * img_h),
+        'rel_width': w / img_w,
+        'rel_height': h / img_h,
+        'aspect': aspect,
+        'border_dist': np.maximum(border_dist, 0.0),
+    }
+
+
+def annotation_mask(annotations, filters):
+    """
+    Evaluate the filters over every annotation at once.
+
+    Args:
+        annotations: Annotation table including the PREDICATE_COLUMNS
+        filters: Dict of active filters, any of
+            'min_area' / 'max_area': bounds on the relative box area,
+            'min_size': minimum shorter box side in pixels,
+            'max_aspect': maximum elongation max(w/h, h/w),
+            'exclude_crowd': drop iscrowd regions,
+            'exclude_truncated': drop boxes touching the image border
+
+    Returns:
+        Boolean array, True for annotations that pass every filter
+    """
+    keep = np.ones(len(annotations['id']), dtype=bool)
+    if filters.get('min_area') is not None:
+        keep &= annotations['rel_area'] >= filters['min_area']
+    if filters.get('max_area') is not None:
+        keep &= annotations['rel_area'] <= filters['max_area']
+    if filters.get('min_size') is not None:
+        bbox = annotations['bbox']
+        keep &= np.minimum(bbox[:, 2], bbox[:, 3]) >= filters['min_size']
+    if filters.get('max_aspect') is not None:
+        aspect = annotations['aspect']
+        with np.errstate(divide='ignore'):
+            elongation = np.maximum(aspect, 1.0 / aspect)
+        keep &= elongation <= filters['max_aspect']
+    if filters.get('exclude_crowd'):
+        keep &= annotations['iscrowd'] == 0
+    if filters.get('exclude_truncated'):
+        keep &= annotations['border_dist'] >= TRUNCATION_MARGIN
+    return keep
+
+
+def active_filters(min_area=None, max_area=None, min_size=None, max_aspect=None,
+                   exclude_crowd=False, exclude_truncated=False):
+    """Collect the filters that are set into a dict (empty if none are)."""
+    filters = {
+        'min_area': min_area,
+        'max_area': max_area,
+        'min_size': min_size,
+        'max_aspect': max_aspect,
+        'exclude_crowd': exclude_crowd or None,
+        'exclude_truncated': exclude_truncated or None,
+    }
+    return {name: value for name, value in filters.items() if value is not None}
+
+
+def describe_filters(filters):
+    """Short human-readable description, e.g. 'min_area>=0.001, no crowd'."""
+    parts = []
+    for name, value in filters.items():
+        if name == 'exclude_crowd':
+            parts.append("no crowd")
+        elif name == 'exclude_truncated':
+            parts.append("no truncated")
+        elif name.startswith('min_'):
+            parts.append(f"{name[4:]}>={value}")
+        else:
+            parts.append(f"{name[4:]}<={value}")
+    return ", ".join(parts)
@@ -0,0 +1,308 @@
+"""
+Benchmark the COCO filtering, conversion and analysis pipeline offline.
+
+For each requested size a synthetic COCO annotation file is generated (and
+cached), then every stage runs in a fresh process so its memory high-water
+mark can be measured:
+
+    annotation_load[coco]    pycocotools COCO index build
+    annotation_load[stream]  StreamingCOCO load of the target classes
+    filter                   FilteredIndex build (category resolution + image selection)
+    label_convert            vectorized COCO -> YOLO conversion of every target-class image
+    label_write[p=N]         label_writer.write_labels (convert + write one file
+                             per image) with N worker processes, for each N
+    statistics               per-class instance/image/co-occurrence/box-size statistics
+    download                 concurrent fetch from a local fake image server
+
+Cold start of the unified CLI (coco_cli.py) is measured separately: each
+command runs in a fresh interpreter, the best wall time of a few runs is
+kept, and the heavy modules (fiftyone, pycocotools, ...) it imported are
+recorded, so pure-file commands can be checked to stay well under a second.
+
+The machine-readable report records wall time, items/sec and peak RSS per
+stage together with the git commit, and --compare prints the change
+against an earlier report.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 5000 120000 1000000
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/report-<old>.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from run_report import peak_rss_mb
+from synthetic_coco import FakeImageServer, generate_annotations
+
+
+TARGET_CLASSES = ['car', 'person', 'bicycle']
+FIXTURE_BASE_URL = "http://127.0.0.1:8000"
+
+# label -> coco_cli.py arguments; 'interpreter' is the bare Python startup baseline
+COLD_START_COMMANDS = {
+    'interpreter': None,
+    'cli --help': ['--help'],
+    'analyze labels --help': ['analyze', 'labels', '--help'],
+    'export pack --help': ['export', 'pack', '--help'],
+    'filter download --help': ['filter', 'download', '--help'],
+    'analyze zoo --help': ['analyze', 'zoo', '--help'],
+}
+HEAVY_MODULES = ('fiftyone', 'pycocotools', 'cv2', 'PIL', 'tqdm', 'numpy')
+_COLD_START_SNIPPET = """
+import sys, json
+sys.path.insert(0, {root!r})
+import coco_cli
+try:
+    coco_cli.main({argv!r})
+except SystemExit:
+    pass
+print(json.dumps([m for m in {heavy!r} if m in sys.modules]))
+"""
+
+
+class StageTimer:
+    """Collects per-stage wall time, throughput and RSS inside a benchmark process."""
+
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, fn, items_fn=None):
+        rss_start = peak_rss_mb()
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        items = items_fn(result) if items_fn else None
+        self.results[name] = {
+            'seconds': round(seconds, 4),
+            'items': items,
+            'items_per_sec': round(items / seconds, 1) if items and seconds > 0 else None,
+            'rss_start_mb': round(rss_start, 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+        return result
+
+
+def _coco_load_group(fixture, workdir, options, queue):
+    """Child process: time the pycocotools loader on its own."""
+    timer = StageTimer()
+    try:
+        from coco_stream import load_coco
+        timer.run('annotation_load[coco]', lambda: load_coco(fixture, TARGET_CLASSES, loader="coco"),
+                  lambda coco: len(coco.anns))
+    except ImportError as e:
+        timer.results['annotation_load[coco]'] = {'skipped': str(e)}
+    queue.put(timer.results)
+
+
+def _pipeline_group(fixture, workdir, options, queue):
+    """Child process: streaming load followed by the downstream stages."""
+    import numpy as np
+    from coco_stream import load_coco
+    from filtered_index import FilteredIndex
+    from image_fetch import ImageFetcher
+    from yolo_labels import build_annotation_table, build_label_texts
+    from label_writer import write_labels
+    from class_stats import compute_class_statistics
+
+    timer = StageTimer()
+    coco = timer.run('annotation_load[stream]', lambda: load_coco(fixture, TARGET_CLASSES, loader="stream"),
+                     lambda coco: len(coco.anns))
+    index = timer.run('filter', lambda: FilteredIndex.from_coco(coco, TARGET_CLASSES),
+                      lambda index: len(index.images['id']))
+
+    # The downstream stages run on every image with a target-class annotation,
+    # not only the filter's selection, so they are measured at full scale
+    table = build_annotation_table(coco, index.cat_ids)
+    img_ids = np.unique(table['image_id']).tolist()
+    imgs = coco.loadImgs(img_ids)
+    file_names = {img['id']: img['file_name'] for img in imgs}
+    urls = {img['id']: img['coco_url'] for img in imgs}
+    del coco
+
+    coco_to_yolo = {cat_id: idx for idx, cat_id in enumerate(sorted(index.cat_ids))}
+    texts, _ = timer.run('label_convert', lambda: build_label_texts(table, coco_to_yolo, img_ids),
+                         lambda result: len(table['id']))
+
+    # The writer download_coco_filtered.py uses, into a fresh directory per process count
+    for processes in options['label_processes']:
+        labels_dir = Path(workdir) / f"labels-p{processes}"
+        labels_dir.mkdir(parents=True, exist_ok=True)
+        timer.run(f'label_write[p={processes}]',
+                  lambda: write_labels(table, coco_to_yolo, img_ids, file_names, labels_dir, processes=processes),
+                  lambda _: len(img_ids))
+        shutil.rmtree(labels_dir, ignore_errors=True)
+
+    # Per-image label lists, as the FiftyOne scripts pull them from a label field
+    names = {cat['id']: cat['name'] for cat in index.categories}
+    order = np.argsort(table['image_id'], kind='stable')
+    ann_names = [names[cat_id] for cat_id in table['category_id'][order].tolist()]
+    widths = table['width'][order]
+    heights = table['height'][order]
+    rel_boxes = (table['bbox'][order] / np.stack([widths, heights, widths, heights], axis=1)).tolist()
+    _, starts = np.unique(table['image_id'][order], return_index=True)
+    bounds = list(zip(starts.tolist(), starts[1:].tolist() + [len(order)]))
+    sample_labels = [ann_names[a:b] for a, b in bounds]
+    sample_boxes = [rel_boxes[a:b] for a, b in bounds]
+    timer.run('statistics', lambda: compute_class_statistics(sample_labels, sample_boxes, classes=TARGET_CLASSES),
+              lambda _: len(ann_names))
+
+    num_images = min(options['download_images'], len(img_ids))
+    if num_images:
+        images_dir = Path(workdir) / "images"
+        images_dir.mkdir(parents=True, exist_ok=True)
+        jobs = [(img_id, urls[img_id].replace(FIXTURE_BASE_URL, options['server_url']), images_dir / file_names[img_id])
+                for img_id in img_ids[:num_images]]
+        fetcher = ImageFetcher(workers=options['workers'])
+        fetched, failed = timer.run('download', lambda: fetcher.fetch_all(jobs, desc="Benchmark download"),
+                                    lambda result: len(result[0]))
+        timer.results['download']['bytes'] = sum(nbytes for nbytes, _ in fetched.values())
+        timer.results['download']['failed'] = len(failed)
+    queue.put(timer.results)
+
+
+def _run_in_child(target, *args):
+    """Run a benchmark group in a fresh spawned process so peak RSS is per group."""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=target, args=args + (queue,))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f"Benchmark process {target.__name__} failed with exit code {proc.exitcode}")
+    return queue.get()
+
+
+def cold_start(repeats=5):
+    """Best-of-N wall time and heavy imports of each COLD_START_COMMANDS entry in a fresh interpreter."""
+    results = {}
+    for label, argv in COLD_START_COMMANDS.items():
+        code = "pass" if argv is None else _COLD_START_SNIPPET.format(
+            root=str(REPO_ROOT), argv=argv, heavy=HEAVY_MODULES)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True)
+            times.append(time.perf_counter() - start)
+        heavy = json.loads(proc.stdout.strip().splitlines()[-1]) if argv is not None and proc.returncode == 0 else []
+        results[label] = {'seconds': round(min(times), 4), 'heavy_imports': heavy}
+        print(f"  {label:26s} {results[label]['seconds']:8.3f}s  imports: {', '.join(heavy) or '-'}")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def fixture_path(fixtures_dir, size, seed):
+    """Generate (once) and return the synthetic annotation file for a size."""
+    path = Path(fixtures_dir) / f"instances_synthetic_{size}_seed{seed}.json"
+    if not path.exists():
+        print(f"Generating synthetic COCO annotations ({size} annotations)...")
+        tmp = path.with_suffix(".json.tmp")
+        generate_annotations(tmp, size, image_base_url=FIXTURE_BASE_URL, seed=seed)
+        os.replace(tmp, path)
+    return path
+
+
+def run(sizes, fixtures_dir, download_images, workers, seed, cold_start_repeats=5, label_processes=(1,)):
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': {},
+    }
+    if cold_start_repeats:
+        print("\nCLI cold start...")
+        report['cold_start'] = cold_start(cold_start_repeats)
+    with FakeImageServer() as server:
+        for size in sizes:
+            fixture = str(fixture_path(fixtures_dir, size, seed))
+            workdir = tempfile.mkdtemp(prefix=f"coco_bench_{size}_")
+            options = {'download_images': download_images, 'workers': workers, 'server_url': server.base_url,
+                       'label_processes': list(label_processes)}
+            try:
+                print(f"\nBenchmarking {size} annotations...")
+                results = {'fixture_bytes': os.path.getsize(fixture)}
+                results.update(_run_in_child(_coco_load_group, fixture, workdir, options))
+                results.update(_run_in_child(_pipeline_group, fixture, workdir, options))
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            report['results'][str(size)] = results
+            for stage, values in results.items():
+                if isinstance(values, dict) and 'seconds' in values:
+                    print(f"  {stage:26s} {values['seconds']:8.3f}s  peak RSS {values['peak_rss_mb']:8.1f} MB")
+    return report
+
+
+def compare(old_report, new_report):
+    """Print per-stage time and memory changes between two reports."""
+    print(f"\nComparing {old_report['commit']} -> {new_report['commit']}")
+    old_cold = old_report.get('cold_start', {})
+    for label, new in new_report.get('cold_start', {}).items():
+        if label in old_cold:
+            print(f"  cold start {label:26s} {old_cold[label]['seconds']:8.3f}s -> {new['seconds']:8.3f}s")
+    for size, new_results in new_report['results'].items():
+        old_results = old_report['results'].get(size, {})
+        print(f"\n{size} annotations:")
+        for stage, new in new_results.items():
+            old = old_results.get(stage)
+            if not isinstance(new, dict) or 'seconds' not in new or not isinstance(old, dict) or 'seconds' not in old:
+                continue
+            ratio = new['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+            print(f"  {stage:26s} {old['seconds']:8.3f}s -> {new['seconds']:8.3f}s ({ratio:5.2f}x)  "
+                  f"RSS {old['peak_rss_mb']:7.1f} -> {new['peak_rss_mb']:7.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the COCO filtering pipeline on synthetic data")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 120000, 1000000],
+                        help='Annotation counts of the synthetic COCO files')
+    parser.add_argument('--fixtures-dir', type=str, default=str(REPO_ROOT / "benchmarks" / ".fixtures"),
+                        help='Directory for the generated (cached) annotation files')
+    parser.add_argument('--download-images', type=int, default=2000,
+                        help='Number of images fetched from the fake server per size (0 to skip)')
+    parser.add_argument('--workers', type=int, default=16,
+                        help='Download worker threads')
+    parser.add_argument('--label-processes', type=int, nargs='+',
+                        default=sorted({1, os.cpu_count() or 1}),
+                        help='Worker process counts to time label writing with')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed for the synthetic data')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Report path (default: benchmarks/results/report-<commit>.json)')
+    parser.add_argument('--cold-start-repeats', type=int, default=5,
+                        help='Runs per CLI cold-start command (0 to skip)')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='Earlier report to compare the new results against')
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.fixtures_dir, args.download_images, args.workers, args.seed,
+                 args.cold_start_repeats, args.label_processes)
+    output = Path(args.output) if args.output else REPO_ROOT / "benchmarks" / "results" / f"report-{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nBenchmark report saved to: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,158 @@
+"""
+Synthetic COCO fixtures for the benchmark suite.
+
+generate_annotations writes a COCO-format instances file with a configurable
+number of annotations (80 categories, person-heavy class mix, about 7.3
+annotations per image like COCO), streamed to disk so even 1M-annotation
+files are generated without holding them in memory. FakeImageServer serves
+small fake JPEGs over HTTP on localhost so the download path can be timed
+fully offline.
+"""
+
+import json
+import random
+import threading
+import http.server
+from pathlib import Path
+
+
+# Real COCO ids/names for the classes the pipeline targets; the rest are filler
+TARGET_CATEGORIES = [(1, 'person'), (2, 'bicycle'), (3, 'car')]
+ANNOTATIONS_PER_IMAGE = 7.3
+
+# Smallest valid JPEG-shaped payload (SOI, JFIF APP0, EOI), padded per image
+FAKE_JPEG = bytes.fromhex("ffd8ffe000104a46494600010100000100010000ffd9")
+
+
+def _categories():
+    cats = [{'id': cat_id, 'name': name, 'supercategory': 'synthetic'} for cat_id, name in TARGET_CATEGORIES]
+    cats += [{'id': cat_id, 'name': f"class{cat_id}", 'supercategory': 'synthetic'} for cat_id in range(4, 81)]
+    return cats
+
+
+def generate_annotations(path, num_annotations, image_base_url="http://127.0.0.1:8000", seed=0):
+    """
+    Write a synthetic COCO instances JSON file.
+
+    Args:
+        path: Output file path
+        num_annotations: Number of annotations to generate
+        image_base_url: Base URL used for each image's coco_url
+        seed: Random seed (same seed and size produce the same file)
+
+    Returns:
+        Number of images written
+    """
+    rng = random.Random(seed)
+    num_images = max(1, int(num_annotations / ANNOTATIONS_PER_IMAGE))
+    sizes = [(640, 480), (480, 640), (640, 427), (500, 375), (427, 640)]
+    image_sizes = [rng.choice(sizes) for _ in range(num_images)]
+    cat_ids = list(range(1, 81))
+    weights = [30.0, 1.0, 4.5] + [0.8] * 77
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        f.write('{"info": {"description": "synthetic COCO"}, "licenses": [{"id": 1, "name": "synthetic"}], "images": [')
+        for i, (width, height) in enumerate(image_sizes):
+            img_id = i + 1
+            file_name = f"{img_id:012d}.jpg"
+            f.write(("," if i else "") + json.dumps({
+                'id': img_id, 'file_name': file_name, 'width': width, 'height': height, 'license': 1,
+                'coco_url': f"{image_base_url}/images/{file_name}",
+            }))
+        f.write('], "annotations": [')
+        categories = rng.choices(cat_ids, weights, k=num_annotations)
+        for ann_id in range(1, num_annotations + 1):
+            img_idx = rng.randrange(num_images)
+            width, height = image_sizes[img_idx]
+            x = rng.uniform(0, width - 2)
+            y = rng.uniform(0, height - 2)
+            w = rng.uniform(1, width - x)
+            h = rng.uniform(1, height - y)
+            bbox = [round(x, 2), round(y, 2), round(w, 2), round(h, 2)]
+            polygon = [round(v, 2) for v in (x, y, x + w, y, x + w, y + h, x, y + h)]
+            f.write(("," if ann_id > 1 else "") + json.dumps({
+                'id': ann_id, 'image_id': img_idx + 1, 'category_id': categories[ann_id - 1],
+                'bbox': bbox, 'area': round(w * h, 2), 'iscrowd': int(rng.random() < 0.01),
+                'segmentation': [polygon],
+            }))
+        f.write('], "categories": ' + json.dumps(_categories()) + '}')
+    return num_images
+
+
+class _FakeImageHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+            scripted = self.server.responses.get(self.path)
+            status, headers = scripted.pop(0) if scripted else (200, {})
+        if status != 200:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = FAKE_JPEG + self.path.encode().ljust(self.server.image_bytes, b'\0')
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeImageServer:
+    """
+    Local HTTP server returning a fake JPEG for any path.
+
+    Use as a context manager; base_url is valid while it is running. The
+    paths requested and the number of connections opened are recorded in
+    requests and connections.
+
+    Args:
+        image_bytes: Approximate payload size of each fake image
+        responses: Optional {path: [(status, headers), ...]} served in order for
+            that path before it returns the image (to exercise retries and redirects)
+    """
+
+    def __init__(self, image_bytes=16 * 1024, responses=None):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _FakeImageHandler)
+        self.server.daemon_threads = True
+        self.server.image_bytes = image_bytes
+        self.server.responses = {path: list(scripted) for path, scripted in (responses or {}).items()}
+        self.server.requests = []
+        self.server.connections = 0
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
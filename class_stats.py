@@ -0,0 +1,136 @@
+"""
+Single-pass per-class statistics for FiftyOne label fields.
+
+Counting "images with <label>" by building a filter_labels(...).match(...)
+view per label scans the whole dataset once per label. Here the labels (and
+boxes, if the field has them) of every sample are pulled with one batched
+aggregation, and instance counts, image counts, class co-occurrence and
+box-size histograms for every class are computed from those arrays with
+NumPy.
+"""
+
+import numpy as np
+
+from run_report import stage
+
+
+# Bins over sqrt(relative box area), i.e. box size relative to the image side
+SIZE_BINS = np.array([0.0, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0 + 1e-9])
+
+
+def pull_labels(dataset, label_field, list_field="detections", with_boxes=True):
+    """
+    Fetch the per-sample label lists (and bounding boxes) of a field in one aggregation.
+
+    Args:
+        dataset: FiftyOne dataset or view
+        label_field: Label field name, e.g. 'ground_truth'
+        list_field: List attribute of the label type ('detections' or 'keypoints')
+        with_boxes: Also fetch '<field>.<list>.bounding_box'
+
+    Returns:
+        Tuple (sample_labels, sample_boxes); sample_boxes is None without boxes
+    """
+    import fiftyone as fo
+
+    aggregations = [fo.Values(f"{label_field}.{list_field}.label")]
+    if with_boxes:
+        aggregations.append(fo.Values(f"{label_field}.{list_field}.bounding_box"))
+    results = dataset.aggregate(aggregations)
+    return results[0], (results[1] if with_boxes else None)
+
+
+def compute_class_statistics(sample_labels, sample_boxes=None, classes=None):
+    """
+    Compute per-class statistics from per-sample label lists.
+
+    Args:
+        sample_labels: One list of label strings per sample (None = no labels)
+        sample_boxes: Optional matching lists of [x, y, w, h] relative boxes
+        classes: Classes for the co-occurrence matrix and box-size histograms
+            (default: every label found)
+
+    Returns:
+        Dict with 'num_samples', 'num_labeled_samples' (samples with at least one
+        label), 'instance_counts' and 'image_counts' (label -> count,
+        for every label), 'classes', 'cooccurrence' (images containing both classes,
+        len(classes) x len(classes)), 'size_bins' and 'size_hist' (class -> counts).
+    """
+    lengths = np.array([len(labels) if labels else 0 for labels in sample_labels], dtype=np.int64)
+    flat_labels = [label for labels in sample_labels if labels for label in labels]
+    sample_idx = np.repeat(np.arange(len(lengths)), lengths)
+
+    names, codes = np.unique(np.array(flat_labels, dtype=str), return_inverse=True)
+    names = names.tolist()
+    instance_counts = np.bincount(codes, minlength=len(names))
+
+    # Image counts: number of distinct (sample, label) pairs per label
+    presence = np.zeros((len(lengths), len(names)), dtype=bool)
+    presence[sample_idx, codes] = True
+    image_counts = presence.sum(axis=0)
+
+    if classes is None:
+        classes = names
+    col = {name: i for i, name in enumerate(names)}
+    class_presence = np.zeros((len(lengths), len(classes)), dtype=np.int64)
+    for j, name in enumerate(classes):
+        if name in col:
+            class_presence[:, j] = presence[:, col[name]]
+    cooccurrence = class_presence.T @ class_presence
+
+    size_hist = {}
+    if sample_boxes is not None:
+        flat_boxes = [box for boxes in sample_boxes if boxes for box in boxes]
+        boxes = np.array(flat_boxes, dtype=np.float64).reshape(-1, 4)
+        sizes = np.sqrt(np.clip(boxes[:, 2] * boxes[:, 3], 0, None))
+        for name in classes:
+            mask = codes == col[name] if name in col else np.zeros(len(codes), dtype=bool)
+            size_hist[name] = np.histogram(sizes[mask], bins=SIZE_BINS)[0].tolist()
+
+    return {
+        'num_samples': len(lengths),
+        'num_labeled_samples': int(np.count_nonzero(lengths)),
+        'instance_counts': dict(zip(names, instance_counts.tolist())),
+        'image_counts': dict(zip(names, image_counts.tolist())),
+        'classes': list(classes),
+        'cooccurrence': cooccurrence.tolist(),
+        'size_bins': SIZE_BINS.tolist(),
+        'size_hist': size_hist,
+    }
+
+
+def dataset_class_statistics(dataset, label_field, list_field="detections", with_boxes=True, classes=None,
+                             report=None):
+    """
+    Pull a label field in one pass and compute compute_class_statistics on it.
+
+    With a run_report.RunReport, the aggregation and the NumPy statistics are
+    recorded as the stages 'aggregation[<field>]' and 'statistics[<field>]'.
+    """
+    with stage(report, f"aggregation[{label_field}]") as record:
+        sample_labels, sample_boxes = pull_labels(dataset, label_field, list_field, with_boxes)
+        record['items'] = len(sample_labels)
+    with stage(report, f"statistics[{label_field}]") as record:
+        stats = compute_class_statistics(sample_labels, sample_boxes, classes=classes)
+        record['items'] = sum(stats['instance_counts'].values())
+    return stats
+
+
+def format_cooccurrence(stats):
+    """Render the co-occurrence matrix as text lines."""
+    classes = stats['classes']
+    width = max([len(name) for name in classes] + [8])
+    lines = [" " * (width + 2) + "".join(f"{name:>{width + 2}s}" for name in classes)]
+    for name, row in zip(classes, stats['cooccurrence']):
+        lines.append(f"  {name:{width}s}" + "".join(f"{count:>{width + 2}d}" for count in row))
+    return lines
+
+
+def format_size_hist(stats):
+    """Render the box-size histograms as text lines."""
+    bins = stats['size_bins']
+    labels = [f"{lo:.2f}-{min(hi, 1.0):.2f}" for lo, hi in zip(bins[:-1], bins[1:])]
+    lines = ["  sqrt(relative area) bins: " + ", ".join(labels)]
+    for name, counts in stats['size_hist'].items():
+        lines.append(f"  {name:20s}: " + " ".join(f"{count:6d}" for count in counts))
+    return lines
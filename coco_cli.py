@@ -0,0 +1,77 @@
+"""
+Single entry point for the project's scripts.
+
+    python coco_cli.py filter download --split train2017 --min-area 0.001
+    python coco_cli.py filter dedup --input ./coco_filtered --split train2017
+    python coco_cli.py convert seg --split val2017 --processes 8
+    python coco_cli.py convert pose --split val2017
+    python coco_cli.py analyze labels coco=coco_filtered/labels/train2017 huawei=huawei/labels
+    python coco_cli.py analyze zoo --split validation
+    python coco_cli.py export pack --input ./coco_filtered --split train2017
+    python coco_cli.py export resize --input ./coco_filtered --imgsz 640
+
+Every tool stays a standalone script as well; this module only maps
+'<command> <tool>' to the script's main(). Scripts are imported only when
+their tool is run, so commands that work on plain files (label statistics,
+packing, resizing, --help) never import fiftyone or pycocotools and never
+start the FiftyOne database service.
+"""
+
+import sys
+import argparse
+import importlib
+
+
+# command -> tool -> (module, help)
+COMMANDS = {
+    'filter': {
+        'download': ('download_coco_filtered', 'Filter COCO by class and download images + YOLO labels'),
+        'dedup': ('image_dedup', 'Find (and remove) near-duplicate images in a downloaded split'),
+    },
+    'convert': {
+        'seg': ('yolo_seg', 'Export YOLO-segmentation labels from COCO polygons and masks'),
+        'pose': ('yolo_pose', 'Export YOLO-pose labels from COCO person keypoints'),
+    },
+    'analyze': {
+        'labels': ('label_scan', 'Class distribution of YOLO label directories (no FiftyOne)'),
+        'local': ('load_coco_fiftyone', 'Count target labels in a local FiftyOne dataset export'),
+        'zoo': ('load_coco_full_fiftyone', 'Per-class detection statistics from the FiftyOne zoo'),
+        'tasks': ('load_coco_all_tasks', 'Detection, segmentation and keypoint statistics from the zoo'),
+    },
+    'export': {
+        'pack': ('pack_shards', 'Pack images + labels into tar (WebDataset) shards'),
+        'resize': ('resize_cache', 'Build a pre-resized training-resolution image cache'),
+    },
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="coco_cli.py",
+        description="Filter, convert, analyze and export the COCO balancing dataset",
+        epilog="Run '<command> <tool> --help' for the options of a tool.",
+    )
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+    for command, tools in COMMANDS.items():
+        command_parser = commands.add_parser(
+            command, help=", ".join(tools), description=f"'{command}' tools"
+        )
+        tool_parsers = command_parser.add_subparsers(dest='tool', metavar='tool', required=True)
+        for tool, (_, help_text) in tools.items():
+            # Options are parsed by the tool itself, so its own --help is shown
+            tool_parsers.add_parser(tool, help=help_text, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Only '<command> <tool>' is parsed here; everything after it belongs to the tool
+    head, rest = argv[:2], argv[2:]
+    args = build_parser().parse_args(head)
+    module_name, _ = COMMANDS[args.command][args.tool]
+    module = importlib.import_module(module_name)
+    return module.main(rest, prog=f"coco_cli.py {args.command} {args.tool}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Streaming COCO annotation loader.
+
+pycocotools.coco.COCO reads the whole annotation JSON into memory and indexes
+every category. StreamingCOCO instead walks the file incrementally, decoding
+one array element at a time, and keeps only the images and annotations that
+belong to the requested classes. It exposes the small part of the COCO API
+used by download_coco_filtered.py (getCatIds, loadCats, getImgIds, loadImgs,
+getAnnIds, loadAnns and the anns/imgs/cats dicts).
+"""
+
+import re
+import json
+import codecs
+from collections import defaultdict
+from pathlib import Path
+
+
+_WHITESPACE = re.compile(r'\s*')
+_TRAILER = re.compile(r'\s*\}\s*$')
+
+# Annotation fields needed for bounding-box export; everything else
+# (notably the large 'segmentation' polygons) is dropped while streaming
+DETECTION_FIELDS = ('id', 'image_id', 'category_id', 'bbox', 'area', 'iscrowd')
+
+
+class _JSONReader:
+    """Incremental reader that decodes one JSON value at a time from a file."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Append the next chunk to the buffer, dropping consumed text. Returns False at EOF."""
+        if self.eof:
+            return False
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + self.decoder.decode(data, final=not data)
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at EOF)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        """Consume the next non-whitespace character, which must be char."""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed annotation JSON: expected {char!r}, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.json.raw_decode(self.buf, self.pos)
+                # A value ending exactly at the buffer end may be a truncated number
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def walk_top_level(path, on_element, chunk_size=1 << 22):
+    """
+    Stream the top-level object of a JSON file.
+
+    Array values are never materialized: on_element(key, element) is called for
+    each element in turn. Non-array values are decoded and returned.
+
+    Args:
+        path: Path to the JSON file
+        on_element: Callback receiving (top-level key, array element)
+        chunk_size: Number of bytes read from disk at a time
+
+    Returns:
+        Dict of the top-level keys whose values are not arrays
+    """
+    others = {}
+    with open(path, 'rb') as f:
+        reader = _JSONReader(f, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return others
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if reader.peek() == '[':
+                reader.pos += 1
+                if reader.peek() == ']':
+                    reader.pos += 1
+                else:
+                    while True:
+                        on_element(key, reader.value())
+                        sep = reader.peek()
+                        reader.pos += 1
+                        if sep == ']':
+                            break
+                        if sep != ',':
+                            raise ValueError(f"Malformed annotation JSON in '{key}' array")
+            else:
+                others[key] = reader.value()
+            sep = reader.peek()
+            reader.pos += 1
+            if sep == '}':
+                return others
+            if sep != ',':
+                raise ValueError("Malformed annotation JSON: expected ',' or '}'")
+
+
+def _read_tail_categories(path, tail_bytes=1 << 20):
+    """
+    Read the 'categories' array from the end of the file without a full pass.
+
+    COCO instance files store categories as the last top-level key. Returns
+    None if the tail does not look like that, so the caller can fall back to
+    streaming the whole file.
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        size = f.tell()
+        f.seek(max(0, size - tail_bytes))
+        text = f.read().decode('utf-8', errors='replace')
+    idx = text.rfind('"categories"')
+    if idx < 0:
+        return None
+    pos = _WHITESPACE.match(text, idx + len('"categories"')).end()
+    if text[pos:pos + 1] != ':':
+        return None
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    if text[pos:pos + 1] != '[':
+        return None
+    try:
+        categories, end = json.JSONDecoder().raw_decode(text, pos)
+    except json.JSONDecodeError:
+        return None
+    # Only trust it if nothing but the closing brace of the top-level object follows
+    if not _TRAILER.match(text, end):
+        return None
+    return categories
+
+
+def read_categories(path):
+    """Return the 'categories' array of a COCO annotation file."""
+    categories = _read_tail_categories(path)
+    if categories is not None:
+        return categories
+    found = []
+
+    def on_element(key, element):
+        if key == 'categories':
+            found.append(element)
+
+    walk_top_level(path, on_element)
+    return found
+
+
+class StreamingCOCO:
+    """
+    Memory-lean subset of pycocotools.coco.COCO restricted to a few classes.
+
+    Args:
+        annotation_file: Path to a COCO instances_*.json file
+        target_classes: Category names whose images and annotations are kept
+        ann_fields: Annotation keys to keep (default: all keys). Pass
+            DETECTION_FIELDS to drop segmentation polygons while streaming.
+    """
+
+    def __init__(self, annotation_file, target_classes, ann_fields=None):
+        self.annotation_file = str(annotation_file)
+        self.cats = {cat['id']: cat for cat in read_categories(annotation_file)}
+        names = set(target_classes)
+        self.target_cat_ids = {cat_id for cat_id, cat in self.cats.items() if cat['name'] in names}
+
+        self.imgs = {}
+        self.anns = {}
+        self.imgToAnns = defaultdict(list)
+        self.catToImgs = defaultdict(list)
+        all_imgs = {}
+
+        def on_element(key, element):
+            if key == 'images':
+                all_imgs[element['id']] = element
+            elif key == 'annotations' and element['category_id'] in self.target_cat_ids:
+                if ann_fields is not None:
+                    element = {k: element[k] for k in ann_fields if k in element}
+                self.anns[element['id']] = element
+                self.imgToAnns[element['image_id']].append(element)
+                self.catToImgs[element['category_id']].append(element['image_id'])
+
+        self.info = walk_top_level(annotation_file, on_element)
+
+        # Keep only images that have at least one annotation of a target class
+        self.imgs = {img_id: all_imgs[img_id] for img_id in all_imgs if img_id in self.imgToAnns}
+
+    def getCatIds(self, catNms=None):
+        """Return category ids, optionally filtered by name (same semantics as COCO.getCatIds)."""
+        cats = list(self.cats.values())
+        if catNms:
+            cats = [cat for cat in cats if cat['name'] in catNms]
+        return [cat['id'] for cat in cats]
+
+    def loadCats(self, ids):
+        """Return category dicts for an id or list of ids."""
+        ids = ids if isinstance(ids, (list, tuple)) else [ids]
+        return [self.cats[cat_id] for cat_id in ids]
+
+    def getImgIds(self, catIds=None):
+        """
+        Return image ids, optionally restricted to images containing all of catIds.
+
+        Matches pycocotools: with several category ids the result is the
+        intersection of their image sets.
+        """
+        if not catIds:
+            return list(self.imgs.keys())
+        ids = None
+        for cat_id in catIds:
+            cat_imgs = set(self.catToImgs.get(cat_id, []))
+            ids = cat_imgs if ids is None else ids & cat_imgs
+        return list(ids)
+
+    def loadImgs(self, ids):
+        """Return image dicts for an id or list of ids."""
+        ids = ids if isinstance(ids, (list, tuple)) else [ids]
+        return [self.imgs[img_id] for img_id in ids]
+
+    def getAnnIds(self, imgIds=None, catIds=None):
+        """Return annotation ids for the given images and categories."""
+        if imgIds is None:
+            anns = list(self.anns.values())
+        else:
+            img_ids = imgIds if isinstance(imgIds, (list, tuple)) else [imgIds]
+            anns = [ann for img_id in img_ids for ann in self.imgToAnns.get(img_id, [])]
+        if catIds:
+            anns = [ann for ann in anns if ann['category_id'] in catIds]
+        return [ann['id'] for ann in anns]
+
+    def loadAnns(self, ids):
+        """Return annotation dicts for an id or list of ids."""
+        ids = ids if isinstance(ids, (list, tuple)) else [ids]
+        return [self.anns[ann_id] for ann_id in ids]
+
+
+def load_coco(annotation_file, target_classes, loader="coco", ann_fields=DETECTION_FIELDS):
+    """
+    Load a COCO annotation file with the selected loader.
+
+    Args:
+        annotation_file: Path to the annotation JSON
+        target_classes: Class names that will be used downstream
+        loader: 'coco' for pycocotools.coco.COCO, 'stream' for StreamingCOCO
+        ann_fields: Annotation keys StreamingCOCO keeps (add 'segmentation' or
+            'keypoints' for the segmentation/pose exports)
+
+    Returns:
+        An object implementing the COCO lookup API used by the download script
+    """
+    if loader == "stream":
+        return StreamingCOCO(annotation_file, target_classes, ann_fields=ann_fields)
+    from pycocotools.coco import COCO
+    return COCO(str(Path(annotation_file)))
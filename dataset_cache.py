@@ -0,0 +1,86 @@
+"""
+Persistent FiftyOne dataset cache for the analysis scripts.
+
+Instead of deleting and re-importing a dataset on every run, datasets are
+made persistent and named after a key derived from their import parameters
+(source, split, label types, classes). A fingerprint of the source (file
+names, sizes and mtimes of the source directory or zoo download) is stored
+in dataset.info; the dataset is only re-imported when that fingerprint or
+the parameters change.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+
+
+def params_key(params):
+    """Short stable hash of a JSON-serializable parameter dict."""
+    return hashlib.blake2b(json.dumps(params, sort_keys=True).encode(), digest_size=4).hexdigest()
+
+
+def directory_fingerprint(path):
+    """
+    Fingerprint a directory tree from file names, sizes and mtimes.
+
+    Only metadata is read, so this takes milliseconds even for thousands of
+    files. Returns None if the directory does not exist.
+    """
+    root = Path(path)
+    if not root.is_dir():
+        return None
+    h = hashlib.blake2b(digest_size=16)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            st = os.stat(full_path)
+            h.update(f"{os.path.relpath(full_path, root)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def zoo_fingerprint(zoo_name, split):
+    """Fingerprint the downloaded files of a zoo dataset split (None if not downloaded yet)."""
+    import fiftyone.zoo as foz
+
+    try:
+        dataset_dir = foz.find_zoo_dataset(zoo_name, split=split)
+    except ValueError:
+        return None
+    return directory_fingerprint(dataset_dir)
+
+
+def load_or_create_dataset(prefix, params, fingerprint_fn, create_fn):
+    """
+    Return a persistent dataset for params, re-importing only when the source changed.
+
+    Args:
+        prefix: Human-readable dataset name prefix, e.g. 'coco-local'
+        params: Dict of import parameters (source, split, label types, classes);
+            the dataset name is '<prefix>-<hash of params>'
+        fingerprint_fn: Callable returning the current source fingerprint (or None
+            if the source is not available locally yet)
+        create_fn: Callable(name) that imports and returns a new dataset
+
+    Returns:
+        Tuple (dataset, reused)
+    """
+    import fiftyone as fo
+
+    name = f"{prefix}-{params_key(params)}"
+    fingerprint = fingerprint_fn()
+    if name in fo.list_datasets():
+        dataset = fo.load_dataset(name)
+        if fingerprint is not None and dataset.info.get('source_fingerprint') == fingerprint:
+            return dataset, True
+        print(f"Source changed since '{name}' was imported, re-importing...")
+        fo.delete_dataset(name)
+
+    dataset = create_fn(name)
+    dataset.persistent = True
+    dataset.info['import_params'] = params
+    # The source may only exist after create_fn (e.g. a fresh zoo download)
+    dataset.info['source_fingerprint'] = fingerprint_fn()
+    dataset.save()
+    return dataset, False
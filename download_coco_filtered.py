@@ -5,11 +5,21 @@ Converts annotations to YOLO format for dataset balancing.
 
 import os
 import json
-import urllib.request
+import hashlib
 from pathlib import Path
-from pycocotools.coco import COCO
-from tqdm import tqdm
+import shutil
 import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from annotation_filters import active_filters, annotation_mask, describe_filters
+from filtered_index import load_filtered_index
+from image_fetch import ImageFetcher
+from local_mirror import LINK_MODES, link_from_mirror
+from manifest import MANIFEST_NAME, Manifest, file_checksum
+from quota_sampler import image_class_matrix, parse_quota, select_by_quota
+from label_writer import shard_dir_for, write_labels
+from run_report import RunReport
 
 
 def download_coco_annotations(split, output_dir):
@@ -30,7 +40,12 @@ def download_coco_annotations(split, output_dir):
 
 
 def convert_bbox_to_yolo(bbox, img_width, img_height):
-    """Convert COCO bbox [x, y, width, height] to YOLO format [x_center, y_center, width, height] normalized."""
+    """
+    Convert COCO bbox [x, y, width, height] to YOLO format [x_center, y_center, width, height] normalized.
+    
+    Reference for yolo_labels.convert_bboxes_to_yolo, which must produce identical
+    values (checked in tests/test_yolo_labels.py).
+    """
     x, y, w, h = bbox
     x_center = (x + w / 2) / img_width
     y_center = (y + h / 2) / img_height
@@ -39,7 +54,262 @@ def convert_bbox_to_yolo(bbox, img_width, img_height):
     return [x_center, y_center, width, height]
 
 
-def download_filtered_coco(split="val2017", output_dir="./coco_filtered", target_classes=None):
+def apply_quota(index, quota, yolo_to_name, coco_to_yolo):
+    """Restrict the index to the smallest image subset the greedy sampler finds for the quota."""
+    class_cat_ids = sorted(coco_to_yolo)
+    targets = [quota.get(yolo_to_name[coco_to_yolo[cat_id]], 0) for cat_id in class_cat_ids]
+    counts = image_class_matrix(
+        index.images['id'], index.annotations['image_id'], index.annotations['category_id'], class_cat_ids
+    )
+    selected, achieved = select_by_quota(counts, targets)
+    print(f"\nQuota sampling selected {len(selected)} of {len(counts)} images:")
+    for cat_id, target, total in zip(class_cat_ids, targets, achieved.tolist()):
+        name = yolo_to_name[coco_to_yolo[cat_id]]
+        status = "" if total >= target else "  (target not reachable)"
+        print(f"  {name}: {total} instances (target {target}){status}")
+    return index.subset(index.images['id'][np.sort(selected)])
+
+
+def apply_annotation_filters(index, filters):
+    """Drop annotations failing the predicate filters and images left without annotations."""
+    keep = annotation_mask(index.annotations, filters)
+    filtered = index.filter_annotations(keep)
+    print(f"Annotation filters ({describe_filters(filters)}): kept {int(keep.sum())} of {len(keep)} "
+          f"annotations, {len(filtered.img_ids)} of {len(index.img_ids)} images")
+    return filtered
+
+
+def read_exclude_list(path):
+    """Image file names listed one per line (e.g. image_dedup.py's <split>_duplicates.txt), as a set."""
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def exclude_list_digest(exclude_images):
+    """Digest of an exclude list, so merge_shards can check every shard excluded the same images."""
+    if not exclude_images:
+        return None
+    return hashlib.blake2b("\n".join(sorted(exclude_images)).encode(), digest_size=16).hexdigest()
+
+
+def shard_image_ids(img_ids, num_shards, shard_index):
+    """Image ids of one node shard: every id with id % num_shards == shard_index."""
+    img_ids = np.asarray(img_ids, dtype=np.int64)
+    return img_ids[img_ids % num_shards == shard_index]
+
+
+def shard_name(split, num_shards, shard_index):
+    """File name stem identifying one node shard, e.g. 'train2017-shard-00001-of-00004'."""
+    return f"{split}-shard-{shard_index:05d}-of-{num_shards:05d}"
+
+
+def shard_stats_path(output_dir, split, num_shards, shard_index):
+    """Partial statistics file a node shard writes for the merge step."""
+    return Path(output_dir) / "shard_stats" / f"{shard_name(split, num_shards, shard_index)}.json"
+
+
+def deselected_dir_for(output_dir, split):
+    """Directory that receives images and labels a later, narrower selection left out."""
+    return Path(output_dir) / "deselected" / split
+
+
+def prune_deselected(output_path, split, selected_files):
+    """
+    Move images and label files that are not part of the current selection aside.
+    
+    Files from an earlier run with more classes, looser filters, a larger
+    quota or a shorter exclude list would otherwise stay in images/ and labels/
+    and end up in training. They are moved to <output>/deselected/<split>/,
+    from where a later run that selects them again restores them.
+    
+    Args:
+        output_path: Dataset output directory
+        split: 'val2017' or 'train2017'
+        selected_files: Set of image file names of the current selection
+    
+    Returns:
+        Number of images moved aside
+    """
+    output_path = Path(output_path)
+    deselected_dir = deselected_dir_for(output_path, split)
+    selected_stems = {Path(name).stem for name in selected_files}
+    moved = 0
+    for kind, keep in (('images', lambda name: name in selected_files),
+                       ('labels', lambda name: Path(name).stem in selected_stems)):
+        src_dir = output_path / kind / split
+        if not src_dir.is_dir():
+            continue
+        for entry in os.scandir(src_dir):
+            if entry.name.startswith('.') or not entry.is_file() or keep(entry.name):
+                continue
+            dest = deselected_dir / kind / entry.name
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(entry.path, dest)
+            moved += kind == 'images'
+    return moved
+
+
+def restore_deselected(output_path, split, file_name):
+    """Move an image and its label file back from <output>/deselected/<split>/; True if the image was there."""
+    deselected_dir = deselected_dir_for(output_path, split)
+    restored = False
+    for kind, name in (('images', file_name), ('labels', Path(file_name).stem + '.txt')):
+        src = deselected_dir / kind / name
+        if src.exists():
+            os.replace(src, Path(output_path) / kind / split / name)
+            restored = restored or kind == 'images'
+    return restored
+
+
+def write_image_list(output_path, split, selected_files):
+    """Write <split>.txt with the selected images present on disk; returns the number listed."""
+    output_path = Path(output_path)
+    present = {entry.name for entry in os.scandir(output_path / "images" / split)}
+    image_list = sorted(present & set(selected_files))
+    with open(output_path / f"{split}.txt", 'w') as f:
+        f.write("".join(f"./images/{split}/{name}\n" for name in image_list))
+    return len(image_list)
+
+
+def finalize_dataset(output_path, split, class_names, summary, label_shards=0,
+                     selected_files=None, image_list=False):
+    """
+    Write classes.txt and dataset.yaml and print the download summary.
+    
+    Single-node runs and the multi-node merge both end here, so their
+    outputs are identical. If the selection is given, files left over from
+    earlier selections are moved aside, so images/<split> holds exactly the
+    selected images.
+    
+    Args:
+        output_path: Dataset output directory
+        split: 'val2017' or 'train2017'
+        class_names: Class names in YOLO class id order (classes.txt and dataset.yaml)
+        summary: Dict with 'total_images', 'downloaded', 'skipped', 'failed', 'processed',
+            'labels_written', 'labels_unchanged', 'linked' and 'annotation_counts'
+        label_shards: Number of label shard files (0 = one .txt per image)
+        selected_files: Optional set of image file names of the current selection
+        image_list: Also write <split>.txt listing the selected images (needs selected_files)
+    """
+    output_path = Path(output_path)
+    images_dir = output_path / "images" / split
+    labels_dir = output_path / "labels" / split
+    if selected_files is not None:
+        moved = prune_deselected(output_path, split, selected_files)
+        if moved:
+            print(f"\nMoved {moved} images no longer selected to {deselected_dir_for(output_path, split)}")
+    listed = None
+    if image_list and selected_files is not None:
+        listed = write_image_list(output_path, split, selected_files)
+    
+    # Save class names for reference
+    classes_file = output_path / "classes.txt"
+    with open(classes_file, 'w') as f:
+        for name in class_names:
+            f.write(f"{name}\n")
+    print(f"\nClass names saved to {classes_file}")
+    
+    # Print summary
+    print(f"\n{'='*50}")
+    print(f"Download Summary")
+    print(f"{'='*50}")
+    print(f"Total images: {summary['total_images']}")
+    print(f"{'Linked' if summary['linked'] else 'Downloaded'}: {summary['downloaded']}")
+    print(f"Skipped (already exist): {summary['skipped']}")
+    print(f"Failed: {summary['failed']}")
+    print(f"Processed this run (new, changed or failed): {summary['processed']}")
+    print(f"Label files written: {summary['labels_written']} (unchanged: {summary['labels_unchanged']})")
+    print(f"\nAnnotation counts:")
+    for class_name, count in summary['annotation_counts'].items():
+        print(f"  {class_name}: {count}")
+    print(f"\nData saved to: {output_path}")
+    print(f"  Images: {images_dir}")
+    print(f"  Labels: {shard_dir_for(labels_dir) if label_shards else labels_dir}")
+    print(f"  Classes: {classes_file}")
+    if listed is not None:
+        print(f"  Image list: {output_path / f'{split}.txt'} ({listed} images)")
+    
+    # Create dataset.yaml for YOLO
+    yaml_content = f"""# COCO Filtered Dataset
+path: {output_path.absolute()}
+train: images/{split}
+val: images/{split}
+
+nc: {len(class_names)}
+names: {class_names}
+"""
+    
+    yaml_file = output_path / "dataset.yaml"
+    with open(yaml_file, 'w') as f:
+        f.write(yaml_content)
+    print(f"\nYOLO dataset config saved to: {yaml_file}")
+
+
+def merge_shards(output_dir, split, num_shards, image_list=False):
+    """
+    Combine the partial statistics of every node shard and finalize the dataset.
+    
+    Args:
+        output_dir: Dataset output directory shared by all shards
+        split: 'val2017' or 'train2017'
+        num_shards: Number of shards the job was split into
+        image_list: Also write <split>.txt listing the selected images
+    
+    Returns:
+        True if all shards were found and merged
+    """
+    partials = []
+    missing = []
+    for shard_index in range(num_shards):
+        path = shard_stats_path(output_dir, split, num_shards, shard_index)
+        if not path.exists():
+            missing.append(shard_index)
+            continue
+        with open(path) as f:
+            partials.append(json.load(f))
+    if missing:
+        print(f"\nERROR: No statistics for shard(s) {missing} of {num_shards}; "
+              f"run them before merging")
+        return False
+    
+    first = partials[0]
+    for partial in partials[1:]:
+        for key in ('target_classes', 'match', 'class_names', 'linked', 'filters', 'quota', 'exclude_images'):
+            if partial.get(key) != first.get(key):
+                print(f"\nERROR: Shard {partial['shard_index']} was run with a different '{key}' "
+                      f"({partial.get(key)} vs {first.get(key)})")
+                return False
+    
+    summary = {key: sum(partial['summary'][key] for partial in partials)
+               for key in ('total_images', 'downloaded', 'skipped', 'failed', 'processed',
+                           'labels_written', 'labels_unchanged')}
+    summary['linked'] = first['linked']
+    summary['annotation_counts'] = {
+        name: sum(partial['summary']['annotation_counts'][name] for partial in partials)
+        for name in first['summary']['annotation_counts']
+    }
+    
+    # The selection is the union of every shard's slice
+    selected_files = set()
+    for partial in partials:
+        name = f"manifest-{shard_name(split, num_shards, partial['shard_index'])}.sqlite"
+        with Manifest(output_dir, name=name) as manifest:
+            selection = manifest.selection(split)
+        if partial['summary']['total_images'] and not selection:
+            print(f"\nERROR: Shard {partial['shard_index']} recorded no selection; run it again before merging")
+            return False
+        selected_files.update(selection.values())
+    print(f"Merged statistics of {num_shards} shards")
+    finalize_dataset(output_dir, split, first['class_names'], summary,
+                     selected_files=selected_files, image_list=image_list)
+    return True
+
+
+def download_filtered_coco(split="val2017", output_dir="./coco_filtered", target_classes=None,
+                           workers=8, retries=3, loader="coco", use_cache=True,
+                           processes=1, label_shards=0, quota=None,
+                           source_images=None, link_mode="symlink", num_shards=1, shard_index=0,
+                           filters=None, exclude_images=None, match=None, image_list=False):
     """
     Download COCO images filtered by specific classes and convert to YOLO format.
     
@@ -47,9 +317,35 @@ def download_filtered_coco(split="val2017", output_dir="./coco_filtered", target
         split: 'val2017' or 'train2017'
         output_dir: Directory to save filtered dataset
         target_classes: List of class names to filter (default: ['car', 'person', 'bicycle'])
+        workers: Number of concurrent download threads
+        retries: Number of retries per image before giving up
+        loader: Annotation loader, 'coco' (pycocotools) or 'stream' (StreamingCOCO)
+        use_cache: Reuse the memory-mapped filtered index in <output_dir>/index_cache
+        processes: Number of worker processes for label conversion and writing
+        label_shards: If > 0, write labels into this many shard files (plus an index)
+            under labels/<split>_shards instead of one .txt per image
+        quota: Optional {class name: instance target}; if given, only the smallest
+            image subset found that meets every target is downloaded
+        source_images: Optional local COCO tree (<dir>/<split>/ or <dir>/); selected
+            images are linked from there instead of downloaded, without network access
+        link_mode: 'symlink', 'hardlink' or 'reflink' (used with source_images)
+        num_shards: Split the selected images across this many nodes (see merge_shards)
+        shard_index: Which shard this run processes (0 <= shard_index < num_shards); a
+            sharded run writes partial statistics instead of classes.txt/dataset.yaml
+        filters: Optional annotation predicate filters (see annotation_filters.active_filters);
+            failing annotations are left out of the labels and images without any
+            remaining annotation are not downloaded
+        exclude_images: Optional set of image file names never to select, e.g. the
+            near-duplicates listed by image_dedup.py
+        match: 'all' selects images containing every target class, 'any' images
+            containing at least one; default 'any' with a quota (the sampler
+            picks from the union) and 'all' otherwise
+        image_list: Also write <split>.txt listing the selected images
     """
     if target_classes is None:
         target_classes = ['car', 'person', 'bicycle']
+    if match is None:
+        match = 'any' if quota is not None else 'all'
     
     output_path = Path(output_dir)
     images_dir = output_path / "images" / split
@@ -71,116 +367,229 @@ def download_filtered_coco(split="val2017", output_dir="./coco_filtered", target
         print(f"3. Move instances_{split}.json to {output_dir}/annotations/")
         return
     
+    # Per-stage timings, throughput and memory, saved as run_report.json
+    report = RunReport("download_coco_filtered", {
+        'split': split, 'classes': target_classes, 'workers': workers, 'loader': loader,
+        'processes': processes, 'label_shards': label_shards, 'quota': quota,
+        'source_images': source_images, 'num_shards': num_shards, 'shard_index': shard_index,
+        'filters': filters, 'excluded_images': len(exclude_images or ()), 'match': match,
+    })
+    
     print(f"Loading COCO annotations from {annotation_file}...")
-    coco = COCO(annotation_file)
+    index, from_cache = load_filtered_index(
+        annotation_file, output_dir, split, target_classes, loader=loader, use_cache=use_cache,
+        report=report, match=match
+    )
+    if from_cache:
+        print("Using cached filtered index (annotation file and classes unchanged)")
     
     # Get category IDs for target classes
-    cat_ids = coco.getCatIds(catNms=target_classes)
+    cat_ids = index.cat_ids
     print(f"\nTarget classes and their IDs:")
-    for cat_id in cat_ids:
-        cat_info = coco.loadCats(cat_id)[0]
-        print(f"  {cat_info['name']}: {cat_id}")
+    for cat_info in index.categories:
+        print(f"  {cat_info['name']}: {cat_info['id']}")
     
     # Create class mapping for YOLO (0-indexed)
+    cat_names = {cat['id']: cat['name'] for cat in index.categories}
     coco_to_yolo = {cat_id: idx for idx, cat_id in enumerate(sorted(cat_ids))}
-    yolo_to_name = {idx: coco.loadCats(cat_id)[0]['name'] for cat_id, idx in coco_to_yolo.items()}
-    
-    # Save class names for reference
-    classes_file = output_path / "classes.txt"
-    with open(classes_file, 'w') as f:
-        for idx in sorted(yolo_to_name.keys()):
-            f.write(f"{yolo_to_name[idx]}\n")
-    print(f"\nClass names saved to {classes_file}")
+    yolo_to_name = {idx: cat_names[cat_id] for cat_id, idx in coco_to_yolo.items()}
     
     # Get all images containing target classes
-    img_ids = coco.getImgIds(catIds=cat_ids)
-    print(f"\nFound {len(img_ids)} images containing target classes")
+    print(f"\nFound {len(index.img_ids)} images containing {'any' if match == 'any' else 'all'} "
+          f"of the target classes")
+    
+    # Drop crowd regions, tiny boxes, ... before selecting and fetching images
+    if filters:
+        with report.stage('annotation_filters', items=len(index.annotations['id'])):
+            index = apply_annotation_filters(index, filters)
+    
+    if exclude_images:
+        keep = ~np.isin(index.images['file_name'], list(exclude_images))
+        print(f"Excluding {int((~keep).sum())} images from the exclude list")
+        index = index.subset(index.images['id'][keep])
+    
+    # Cap the balancing patch to per-class instance targets before anything is downloaded
+    if quota is not None:
+        with report.stage('quota_selection') as record:
+            index = apply_quota(index, quota, yolo_to_name, coco_to_yolo)
+            record['items'] = len(index.img_ids)
+    
+    # Every node computes the same selection and keeps its own slice of it
+    if num_shards > 1:
+        index = index.subset(shard_image_ids(index.img_ids, num_shards, shard_index))
+        print(f"Shard {shard_index} of {num_shards}: {len(index.img_ids)} images")
+    
+    img_ids = index.img_ids
+    file_names = index.column('file_name')
     
     # Statistics
     stats = {name: 0 for name in target_classes}
     downloaded_count = 0
     skipped_count = 0
     
-    # Download images and create YOLO annotations
-    print(f"\nDownloading images and creating YOLO annotations...")
-    for img_id in tqdm(img_ids, desc="Processing images"):
-        img_info = coco.loadImgs(img_id)[0]
-        img_filename = img_info['file_name']
-        img_path = images_dir / img_filename
-        
-        # Skip if image already exists
-        if img_path.exists():
-            skipped_count += 1
-        else:
+    # The manifest records what earlier runs finished, so only new, changed
+    # or failed images are processed again
+    sharded = num_shards > 1
+    manifest_name = f"manifest-{shard_name(split, num_shards, shard_index)}.sqlite" if sharded else MANIFEST_NAME
+    manifest = Manifest(output_path, name=manifest_name)
+    run_id = manifest.start_run(split, target_classes)
+    records = manifest.records(split)
+    
+    # Download missing images concurrently
+    jobs = []
+    unverified = []
+    with report.stage('image_check', items=len(img_ids)):
+        for img_id, url in index.column('coco_url').items():
+            img_path = images_dir / file_names[img_id]
             try:
-                # Download image
-                url = img_info['coco_url']
-                urllib.request.urlretrieve(url, str(img_path))
-                downloaded_count += 1
-            except Exception as e:
-                print(f"\nError downloading {img_filename}: {e}")
-                continue
-        
-        # Get annotations for this image
-        ann_ids = coco.getAnnIds(imgIds=img_id, catIds=cat_ids)
-        anns = coco.loadAnns(ann_ids)
-        
-        # Convert to YOLO format
-        label_filename = img_filename.replace('.jpg', '.txt')
-        label_path = labels_dir / label_filename
+                st = img_path.stat()
+            except FileNotFoundError:
+                # Selected again after an earlier run moved it aside
+                if not restore_deselected(output_path, split, file_names[img_id]):
+                    jobs.append((img_id, url, img_path))
+                    continue
+                st = img_path.stat()
+            skipped_count += 1
+            record = records.get(img_id)
+            if (record is None or record['status'] != 'ok' or record['size'] != st.st_size
+                    or record['mtime_ns'] != st.st_mtime_ns):
+                unverified.append((img_id, img_path))
+    
+    if source_images is not None:
+        # Link from the local mirror; metadata only, so nothing is read or hashed
+        print(f"\nLinking {len(jobs)} images from {source_images} ({link_mode})...")
+        with report.stage('link', mode=link_mode) as record:
+            linked, missing, failed = link_from_mirror(
+                [(img_id, file_names[img_id], img_path) for img_id, _, img_path in jobs],
+                source_images, split, mode=link_mode, workers=workers
+            )
+            record['items'] = len(linked)
+        downloaded_count = len(linked)
+        for img_id, error in failed.items():
+            print(f"\nError linking {file_names[img_id]}: {error}")
+        if missing:
+            missing_file = output_path / (f"missing_{shard_name(split, num_shards, shard_index)}.txt"
+                                          if sharded else f"missing_{split}.txt")
+            with open(missing_file, 'w') as f:
+                for _, file_name in missing:
+                    f.write(f"{file_name}\n")
+            print(f"\n{len(missing)} images not found in {source_images}, e.g. "
+                  f"{', '.join(file_name for _, file_name in missing[:5])}")
+            print(f"Full list saved to {missing_file}")
+            failed.update((img_id, "not found in source images") for img_id, _ in missing)
+        checksums = dict.fromkeys(linked)
+        checksums.update((img_id, None) for img_id, _ in unverified)
+    else:
+        print(f"\nDownloading {len(jobs)} images with {workers} workers...")
+        fetcher = ImageFetcher(workers=workers, retries=retries)
+        with report.stage('download', workers=workers) as record:
+            fetched, failed = fetcher.fetch_all(jobs, desc="Downloading images")
+            record['items'] = len(fetched)
+            record['bytes'] = sum(nbytes for nbytes, _ in fetched.values())
+        report.add_outliers('slowest_downloads', {file_names[img_id]: round(seconds, 3)
+                                                  for img_id, seconds in fetcher.durations.items()},
+                            unit='seconds')
+        downloaded_count = len(fetched)
+        for img_id, error in failed.items():
+            print(f"\nError downloading {file_names[img_id]}: {error}")
         
-        with open(label_path, 'w') as f:
-            for ann in anns:
-                if ann['category_id'] in cat_ids:
-                    # Update statistics
-                    cat_name = coco.loadCats(ann['category_id'])[0]['name']
-                    stats[cat_name] += 1
-                    
-                    # Convert bbox to YOLO format
-                    bbox = ann['bbox']
-                    yolo_bbox = convert_bbox_to_yolo(
-                        bbox, 
-                        img_info['width'], 
-                        img_info['height']
-                    )
-                    
-                    # YOLO format: class_id x_center y_center width height
-                    yolo_class_id = coco_to_yolo[ann['category_id']]
-                    f.write(f"{yolo_class_id} {' '.join(map(str, yolo_bbox))}\n")
+        # Checksum existing images the manifest does not know about (or that changed on disk)
+        checksums = {img_id: checksum for img_id, (_, checksum) in fetched.items()}
+        if unverified:
+            with report.stage('checksum', items=len(unverified)), ThreadPoolExecutor(max_workers=workers) as pool:
+                hashed = pool.map(file_checksum, [img_path for _, img_path in unverified])
+                checksums.update(zip([img_id for img_id, _ in unverified], hashed))
+    image_entries = []
+    for img_id, checksum in checksums.items():
+        st = (images_dir / file_names[img_id]).stat()
+        image_entries.append({'image_id': img_id, 'file_name': file_names[img_id], 'status': 'ok',
+                              'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'checksum': checksum})
+    for img_id, error in failed.items():
+        image_entries.append({'image_id': img_id, 'file_name': file_names[img_id],
+                              'status': 'failed', 'error': error})
+    manifest.record_images(split, image_entries)
     
-    # Print summary
-    print(f"\n{'='*50}")
-    print(f"Download Summary")
-    print(f"{'='*50}")
-    print(f"Total images: {len(img_ids)}")
-    print(f"Downloaded: {downloaded_count}")
-    print(f"Skipped (already exist): {skipped_count}")
-    print(f"\nAnnotation counts:")
-    for class_name, count in stats.items():
-        print(f"  {class_name}: {count}")
-    print(f"\nData saved to: {output_path}")
-    print(f"  Images: {images_dir}")
-    print(f"  Labels: {labels_dir}")
-    print(f"  Classes: {classes_file}")
+    # Create YOLO annotations for every image that is available locally.
+    # Workers convert their chunk of images in one vectorized pass each and
+    # only rewrite label files whose content changed since the last run.
+    print(f"\nCreating YOLO annotations...")
+    label_img_ids = [img_id for img_id in img_ids if img_id not in failed]
+    previous_hashes = {img_id: record['label_hash'] for img_id, record in records.items()
+                       if record['label_hash'] is not None}
+    with report.stage('label_write', processes=processes) as record:
+        class_counts, label_hashes, label_bytes = write_labels(
+            index.annotations, coco_to_yolo, label_img_ids, file_names, labels_dir,
+            previous_hashes=previous_hashes, processes=processes, shards=label_shards
+        )
+        record['items'] = len(label_img_ids)
+        record['bytes'] = sum(label_bytes.values())
+        record['written'] = len(label_hashes)
+    report.add_outliers('largest_label_files', {file_names[img_id].replace('.jpg', '.txt'): nbytes
+                                                for img_id, nbytes in label_bytes.items()},
+                        unit='bytes')
+    if not label_shards:
+        # Shards are rewritten whole, so only per-file label hashes are tracked
+        manifest.record_labels(split, label_hashes)
+    for idx, count in enumerate(class_counts.tolist()):
+        stats[yolo_to_name[idx]] += count
     
-    # Create dataset.yaml for YOLO
-    yaml_content = f"""# COCO Filtered Dataset
-path: {output_path.absolute()}
-train: images/{split}
-val: images/{split}
-
-nc: {len(target_classes)}
-names: {target_classes}
-"""
+    processed = {img_id for img_id, _, _ in jobs} | {img_id for img_id, _ in unverified} | set(label_hashes)
+    manifest.record_selection(split, {img_id: file_names[img_id] for img_id in img_ids})
+    manifest.finish_run(run_id, len(img_ids), downloaded_count, len(failed), len(label_hashes))
+    manifest.close()
     
-    yaml_file = output_path / "dataset.yaml"
-    with open(yaml_file, 'w') as f:
-        f.write(yaml_content)
-    print(f"\nYOLO dataset config saved to: {yaml_file}")
+    summary = {
+        'total_images': len(img_ids),
+        'downloaded': downloaded_count,
+        'skipped': skipped_count,
+        'failed': len(failed),
+        'processed': len(processed),
+        'labels_written': len(label_hashes),
+        'labels_unchanged': len(label_img_ids) - len(label_hashes),
+        'linked': source_images is not None,
+        'annotation_counts': stats,
+    }
+    for key, value in summary.items():
+        report.count(key, value)
+    class_names = [yolo_to_name[idx] for idx in sorted(yolo_to_name)]
+    if not sharded:
+        finalize_dataset(output_path, split, class_names, summary, label_shards,
+                         selected_files={file_names[img_id] for img_id in img_ids}, image_list=image_list)
+        report_file = report.save(output_path / "run_report.json")
+        print(f"Run report saved to: {report_file}")
+        return
+    
+    # Partial statistics for merge_shards
+    stats_file = shard_stats_path(output_path, split, num_shards, shard_index)
+    stats_file.parent.mkdir(parents=True, exist_ok=True)
+    partial = {
+        'split': split,
+        'num_shards': num_shards,
+        'shard_index': shard_index,
+        'target_classes': target_classes,
+        'match': match,
+        'class_names': class_names,
+        'linked': summary['linked'],
+        'filters': filters or {},
+        'quota': quota,
+        'exclude_images': exclude_list_digest(exclude_images),
+        'summary': summary,
+    }
+    tmp_file = stats_file.with_suffix(".json.tmp")
+    with open(tmp_file, 'w') as f:
+        json.dump(partial, f, indent=2)
+    os.replace(tmp_file, stats_file)
+    print(f"\nShard {shard_index} of {num_shards} done: {len(img_ids)} images, "
+          f"{len(failed)} failed, {len(label_hashes)} label files written")
+    print(f"Partial statistics saved to {stats_file}")
+    report_file = report.save(output_path / f"run_report-{shard_name(split, num_shards, shard_index)}.json")
+    print(f"Run report saved to {report_file}")
+    print(f"Run with --num-shards {num_shards} --merge once every shard has finished")
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Download filtered COCO dataset")
+def main(argv=None, prog=None):
+    """Command-line entry point; argv and prog are set when run through coco_cli.py."""
+    parser = argparse.ArgumentParser(prog=prog, description="Download filtered COCO dataset")
     parser.add_argument('--split', type=str, default='val2017', 
                         choices=['val2017', 'train2017'],
                         help='Dataset split to download')
@@ -188,12 +597,108 @@ if __name__ == "__main__":
                         help='Output directory for filtered dataset')
     parser.add_argument('--classes', nargs='+', default=['car', 'person', 'bicycle'],
                         help='Classes to filter')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Number of concurrent download threads')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='Retries per image (with exponential backoff) before giving up')
+    parser.add_argument('--loader', type=str, default='coco', choices=['coco', 'stream'],
+                        help="Annotation loader: 'coco' builds the full pycocotools index, "
+                             "'stream' keeps only the target classes (much lower memory)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not read or write the filtered index cache')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Worker processes for label conversion and writing')
+    parser.add_argument('--label-shards', type=int, default=0,
+                        help='Write labels into N shard files with an index instead of one .txt per image')
+    parser.add_argument('--quota', nargs='+', default=None, metavar='CLASS=N',
+                        help='Per-class instance targets, e.g. bicycle=3000 person=5000 car=0; '
+                             'only the smallest image subset meeting them is downloaded')
+    parser.add_argument('--match', type=str, default=None, choices=['all', 'any'],
+                        help='Select images containing all target classes or any of them '
+                             '(default: any with --quota, all otherwise)')
+    parser.add_argument('--source-images', type=str, default=None,
+                        help='Existing local COCO tree to link images from instead of downloading '
+                             '(looks in <dir>/<split>/ first, then <dir>/)')
+    parser.add_argument('--link-mode', type=str, default='symlink', choices=LINK_MODES,
+                        help='How images are taken from --source-images: symlink, hardlink '
+                             '(copies across filesystems) or reflink (copy-on-write clone, else copy)')
+    parser.add_argument('--num-shards', type=int, default=1,
+                        help='Split the selected images across N nodes (image id modulo N)')
+    parser.add_argument('--shard-index', type=int, default=0,
+                        help='Shard processed by this node, 0 <= index < --num-shards')
+    parser.add_argument('--merge', action='store_true',
+                        help='Combine the partial statistics of all --num-shards shards and write '
+                             'classes.txt, dataset.yaml and the summary')
+    parser.add_argument('--min-area', type=float, default=None,
+                        help='Drop boxes smaller than this fraction of the image area (e.g. 0.001)')
+    parser.add_argument('--max-area', type=float, default=None,
+                        help='Drop boxes larger than this fraction of the image area')
+    parser.add_argument('--min-size', type=float, default=None,
+                        help='Drop boxes whose shorter side is below this many pixels')
+    parser.add_argument('--max-aspect', type=float, default=None,
+                        help='Drop boxes more elongated than this (max of w/h and h/w)')
+    parser.add_argument('--exclude-crowd', action='store_true',
+                        help='Drop iscrowd annotations')
+    parser.add_argument('--exclude-truncated', action='store_true',
+                        help='Drop boxes touching the image border (truncated objects)')
+    parser.add_argument('--image-list', action='store_true',
+                        help='Also write <output>/<split>.txt listing the selected images')
+    parser.add_argument('--exclude-images', type=str, default=None,
+                        help='File listing image file names never to select, one per line '
+                             '(e.g. dedup/<split>_duplicates.txt from image_dedup.py)')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    try:
+        quota = parse_quota(args.quota, args.classes) if args.quota else None
+    except ValueError as e:
+        parser.error(str(e))
+    
+    for name in ('min_area', 'max_area', 'min_size'):
+        if getattr(args, name) is not None and getattr(args, name) < 0:
+            parser.error(f"--{name.replace('_', '-')} must be >= 0")
+    if args.max_aspect is not None and args.max_aspect < 1:
+        parser.error("--max-aspect must be >= 1")
+    filters = active_filters(args.min_area, args.max_area, args.min_size, args.max_aspect,
+                             args.exclude_crowd, args.exclude_truncated)
+    
+    if args.exclude_images is not None and not Path(args.exclude_images).is_file():
+        parser.error(f"--exclude-images file not found: {args.exclude_images}")
+    exclude_images = read_exclude_list(args.exclude_images) if args.exclude_images else None
+    
+    if args.source_images is not None and not Path(args.source_images).is_dir():
+        parser.error(f"--source-images directory not found: {args.source_images}")
+    
+    if args.num_shards < 1 or not 0 <= args.shard_index < args.num_shards:
+        parser.error("--shard-index must satisfy 0 <= index < --num-shards")
+    if args.num_shards > 1 and args.label_shards:
+        parser.error("--label-shards cannot be combined with --num-shards; each node writes its own label files")
+    if args.merge:
+        if not merge_shards(args.output, args.split, args.num_shards, image_list=args.image_list):
+            raise SystemExit(1)
+        return
     
     print(f"Downloading COCO {args.split} filtered for: {args.classes}")
     download_filtered_coco(
         split=args.split,
         output_dir=args.output,
-        target_classes=args.classes
+        target_classes=args.classes,
+        workers=args.workers,
+        retries=args.retries,
+        loader=args.loader,
+        use_cache=not args.no_cache,
+        processes=args.processes,
+        label_shards=args.label_shards,
+        quota=quota,
+        source_images=args.source_images,
+        link_mode=args.link_mode,
+        num_shards=args.num_shards,
+        shard_index=args.shard_index,
+        filters=filters,
+        exclude_images=exclude_images,
+        match=args.match,
+        image_list=args.image_list
     )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Filtered annotation index with a memory-mapped on-disk cache.
+
+A FilteredIndex holds everything download_coco_filtered.py needs after the
+class filter has been applied: the target categories, one row per selected
+image (id, size, file name, URL) and one row per target-class annotation,
+including the derived columns the annotation filters use (relative area and
+size, aspect ratio, border distance; see annotation_filters.py). All of it
+is stored as NumPy arrays, so it can be saved as plain .npy files and
+reopened with mmap_mode='r' on later runs instead of re-parsing the
+annotation JSON.
+
+Images are selected if they contain all target classes (match='all', the
+original selection of download_coco_filtered.py) or any of them
+(match='any', the pool the quota sampler picks from).
+
+The cache lives in <output_dir>/index_cache/<split>-<classes hash>[-any]/ and is
+validated against a BLAKE2 digest of the source annotation file. The digest
+is only recomputed when the file's size or mtime changed.
+"""
+
+import os
+import json
+import shutil
+import socket
+import hashlib
+import numpy as np
+from pathlib import Path
+
+from annotation_filters import predicate_columns
+from coco_stream import load_coco
+from run_report import stage
+from yolo_labels import build_annotation_table, select_rows
+
+
+CACHE_VERSION = 2
+IMAGE_COLUMNS = ('id', 'width', 'height', 'file_name', 'coco_url')
+
+
+class FilteredIndex:
+    """
+    Images and annotations of the target classes as column arrays.
+
+    Args:
+        categories: List of {'id', 'name'} dicts for the target categories found
+        images: Dict of image columns ('id', 'width', 'height', 'file_name', 'coco_url'), sorted by id
+        annotations: Annotation table as returned by yolo_labels.build_annotation_table,
+            plus the annotation_filters.PREDICATE_COLUMNS
+    """
+
+    def __init__(self, categories, images, annotations):
+        self.categories = categories
+        self.images = images
+        self.annotations = annotations
+
+    @classmethod
+    def from_coco(cls, coco, target_classes, report=None, match='all'):
+        """
+        Build the index from a loaded COCO (or StreamingCOCO) object.
+
+        Args:
+            coco: Loaded COCO or StreamingCOCO object
+            target_classes: Class names to keep
+            report: Optional run_report.RunReport receiving the stages
+            match: 'all' selects images containing every target class, 'any'
+                images containing at least one of them
+        """
+        with stage(report, 'category_resolution') as record:
+            cat_ids = coco.getCatIds(catNms=target_classes)
+            categories = [{'id': cat['id'], 'name': cat['name']} for cat in coco.loadCats(cat_ids)]
+            record['items'] = len(categories)
+        with stage(report, 'image_selection') as record:
+            if match == 'any':
+                # getImgIds intersects the image sets of several categories
+                img_ids = sorted(set().union(*(coco.getImgIds(catIds=[cat_id]) for cat_id in cat_ids)))
+            else:
+                img_ids = sorted(coco.getImgIds(catIds=cat_ids))
+            imgs = coco.loadImgs(img_ids)
+            images = {
+                'id': np.array(img_ids, dtype=np.int64),
+                'width': np.array([img['width'] for img in imgs], dtype=np.int64),
+                'height': np.array([img['height'] for img in imgs], dtype=np.int64),
+                'file_name': np.array([img['file_name'] for img in imgs], dtype=str),
+                'coco_url': np.array([img.get('coco_url', '') for img in imgs], dtype=str),
+            }
+            record['items'] = len(img_ids)
+        with stage(report, 'annotation_table') as record:
+            annotations = build_annotation_table(coco, cat_ids, img_ids)
+            annotations.update(predicate_columns(annotations))
+            record['items'] = len(annotations['id'])
+        return cls(categories, images, annotations)
+
+    @property
+    def cat_ids(self):
+        """COCO category ids of the target classes."""
+        return [cat['id'] for cat in self.categories]
+
+    @property
+    def img_ids(self):
+        """Selected image ids as a list of ints."""
+        return self.images['id'].tolist()
+
+    def column(self, name):
+        """Return an image column as a dict keyed by image id."""
+        return dict(zip(self.img_ids, self.images[name].tolist()))
+
+    def subset(self, img_ids):
+        """Return a new index restricted to the given image ids."""
+        keep = np.asarray(list(img_ids), dtype=np.int64)
+        images = select_rows(self.images, np.isin(self.images['id'], keep))
+        annotations = select_rows(self.annotations, np.isin(self.annotations['image_id'], keep))
+        return FilteredIndex(self.categories, images, annotations)
+
+    def filter_annotations(self, keep):
+        """
+        Return a new index with only the annotations selected by a boolean mask.
+
+        Images left without any annotation are dropped as well, so they are
+        never downloaded.
+        """
+        annotations = select_rows(self.annotations, keep)
+        images = select_rows(self.images, np.isin(self.images['id'], annotations['image_id']))
+        return FilteredIndex(self.categories, images, annotations)
+
+    def save(self, cache_dir, meta):
+        """
+        Write the index as .npy files plus a meta.json, replacing any previous cache.
+
+        The files are written to a staging directory unique to this process and
+        renamed into place, so a crash never leaves a half-written cache behind
+        and node shards rebuilding the same cache at once do not collide. If an
+        equivalent cache (same source digest) was published meanwhile, it is
+        kept and this copy is discarded.
+        """
+        cache_dir = Path(cache_dir)
+        suffix = f"{socket.gethostname()}-{os.getpid()}"
+        tmp_dir = cache_dir.with_name(f"{cache_dir.name}.tmp-{suffix}")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        for name, values in self.images.items():
+            np.save(tmp_dir / f"images_{name}.npy", values)
+        for name, values in self.annotations.items():
+            np.save(tmp_dir / f"annotations_{name}.npy", values)
+        meta = dict(meta, version=CACHE_VERSION, categories=self.categories,
+                    annotation_columns=list(self.annotations))
+        with open(tmp_dir / "meta.json", 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        current = _cached_meta(cache_dir)
+        if current is not None and current.get('source_digest') == meta.get('source_digest'):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        # Move a stale cache aside (another process may already have done so)
+        old_dir = cache_dir.with_name(f"{cache_dir.name}.old-{suffix}")
+        try:
+            os.replace(cache_dir, old_dir)
+        except FileNotFoundError:
+            old_dir = None
+        try:
+            os.replace(tmp_dir, cache_dir)
+        except OSError:
+            # Another process published its cache between the two renames
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, cache_dir):
+        """Open a saved index; arrays are memory-mapped, not read into memory."""
+        cache_dir = Path(cache_dir)
+        with open(cache_dir / "meta.json") as f:
+            meta = json.load(f)
+        images = {name: np.load(cache_dir / f"images_{name}.npy", mmap_mode='r')
+                  for name in IMAGE_COLUMNS}
+        annotations = {name: np.load(cache_dir / f"annotations_{name}.npy", mmap_mode='r')
+                       for name in meta['annotation_columns']}
+        return cls(meta['categories'], images, annotations)
+
+
+def file_digest(path, chunk_size=1 << 24):
+    """Return the BLAKE2b hex digest of a file's contents."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_dir_for(output_dir, split, target_classes, match='all'):
+    """Cache directory for a split, class list (class order does not matter) and match mode."""
+    classes = sorted(set(target_classes))
+    classes_key = hashlib.blake2b(json.dumps(classes).encode(), digest_size=6).hexdigest()
+    suffix = "-any" if match == 'any' else ""
+    return Path(output_dir) / "index_cache" / f"{split}-{classes_key}{suffix}"
+
+
+def _source_state(annotation_file):
+    """Size and mtime of the annotation file, used to skip re-hashing unchanged files."""
+    st = os.stat(annotation_file)
+    return {'source_size': st.st_size, 'source_mtime_ns': st.st_mtime_ns}
+
+
+def _cached_meta(cache_dir):
+    """Return the cache's meta.json contents, or None if there is no usable cache."""
+    meta_file = Path(cache_dir) / "meta.json"
+    if not meta_file.exists():
+        return None
+    try:
+        with open(meta_file) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    return meta
+
+
+def _write_meta(cache_dir, meta):
+    """Rewrite meta.json atomically, so concurrent readers never see a partial file."""
+    tmp_file = Path(cache_dir) / f"meta.json.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_file, Path(cache_dir) / "meta.json")
+
+
+def _load_annotations(annotation_file, target_classes, loader, report):
+    with stage(report, 'annotation_load', loader=loader, bytes=os.path.getsize(annotation_file)) as record:
+        coco = load_coco(annotation_file, target_classes, loader=loader)
+        record['items'] = len(coco.anns)
+    return coco
+
+
+def load_filtered_index(annotation_file, output_dir, split, target_classes, loader="coco", use_cache=True,
+                        report=None, match='all'):
+    """
+    Return the FilteredIndex for a split, from the cache when it is still valid.
+
+    Args:
+        annotation_file: Path to the COCO annotation JSON
+        output_dir: Dataset output directory (the cache lives in <output_dir>/index_cache)
+        split: Split name, part of the cache key
+        target_classes: Class names to keep, part of the cache key
+        loader: Annotation loader used when the cache must be rebuilt ('coco' or 'stream')
+        use_cache: If False, always rebuild and do not write a cache
+        report: Optional run_report.RunReport receiving the load/filter stages
+        match: 'all' or 'any' target classes per image (see FilteredIndex.from_coco)
+
+    Returns:
+        Tuple (index, from_cache)
+    """
+    if not use_cache:
+        coco = _load_annotations(annotation_file, target_classes, loader, report)
+        return FilteredIndex.from_coco(coco, target_classes, report, match), False
+
+    cache_dir = cache_dir_for(output_dir, split, target_classes, match)
+    state = _source_state(annotation_file)
+    meta = _cached_meta(cache_dir)
+    digest = None
+    if meta is not None:
+        if all(meta.get(key) == value for key, value in state.items()):
+            digest = meta['source_digest']
+        else:
+            # File was touched or replaced: only a content change invalidates the cache
+            with stage(report, 'source_digest', bytes=state['source_size']):
+                digest = file_digest(annotation_file)
+            if digest == meta.get('source_digest'):
+                meta.update(state)
+                _write_meta(cache_dir, meta)
+        if digest == meta.get('source_digest'):
+            try:
+                with stage(report, 'index_cache_load') as record:
+                    index = FilteredIndex.load(cache_dir)
+                    record['items'] = len(index.images['id'])
+                return index, True
+            except (OSError, ValueError, KeyError):
+                # Replaced by a concurrent rebuild while loading: rebuild here as well
+                pass
+
+    coco = _load_annotations(annotation_file, target_classes, loader, report)
+    index = FilteredIndex.from_coco(coco, target_classes, report, match)
+    if digest is None:
+        with stage(report, 'source_digest', bytes=state['source_size']):
+            digest = file_digest(annotation_file)
+    with stage(report, 'index_cache_write') as record:
+        index.save(cache_dir, dict(
+            state,
+            source=str(Path(annotation_file).resolve()),
+            source_digest=digest,
+            classes=sorted(set(target_classes)),
+            match=match,
+        ))
+        record['items'] = len(index.images['id'])
+    try:
+        return FilteredIndex.load(cache_dir), False
+    except (OSError, ValueError, KeyError):
+        # Another shard is swapping in its copy right now: use the index built here
+        return index, False
+
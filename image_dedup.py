@@ -0,0 +1,411 @@
+"""
+Near-duplicate detection for downloaded (or mirrored) COCO images.
+
+COCO contains many visually near-identical frames, and the balancing patch
+should not add scenes the Huawei / PascalRaw datasets already contain. This
+stage computes a 64-bit perceptual hash (pHash: low-frequency DCT
+coefficients of a 32x32 grayscale thumbnail, thresholded at their median)
+for every image of a split in a process pool and finds all pairs within a
+Hamming distance with a multi-index lookup: the hash is cut into a few
+chunks, and two hashes within distance d must agree on some chunk up to
+d // chunks flipped bits, so candidates come from sorted chunk tables
+instead of an all-pairs comparison.
+
+Images are visited in file-name order; an image is dropped if it is within
+the distance of an image kept before it, or of any image in the optional
+reference directories. The result is written to <dataset>/dedup/:
+
+    <split>_duplicates.txt   dropped file names (usable as --exclude-images)
+    <split>_report.json      what was dropped, the image it matched and the distance
+    hash_cache.npz           hashes keyed by path, file size and mtime
+
+so later runs only hash new or changed images. JPEG decoding uses Pillow if
+it is installed and OpenCV otherwise.
+"""
+
+import os
+import json
+import shutil
+import argparse
+import itertools
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from image_io import Image, decoder_available
+from run_report import RunReport
+
+
+HASH_SIZE = 32
+LOW_FREQ = 8
+MAX_CHUNKS = 4
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+CACHE_NAME = "hash_cache.npz"
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II matrix, so the 2D transform is D @ X @ D.T."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    d = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    d[0] /= np.sqrt(2.0)
+    return d
+
+
+_DCT = _dct_matrix(HASH_SIZE)
+
+
+def _load_gray(path):
+    """HASH_SIZE x HASH_SIZE grayscale thumbnail of an image as float32."""
+    if Image is None:
+        import cv2
+        # Reduced decode: the JPEG decoder skips most of the work for a 1/4-size image. EXIF
+        # orientation is ignored as with Pillow, so both backends hash the same pixels
+        img = cv2.imread(str(path), cv2.IMREAD_REDUCED_GRAYSCALE_4 | cv2.IMREAD_IGNORE_ORIENTATION)
+        if img is None:
+            raise ValueError(f"Cannot decode {path}")
+        return cv2.resize(img, (HASH_SIZE, HASH_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    with Image.open(path) as img:
+        img.draft('L', (HASH_SIZE * 4, HASH_SIZE * 4))
+        return np.asarray(img.convert('L').resize((HASH_SIZE, HASH_SIZE), Image.BOX), dtype=np.float32)
+
+
+def phash(gray):
+    """64-bit perceptual hash of a HASH_SIZE x HASH_SIZE grayscale array."""
+    coeffs = (_DCT @ gray @ _DCT.T)[:LOW_FREQ, :LOW_FREQ].ravel()
+    bits = coeffs > np.median(coeffs)
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def _hash_chunk(paths):
+    """Worker: hash a chunk of images; unreadable images get None."""
+    hashes = []
+    for path in paths:
+        try:
+            hashes.append(phash(_load_gray(path)))
+        except (OSError, ValueError):
+            hashes.append(None)
+    return hashes
+
+
+def list_images(images_dir):
+    """Image files in a directory tree, sorted by path."""
+    paths = []
+    for root, _, files in os.walk(images_dir, followlinks=True):
+        paths.extend(os.path.join(root, name) for name in files
+                     if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.'))
+    return sorted(paths)
+
+
+def _load_cache(cache_file):
+    """{resolved path: (size, mtime_ns, hash)} from the cache file, or {} if there is none."""
+    if cache_file is None or not Path(cache_file).exists():
+        return {}
+    try:
+        data = np.load(cache_file)
+        return {path: (size, mtime, value) for path, size, mtime, value in zip(
+            data['path'].tolist(), data['size'].tolist(), data['mtime_ns'].tolist(), data['hash'].tolist())}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def _save_cache(cache_file, entries):
+    Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+    paths = list(entries)
+    tmp_file = f"{cache_file}.tmp.npz"
+    np.savez(tmp_file,
+             path=np.array(paths, dtype=str),
+             size=np.array([entries[p][0] for p in paths], dtype=np.int64),
+             mtime_ns=np.array([entries[p][1] for p in paths], dtype=np.int64),
+             hash=np.array([entries[p][2] for p in paths], dtype=np.uint64))
+    os.replace(tmp_file, cache_file)
+
+
+def hash_images(paths, processes=1, cache_file=None, chunk_size=256):
+    """
+    Perceptual hashes of images, reusing cached hashes of unchanged files.
+
+    Args:
+        paths: Image paths
+        processes: Worker processes for decoding and hashing
+        cache_file: Optional .npz hash cache, read and updated in place
+        chunk_size: Images per worker task
+
+    Returns:
+        Tuple (hashes, valid, num_hashed): uint64 hashes, a mask of images that could
+        be decoded and the number of images hashed in this call (not from the cache)
+    """
+    cache = _load_cache(cache_file)
+    keys = []
+    todo = []
+    hashes = np.zeros(len(paths), dtype=np.uint64)
+    valid = np.zeros(len(paths), dtype=bool)
+    for i, path in enumerate(paths):
+        key = str(Path(path).resolve())
+        try:
+            st = os.stat(key)
+        except OSError:
+            # Broken symlink into a mirror: left invalid
+            keys.append(None)
+            continue
+        keys.append((key, st.st_size, st.st_mtime_ns))
+        cached = cache.get(key)
+        if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            hashes[i] = cached[2]
+            valid[i] = True
+        else:
+            todo.append(i)
+
+    if todo:
+        chunks = [todo[start:start + chunk_size] for start in range(0, len(todo), chunk_size)]
+        tasks = [[paths[i] for i in chunk] for chunk in chunks]
+        if processes > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = list(pool.map(_hash_chunk, tasks))
+        else:
+            results = [_hash_chunk(task) for task in tasks]
+        for chunk, chunk_hashes in zip(chunks, results):
+            for i, value in zip(chunk, chunk_hashes):
+                if value is None:
+                    continue
+                hashes[i] = value
+                valid[i] = True
+                key, size, mtime = keys[i]
+                cache[key] = (size, mtime, value)
+        if cache_file is not None:
+            _save_cache(cache_file, cache)
+    return hashes, valid, len(todo)
+
+
+def hamming(a, b):
+    """Element-wise Hamming distance of two uint64 arrays."""
+    x = np.bitwise_xor(a, b)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x).astype(np.int64)
+    return np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1).astype(np.int64)
+
+
+def _flip_masks(width, radius):
+    """All masks with at most `radius` of the low `width` bits set."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        masks.extend(sum(1 << bit for bit in bits) for bits in itertools.combinations(range(width), r))
+    return np.array(masks, dtype=np.uint64)
+
+
+def near_duplicate_pairs(query, index=None, max_distance=4):
+    """
+    All pairs within a Hamming distance, found with a multi-index lookup.
+
+    Args:
+        query: uint64 hashes
+        index: uint64 hashes to search; None searches query against itself
+        max_distance: Maximum Hamming distance (inclusive)
+
+    Returns:
+        Tuple (query_rows, index_rows, distances); for a self-search only pairs
+        with query_rows < index_rows are returned
+    """
+    self_search = index is None
+    if self_search:
+        index = query
+    query = np.asarray(query, dtype=np.uint64)
+    index = np.asarray(index, dtype=np.uint64)
+    empty = np.zeros(0, dtype=np.int64)
+    if len(query) == 0 or len(index) == 0:
+        return empty, empty, empty
+
+    # Pigeonhole: within distance d, some chunk differs in at most d // chunks bits
+    num_chunks = min(max_distance + 1, MAX_CHUNKS)
+    radius = max_distance // num_chunks
+    bounds = np.linspace(0, 64, num_chunks + 1).astype(int)
+    found = []
+    for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        mask = np.uint64((1 << (hi - lo)) - 1)
+        index_keys = (index >> np.uint64(lo)) & mask
+        order = np.argsort(index_keys, kind='stable')
+        sorted_keys = index_keys[order]
+        query_keys = (query >> np.uint64(lo)) & mask
+        for flip in _flip_masks(hi - lo, radius):
+            probe = query_keys ^ flip
+            left = np.searchsorted(sorted_keys, probe, 'left')
+            counts = np.searchsorted(sorted_keys, probe, 'right') - left
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            rows = np.repeat(np.arange(len(query), dtype=np.int64), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            cols = order[np.repeat(left, counts) + offsets]
+            # Verify candidates right away so only true matches are kept and de-duplicated
+            keep = hamming(query[rows], index[cols]) <= max_distance
+            if self_search:
+                keep &= rows < cols
+            found.append(rows[keep] * len(index) + cols[keep])
+    if not found:
+        return empty, empty, empty
+
+    pairs = np.unique(np.concatenate(found))
+    rows, cols = pairs // len(index), pairs % len(index)
+    return rows, cols, hamming(query[rows], index[cols])
+
+
+def select_duplicates(hashes, max_distance, reference_hashes=None):
+    """
+    Decide which images to drop.
+
+    Images are visited in order; an image is dropped if it is within
+    max_distance of a reference image or of an earlier image that was kept.
+
+    Args:
+        hashes: uint64 hashes of the candidate images, in preference order
+        max_distance: Maximum Hamming distance for a near-duplicate
+        reference_hashes: Optional uint64 hashes of images already in the training set
+
+    Returns:
+        Dict mapping dropped row -> (kind, matched row, distance), kind being
+        'reference' (matched row indexes reference_hashes) or 'duplicate'
+    """
+    dropped = {}
+    if reference_hashes is not None and len(reference_hashes):
+        rows, refs, distances = near_duplicate_pairs(hashes, reference_hashes, max_distance)
+        for row, ref, distance in sorted(zip(rows.tolist(), refs.tolist(), distances.tolist()),
+                                         key=lambda item: item[2], reverse=True):
+            dropped[row] = ('reference', ref, distance)
+
+    rows, cols, distances = near_duplicate_pairs(hashes, None, max_distance)
+    # Pairs sorted by the later image: every earlier image is decided when it is reached
+    for later, earlier, distance in sorted(zip(cols.tolist(), rows.tolist(), distances.tolist())):
+        if later not in dropped and earlier not in dropped:
+            dropped[later] = ('duplicate', earlier, distance)
+    return dropped
+
+
+def _remove(dataset_dir, split, file_name, removed_dir):
+    """Move an image and its label file out of the dataset into removed_dir."""
+    for kind, name in (('images', file_name), ('labels', Path(file_name).stem + '.txt')):
+        src = Path(dataset_dir) / kind / split / name
+        if os.path.lexists(src):
+            dest = removed_dir / kind / split / name
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(src), str(dest))
+
+
+def dedup_dataset(dataset_dir, split, max_distance=4, reference_dirs=None, processes=1, remove=False):
+    """
+    Find near-duplicate images in a downloaded split and report (or remove) them.
+
+    Args:
+        dataset_dir: Output directory of download_coco_filtered.py
+        split: 'val2017' or 'train2017'
+        max_distance: Maximum Hamming distance between 64-bit hashes for a near-duplicate
+        reference_dirs: Optional image directories of the other datasets; COCO images
+            matching any of their images are dropped as well
+        processes: Worker processes for hashing
+        remove: Move dropped images and labels to <dataset>/dedup/removed/
+
+    Returns:
+        Dict with 'num_images', 'hashed', 'duplicates', 'reference_matches' and 'undecodable'
+    """
+    dataset_dir = Path(dataset_dir)
+    dedup_dir = dataset_dir / "dedup"
+    dedup_dir.mkdir(parents=True, exist_ok=True)
+    cache_file = dedup_dir / CACHE_NAME
+    reference_dirs = reference_dirs or []
+    report = RunReport("image_dedup", {'split': split, 'max_distance': max_distance,
+                                       'reference_dirs': reference_dirs, 'processes': processes})
+
+    with report.stage('hash', processes=processes) as record:
+        paths = list_images(dataset_dir / "images" / split)
+        hashes, valid, hashed = hash_images(paths, processes, cache_file)
+        record['items'] = hashed
+    with report.stage('hash_reference', processes=processes) as record:
+        reference_paths = [path for ref in reference_dirs for path in list_images(ref)]
+        reference_hashes, reference_valid, reference_hashed = hash_images(reference_paths, processes, cache_file)
+        reference_paths = [path for path, ok in zip(reference_paths, reference_valid.tolist()) if ok]
+        reference_hashes = reference_hashes[reference_valid]
+        record['items'] = reference_hashed
+
+    with report.stage('match') as record:
+        rows = np.flatnonzero(valid)
+        dropped = select_duplicates(hashes[rows], max_distance, reference_hashes)
+        record['items'] = len(rows)
+
+    names = [os.path.basename(path) for path in paths]
+    entries = []
+    for row in sorted(dropped):
+        kind, match, distance = dropped[row]
+        matched = reference_paths[match] if kind == 'reference' else names[rows[match]]
+        entries.append({'file_name': names[rows[row]], 'reason': kind, 'match': matched, 'distance': distance})
+    undecodable = [names[i] for i in np.flatnonzero(~valid).tolist()]
+
+    with open(dedup_dir / f"{split}_duplicates.txt", 'w') as f:
+        f.write("".join(f"{entry['file_name']}\n" for entry in entries))
+    with open(dedup_dir / f"{split}_report.json", 'w') as f:
+        json.dump({'split': split, 'max_distance': max_distance, 'reference_dirs': reference_dirs,
+                   'num_images': len(paths), 'dropped': entries, 'undecodable': undecodable}, f, indent=2)
+    if remove:
+        with report.stage('remove', items=len(entries)):
+            for entry in entries:
+                _remove(dataset_dir, split, entry['file_name'], dedup_dir / "removed")
+
+    result = {
+        'num_images': len(paths),
+        'hashed': hashed,
+        'duplicates': sum(entry['reason'] == 'duplicate' for entry in entries),
+        'reference_matches': sum(entry['reason'] == 'reference' for entry in entries),
+        'undecodable': len(undecodable),
+    }
+    for key, value in result.items():
+        report.count(key, value)
+    report.save(dedup_dir / "run_report.json")
+    return result
+
+
+def main(argv=None, prog=None):
+    """Command-line entry point; argv and prog are set when run through coco_cli.py."""
+    parser = argparse.ArgumentParser(prog=prog, description="Find near-duplicate images in a filtered COCO split")
+    parser.add_argument('--input', type=str, default='./coco_filtered',
+                        help='Output directory of download_coco_filtered.py')
+    parser.add_argument('--split', type=str, default='val2017',
+                        choices=['val2017', 'train2017'],
+                        help='Split to deduplicate')
+    parser.add_argument('--max-distance', type=int, default=4,
+                        help='Maximum Hamming distance between 64-bit hashes for a near-duplicate')
+    parser.add_argument('--reference', nargs='+', default=None, metavar='DIR',
+                        help='Image directories of the other datasets (e.g. huawei/images); '
+                             'COCO images matching them are dropped too')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for decoding and hashing')
+    parser.add_argument('--remove', action='store_true',
+                        help='Move dropped images and labels to <input>/dedup/removed/')
+    args = parser.parse_args(argv)
+
+    if not (Path(args.input) / "images" / args.split).is_dir():
+        parser.error(f"No images found in {Path(args.input) / 'images' / args.split}")
+    for ref in args.reference or []:
+        if not Path(ref).is_dir():
+            parser.error(f"Reference directory not found: {ref}")
+    if not 0 <= args.max_distance <= 16:
+        parser.error("--max-distance must be between 0 and 16")
+    if not decoder_available():
+        parser.error("Decoding images needs Pillow or OpenCV (pip install pillow)")
+
+    result = dedup_dataset(args.input, args.split, max_distance=args.max_distance,
+                           reference_dirs=args.reference, processes=args.processes, remove=args.remove)
+    dedup_dir = Path(args.input) / "dedup"
+    print(f"\n{'='*50}")
+    print(f"Deduplication Summary")
+    print(f"{'='*50}")
+    print(f"Images: {result['num_images']} (hashed this run: {result['hashed']})")
+    print(f"Near-duplicates within the split: {result['duplicates']}")
+    print(f"Matches with reference images: {result['reference_matches']}")
+    if result['undecodable']:
+        print(f"Undecodable images (not compared): {result['undecodable']}")
+    print(f"\nDropped images: {dedup_dir / f'{args.split}_duplicates.txt'}")
+    print(f"Report: {dedup_dir / f'{args.split}_report.json'}")
+    if args.remove:
+        print(f"Moved dropped images and labels to {dedup_dir / 'removed'}")
+
+
+if __name__ == "__main__":
+    main()
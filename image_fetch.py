@@ -0,0 +1,208 @@
+"""
+Concurrent image fetcher used by download_coco_filtered.py.
+
+Downloads a list of (url, destination) jobs with a bounded thread pool.
+Each worker thread keeps one persistent HTTP connection per host, follows
+redirects (on the connection of the host they point to), retries failed
+requests with exponential backoff, and writes every image to a
+temporary file that is renamed into place only once it is complete, so an
+interrupted run never leaves truncated images behind.
+"""
+
+import os
+import time
+import hashlib
+import random
+import threading
+import http.client
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+
+# HTTP status codes worth retrying; anything else >= 400 fails immediately
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 5
+
+
+class FetchError(Exception):
+    """Raised when an image cannot be fetched after all retries."""
+
+
+class ImageFetcher:
+    """
+    Bounded worker pool that downloads images over reusable connections.
+
+    Args:
+        workers: Number of concurrent download threads
+        retries: Number of retries per image after the first attempt
+        backoff: Base delay in seconds for exponential backoff between retries
+        timeout: Socket timeout in seconds for each request
+    """
+
+    def __init__(self, workers=8, retries=3, backoff=0.5, timeout=30):
+        self.workers = max(1, int(workers))
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._worker_stats = {}
+
+    def _connection(self, scheme, netloc):
+        """Return this thread's connection to (scheme, netloc), opening it if needed."""
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        key = (scheme, netloc)
+        conn = conns.get(key)
+        if conn is None:
+            conn_cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = conn_cls(netloc, timeout=self.timeout)
+            conns[key] = conn
+        return conn
+
+    def _drop_connection(self, scheme, netloc):
+        """Close and forget a connection after an error so the next attempt reconnects."""
+        conns = getattr(self._local, 'conns', {})
+        conn = conns.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _request(self, url):
+        """
+        Fetch a URL once on the thread's persistent connections and return the body.
+
+        Redirects are followed for up to MAX_REDIRECTS hops; each hop uses the
+        connection to the host its Location points to.
+        """
+        location = url
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(location)
+            if parts.scheme not in ('http', 'https'):
+                raise FetchError(f"Unsupported URL {location} (from {url})")
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            conn = self._connection(parts.scheme, parts.netloc)
+            try:
+                conn.request('GET', path, headers={'Connection': 'keep-alive'})
+                response = conn.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                self._drop_connection(parts.scheme, parts.netloc)
+                raise
+            if response.will_close:
+                self._drop_connection(parts.scheme, parts.netloc)
+            if response.status in REDIRECT_STATUS:
+                target = response.getheader('Location')
+                if not target:
+                    raise FetchError(f"HTTP {response.status} without Location for {location}")
+                location = urljoin(location, target)
+                continue
+            if response.status != 200:
+                message = f"HTTP {response.status} for {location}"
+                if response.status in RETRYABLE_STATUS:
+                    raise http.client.HTTPException(message)
+                raise FetchError(message)
+            return body
+        raise FetchError(f"More than {MAX_REDIRECTS} redirects for {url}")
+
+    def fetch(self, url, dest):
+        """
+        Download a single URL to dest, retrying with backoff.
+
+        Returns (bytes written, BLAKE2 checksum of the body). Raises FetchError on failure.
+        """
+        dest = Path(dest)
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # Exponential backoff with jitter so workers don't retry in lockstep
+                time.sleep(self.backoff * (2 ** (attempt - 1)) * (1 + random.random()))
+            try:
+                body = self._request(url)
+                break
+            except FetchError:
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                last_error = e
+        else:
+            raise FetchError(f"{url}: {last_error}")
+
+        # Write to a temp file in the same directory, then atomically rename
+        tmp_path = dest.with_name(f".{dest.name}.{threading.get_ident()}.part")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, dest)
+        except OSError:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        return len(body), hashlib.blake2b(body, digest_size=16).hexdigest()
+
+    def _run_job(self, url, dest):
+        """Worker entry point: fetch one image and record per-thread throughput."""
+        start = time.perf_counter()
+        nbytes, checksum = self.fetch(url, dest)
+        elapsed = time.perf_counter() - start
+        name = threading.current_thread().name
+        with self._lock:
+            count, total_bytes, busy = self._worker_stats.get(name, (0, 0, 0.0))
+            self._worker_stats[name] = (count + 1, total_bytes + nbytes, busy + elapsed)
+        return nbytes, checksum, elapsed
+
+    def _postfix(self, wall_time, total_bytes):
+        """Build the progress bar postfix with aggregate and per-worker throughput."""
+        with self._lock:
+            stats = list(self._worker_stats.values())
+        if not stats or wall_time <= 0:
+            return {}
+        per_worker = [count / busy for count, _, busy in stats if busy > 0]
+        return {
+            'MB/s': f"{total_bytes / wall_time / 1e6:.2f}",
+            'img/s/worker': f"{sum(per_worker) / len(per_worker):.2f}" if per_worker else "0",
+            'workers': len(stats),
+        }
+
+    def fetch_all(self, jobs, desc="Downloading images"):
+        """
+        Download all (key, url, dest) jobs concurrently.
+
+        Args:
+            jobs: Iterable of (key, url, dest) tuples; key identifies the job in results
+            desc: Progress bar description
+
+        Returns:
+            Tuple (fetched, failed) where fetched maps key -> (bytes written, checksum)
+            and failed maps key -> error message. Afterwards self.durations maps each
+            fetched key -> seconds spent on it (including retries).
+        """
+        jobs = list(jobs)
+        fetched = {}
+        failed = {}
+        self.durations = {}
+        if not jobs:
+            return fetched, failed
+
+        self._worker_stats = {}
+        total_bytes = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fetch") as pool:
+            futures = {pool.submit(self._run_job, url, dest): key for key, url, dest in jobs}
+            with tqdm(total=len(jobs), desc=desc) as pbar:
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        nbytes, checksum, elapsed = future.result()
+                        fetched[key] = (nbytes, checksum)
+                        self.durations[key] = elapsed
+                        total_bytes += nbytes
+                    except Exception as e:
+                        failed[key] = str(e)
+                    pbar.update(1)
+                    pbar.set_postfix(self._postfix(time.perf_counter() - start, total_bytes), refresh=False)
+        return fetched, failed
@@ -0,0 +1,19 @@
+"""
+Image decoding backend shared by image_dedup.py and resize_cache.py.
+
+Neither Pillow nor OpenCV is a hard dependency of the project. Image is
+Pillow's Image module if Pillow is installed and None otherwise, in which
+case callers fall back to OpenCV (imported lazily, inside worker functions).
+"""
+
+import importlib.util
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def decoder_available():
+    """True if Pillow or OpenCV can be imported for decoding and encoding."""
+    return Image is not None or importlib.util.find_spec('cv2') is not None
@@ -0,0 +1,412 @@
+"""
+Class distribution of YOLO label directories (COCO + Huawei + PascalRaw).
+
+Balancing the combined training set (COCO_BALANCING.md) needs the class
+distribution of every source, not only of COCO. This scanner reads any
+number of YOLO labels/ directories: the label files of each directory are
+split into chunks that a process pool reads and parses in bulk
+(np.fromstring over the concatenated lines), and the per-line class ids and
+box sizes are kept as NumPy arrays. Lines are read as boxes ('class x y w h')
+or polygons (segmentation labels), or, for pose directories (a dataset.yaml
+with kpt_shape next to the labels, or --format NAME=pose), as box plus
+keypoints. Instance counts, image counts and
+box-size histograms are then computed per dataset and combined across
+datasets by class name, using each source's classes.txt.
+
+Parsed arrays are cached per directory (in ~/.cache/coco_label_scan by
+default), keyed by a fingerprint of the label files' names, sizes and
+mtimes, so unchanged directories are not parsed again.
+
+Usage:
+    python label_scan.py coco=coco_filtered/labels/train2017 huawei=huawei/labels pascalraw=pascalraw/labels \\
+        --alias pedestrian=person
+"""
+
+import os
+import re
+import json
+import hashlib
+import warnings
+import argparse
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from class_stats import SIZE_BINS, format_size_hist
+from dataset_cache import directory_fingerprint
+
+
+CACHE_VERSION = 2
+LABEL_FORMATS = ('detect', 'pose')
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "coco_label_scan"
+
+
+def list_label_files(labels_dir):
+    """Every .txt label file under labels_dir (recursively, classes.txt excluded), sorted."""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(labels_dir):
+        dirnames.sort()
+        files.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                     if name.endswith('.txt') and name != 'classes.txt')
+    return files
+
+
+def parse_label_lines(rows, label_format='detect'):
+    """
+    Parse YOLO label lines in bulk.
+
+    With label_format 'detect', lines with 5 values are boxes ('class x y w h')
+    and longer lines are segmentation polygons ('class x1 y1 ... xn yn'), which
+    use the bounding box of their points. With 'pose', every line is a box
+    followed by keypoints and takes the box from columns 1-4; the number of
+    values per keypoint (2 or 3) does not matter.
+
+    Args:
+        rows: List of non-empty label lines (bytes)
+        label_format: 'detect' (boxes and polygons) or 'pose'
+
+    Returns:
+        Tuple (class_ids, widths, heights, valid): per-line arrays for the valid
+        lines and the boolean mask of valid lines (at least 5 numeric values;
+        polygons also need complete x, y pairs)
+    """
+    num_tokens = np.fromiter((len(row.split()) for row in rows), dtype=np.int64, count=len(rows))
+    try:
+        with warnings.catch_warnings():
+            # Older NumPy warns (instead of raising) when it stops at a non-numeric token
+            warnings.simplefilter('ignore', DeprecationWarning)
+            values = np.fromstring(b" ".join(rows), dtype=np.float64, sep=" ")
+    except ValueError:
+        values = None
+    if values is None or len(values) != num_tokens.sum():
+        # A non-numeric token somewhere: fall back to parsing line by line
+        values, num_tokens = _parse_rows_slow(rows)
+    valid = num_tokens >= 5
+    if label_format != 'pose':
+        valid &= (num_tokens == 5) | ((num_tokens - 1) % 2 == 0)
+    starts = (np.cumsum(num_tokens) - num_tokens)[valid]
+    num_tokens = num_tokens[valid]
+    class_ids = values[starts].astype(np.int32)
+
+    widths = np.zeros(len(starts), dtype=np.float32)
+    heights = np.zeros(len(starts), dtype=np.float32)
+    boxed = np.ones(len(starts), dtype=bool) if label_format == 'pose' else num_tokens == 5
+    widths[boxed] = values[starts[boxed] + 3]
+    heights[boxed] = values[starts[boxed] + 4]
+    if not boxed.all():
+        widths[~boxed], heights[~boxed] = _polygon_extents(values, starts[~boxed] + 1, num_tokens[~boxed] - 1)
+    return class_ids, widths, heights, valid
+
+
+def _polygon_extents(values, starts, counts):
+    """Width and height of the polygons stored as x, y pairs at values[start:start + count]."""
+    # Flat index of every coordinate, grouped by polygon
+    group_starts = np.cumsum(counts) - counts
+    offsets = np.arange(counts.sum()) - np.repeat(group_starts, counts)
+    coords = values[np.repeat(starts, counts) + offsets]
+    xs, ys = coords[offsets % 2 == 0], coords[offsets % 2 == 1]
+    point_starts = group_starts // 2
+    return (np.maximum.reduceat(xs, point_starts) - np.minimum.reduceat(xs, point_starts),
+            np.maximum.reduceat(ys, point_starts) - np.minimum.reduceat(ys, point_starts))
+
+
+def _parse_rows_slow(rows):
+    """Per-line parse that gives malformed lines zero values (so they are skipped)."""
+    parsed = []
+    for row in rows:
+        try:
+            parsed.append([float(token) for token in row.split()])
+        except ValueError:
+            parsed.append([])
+    num_tokens = np.array([len(values) for values in parsed], dtype=np.int64)
+    values = np.array([value for values in parsed for value in values], dtype=np.float64)
+    return values, num_tokens
+
+
+def _scan_chunk(task):
+    """Worker: read and parse a chunk of label files."""
+    paths, label_format = task
+    rows = []
+    lines_per_file = np.zeros(len(paths), dtype=np.int64)
+    for idx, path in enumerate(paths):
+        with open(path, 'rb') as f:
+            file_rows = [row for row in f.read().splitlines() if row.strip()]
+        rows.extend(file_rows)
+        lines_per_file[idx] = len(file_rows)
+    file_idx = np.repeat(np.arange(len(paths), dtype=np.int32), lines_per_file)
+    if not rows:
+        empty = np.zeros(0, dtype=np.float32)
+        return np.zeros(0, dtype=np.int32), empty, empty, file_idx, 0
+    class_ids, widths, heights, valid = parse_label_lines(rows, label_format)
+    return class_ids, widths, heights, file_idx[valid], int(np.count_nonzero(~valid))
+
+
+def scan_labels_dir(labels_dir, processes=1, label_format='detect'):
+    """
+    Parse every label file of a directory into arrays.
+
+    Args:
+        labels_dir: YOLO labels directory
+        processes: Worker processes for reading and parsing
+        label_format: 'detect' (boxes and polygons) or 'pose' (see parse_label_lines)
+
+    Returns:
+        Dict with 'class_ids', 'widths', 'heights', 'file_idx' (one entry per
+        label line), 'num_files' and 'skipped_lines' (lines with too few values)
+    """
+    files = list_label_files(labels_dir)
+    num_chunks = max(1, min(len(files) // 2000 + 1, processes * 4))
+    bounds = np.linspace(0, len(files), num_chunks + 1).astype(np.int64)
+    chunks = [(files[a:b], label_format) for a, b in zip(bounds[:-1], bounds[1:])]
+    if processes > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_scan_chunk, chunks))
+    else:
+        results = [_scan_chunk(chunk) for chunk in chunks]
+
+    # Chunk-local file indices -> directory-wide indices
+    offsets = bounds[:-1].astype(np.int32)
+    return {
+        'class_ids': np.concatenate([r[0] for r in results]) if results else np.zeros(0, dtype=np.int32),
+        'widths': np.concatenate([r[1] for r in results]) if results else np.zeros(0, dtype=np.float32),
+        'heights': np.concatenate([r[2] for r in results]) if results else np.zeros(0, dtype=np.float32),
+        'file_idx': np.concatenate([r[3] + off for r, off in zip(results, offsets)]) if results
+        else np.zeros(0, dtype=np.int32),
+        'num_files': len(files),
+        'skipped_lines': sum(r[4] for r in results),
+    }
+
+
+def _cache_paths(cache_dir, labels_dir):
+    key = hashlib.blake2b(str(Path(labels_dir).resolve()).encode(), digest_size=8).hexdigest()
+    return Path(cache_dir) / f"{key}.npz", Path(cache_dir) / f"{key}.json"
+
+
+def load_or_scan(labels_dir, processes=1, cache_dir=DEFAULT_CACHE_DIR, use_cache=True, label_format='detect'):
+    """
+    scan_labels_dir with a per-directory cache keyed by a stat fingerprint and the label format.
+
+    Returns:
+        Tuple (scan, from_cache)
+    """
+    fingerprint = directory_fingerprint(labels_dir) if use_cache else None
+    arrays_path, meta_path = _cache_paths(cache_dir, labels_dir)
+    if use_cache and arrays_path.exists() and meta_path.exists():
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if (meta.get('version') == CACHE_VERSION and meta.get('fingerprint') == fingerprint
+                    and meta.get('label_format') == label_format):
+                with np.load(arrays_path) as arrays:
+                    scan = {key: arrays[key] for key in arrays.files}
+                scan.update(num_files=meta['num_files'], skipped_lines=meta['skipped_lines'])
+                return scan, True
+        except (OSError, ValueError, KeyError):
+            pass
+
+    scan = scan_labels_dir(labels_dir, processes, label_format)
+    if use_cache:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        tmp_arrays = arrays_path.with_name(arrays_path.stem + ".tmp.npz")
+        np.savez(tmp_arrays, **{key: scan[key] for key in ('class_ids', 'widths', 'heights', 'file_idx')})
+        os.replace(tmp_arrays, arrays_path)
+        tmp_meta = meta_path.with_name(meta_path.stem + ".tmp.json")
+        with open(tmp_meta, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'labels_dir': str(Path(labels_dir).resolve()),
+                       'fingerprint': fingerprint, 'label_format': label_format,
+                       'num_files': scan['num_files'],
+                       'skipped_lines': scan['skipped_lines']}, f, indent=2)
+        os.replace(tmp_meta, meta_path)
+    return scan, False
+
+
+def find_classes_file(labels_dir, levels=3):
+    """Look for classes.txt in labels_dir and up to `levels` parent directories."""
+    path = Path(labels_dir).resolve()
+    for directory in [path] + list(path.parents)[:levels]:
+        if (directory / "classes.txt").exists():
+            return directory / "classes.txt"
+    return None
+
+
+def detect_label_format(labels_dir, levels=3):
+    """
+    'pose' if the nearest dataset.yaml (in labels_dir or up to `levels` parents) has a
+    kpt_shape, as yolo_pose.py writes, else 'detect'.
+    """
+    path = Path(labels_dir).resolve()
+    for directory in [path] + list(path.parents)[:levels]:
+        yaml_file = directory / "dataset.yaml"
+        if yaml_file.exists():
+            with open(yaml_file) as f:
+                has_kpt_shape = re.search(r'^kpt_shape\s*:', f.read(), re.MULTILINE) is not None
+            return 'pose' if has_kpt_shape else 'detect'
+    return 'detect'
+
+
+def read_class_names(classes_file):
+    with open(classes_file) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def distribution(scan, class_names, aliases=None):
+    """
+    Per-class statistics of one scan, keyed by class name.
+
+    Args:
+        scan: Result of scan_labels_dir/load_or_scan
+        class_names: Names indexed by YOLO class id (ids beyond it become 'class<id>')
+        aliases: Optional {name: canonical name} applied before grouping
+
+    Returns:
+        Dict with 'num_images', 'background_images', 'instance_counts', 'image_counts',
+        'size_bins' and 'size_hist' (sqrt(w*h) histograms over class_stats.SIZE_BINS)
+    """
+    aliases = aliases or {}
+    class_ids = scan['class_ids']
+    max_id = int(class_ids.max()) + 1 if len(class_ids) else 0
+    names = [aliases.get(name, name) for name in class_names]
+    names += [f"class{idx}" for idx in range(len(names), max_id)]
+    unique_names = list(dict.fromkeys(names))
+    name_codes = np.array([unique_names.index(name) for name in names], dtype=np.int64)
+    codes = name_codes[class_ids] if len(class_ids) else np.zeros(0, dtype=np.int64)
+
+    instance_counts = np.bincount(codes, minlength=len(unique_names))
+    # Images per class: distinct (file, class) pairs
+    pairs = np.unique(scan['file_idx'].astype(np.int64) * max(len(unique_names), 1) + codes)
+    image_counts = np.bincount(pairs % max(len(unique_names), 1), minlength=len(unique_names))
+    sizes = np.sqrt(np.clip(scan['widths'].astype(np.float64) * scan['heights'], 0, None))
+    size_hist = {name: np.histogram(sizes[codes == code], bins=SIZE_BINS)[0].tolist()
+                 for code, name in enumerate(unique_names)}
+    labeled_files = len(np.unique(scan['file_idx']))
+    return {
+        'num_images': scan['num_files'],
+        'background_images': scan['num_files'] - labeled_files,
+        'instance_counts': dict(zip(unique_names, instance_counts.tolist())),
+        'image_counts': dict(zip(unique_names, image_counts.tolist())),
+        'size_bins': SIZE_BINS.tolist(),
+        'size_hist': size_hist,
+    }
+
+
+def combine(distributions):
+    """Sum per-dataset distributions by class name."""
+    combined = {'num_images': 0, 'background_images': 0, 'instance_counts': {}, 'image_counts': {},
+                'size_bins': SIZE_BINS.tolist(), 'size_hist': {}}
+    for dist in distributions:
+        combined['num_images'] += dist['num_images']
+        combined['background_images'] += dist['background_images']
+        for key in ('instance_counts', 'image_counts'):
+            for name, count in dist[key].items():
+                combined[key][name] = combined[key].get(name, 0) + count
+        for name, hist in dist['size_hist'].items():
+            previous = combined['size_hist'].get(name, [0] * len(hist))
+            combined['size_hist'][name] = [a + b for a, b in zip(previous, hist)]
+    return combined
+
+
+def format_distribution(title, dist):
+    """Render a distribution as text lines."""
+    total = sum(dist['instance_counts'].values())
+    lines = [f"\n{'='*60}", title, f"{'='*60}",
+             f"Images: {dist['num_images']} (background: {dist['background_images']})",
+             f"Instances: {total}", "", "Per class (instances, share, images):"]
+    for name, count in sorted(dist['instance_counts'].items(), key=lambda x: x[1], reverse=True):
+        share = count / total * 100 if total else 0
+        lines.append(f"  {name:20s}: {count:8d} ({share:5.2f}%)  images: {dist['image_counts'][name]}")
+    lines.append("")
+    lines.append("Box size distribution (instances per bin):")
+    lines.extend(format_size_hist(dist))
+    return lines
+
+
+def _parse_pairs(specs, what):
+    pairs = {}
+    for spec in specs or []:
+        if '=' not in spec:
+            raise ValueError(f"Invalid {what} '{spec}', expected A=B")
+        key, value = spec.split('=', 1)
+        pairs[key] = value
+    return pairs
+
+
+def main(argv=None, prog=None):
+    """Command-line entry point; argv and prog are set when run through coco_cli.py."""
+    parser = argparse.ArgumentParser(prog=prog, description="Class distribution of YOLO label directories")
+    parser.add_argument('sources', nargs='+', metavar='[NAME=]LABELS_DIR',
+                        help='YOLO label directories, optionally named (e.g. huawei=huawei/labels)')
+    parser.add_argument('--classes-file', nargs='+', default=None, metavar='NAME=PATH',
+                        help='classes.txt of a source (default: searched in the labels dir and its parents)')
+    parser.add_argument('--format', nargs='+', default=None, metavar='NAME=FORMAT',
+                        help=f"Label format of a source, one of {', '.join(LABEL_FORMATS)} (default: pose if "
+                             f"the nearest dataset.yaml has kpt_shape, else detect = boxes and polygons)")
+    parser.add_argument('--alias', nargs='+', default=None, metavar='FROM=TO',
+                        help='Treat class FROM as TO when combining, e.g. pedestrian=person')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for reading and parsing label files')
+    parser.add_argument('--cache-dir', type=str, default=str(DEFAULT_CACHE_DIR),
+                        help='Directory of the per-directory scan cache')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always re-parse and do not write the cache')
+    parser.add_argument('--output', type=str, default='label_distribution.txt',
+                        help='Result text file (a JSON version is written next to it)')
+    args = parser.parse_args(argv)
+
+    try:
+        classes_files = _parse_pairs(args.classes_file, "--classes-file")
+        aliases = _parse_pairs(args.alias, "--alias")
+        formats = _parse_pairs(args.format, "--format")
+    except ValueError as e:
+        parser.error(str(e))
+    for name, label_format in formats.items():
+        if label_format not in LABEL_FORMATS:
+            parser.error(f"Invalid --format for {name}: {label_format} (choose from {', '.join(LABEL_FORMATS)})")
+    for name, path in classes_files.items():
+        if not Path(path).is_file():
+            parser.error(f"Classes file not found for {name}: {path}")
+    sources = []
+    for spec in args.sources:
+        name, _, path = spec.rpartition('=')
+        if not name:
+            # coco_filtered/labels/train2017 -> coco_filtered, huawei/labels -> huawei
+            parts = [part for part in Path(path).resolve().parts if part != 'labels']
+            name = parts[-2] if Path(path).resolve().parent.name == 'labels' else parts[-1]
+        if not Path(path).is_dir():
+            parser.error(f"Labels directory not found: {path}")
+        sources.append((name, path))
+
+    distributions = {}
+    with open(args.output, 'w') as f:
+        def write_output(text):
+            print(text)
+            f.write(text + '\n')
+
+        for name, path in sources:
+            classes_file = classes_files.get(name) or find_classes_file(path)
+            class_names = read_class_names(classes_file) if classes_file else []
+            if not class_names:
+                print(f"Warning: no classes.txt for {name}, using numeric class ids")
+            label_format = formats.get(name) or detect_label_format(path)
+            scan, from_cache = load_or_scan(path, args.processes, args.cache_dir, use_cache=not args.no_cache,
+                                            label_format=label_format)
+            print(f"{name}: {scan['num_files']} label files, {len(scan['class_ids'])} lines, {label_format} "
+                  f"format ({'cached' if from_cache else 'parsed'})")
+            if scan['skipped_lines']:
+                print(f"Warning: {scan['skipped_lines']} malformed lines in {path} (fewer than 5 values or "
+                      f"an incomplete polygon) were skipped")
+            distributions[name] = distribution(scan, class_names, aliases)
+            for line in format_distribution(f"{name.upper()} ({path})", distributions[name]):
+                write_output(line)
+
+        combined = combine(distributions.values())
+        for line in format_distribution(f"COMBINED ({', '.join(distributions)})", combined):
+            write_output(line)
+
+    json_file = os.path.splitext(args.output)[0] + ".json"
+    with open(json_file, 'w') as f:
+        json.dump({'datasets': distributions, 'combined': combined}, f, indent=2)
+    print(f"\nResults saved to: {args.output} and {json_file}")
+
+
+if __name__ == "__main__":
+    main()
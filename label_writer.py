@@ -0,0 +1,171 @@
+"""
+Parallel YOLO label writing for download_coco_filtered.py.
+
+The selected image ids are split into contiguous chunks and handed to a
+process pool. Each worker formats the labels of its chunk, writes them and
+returns partial statistics (per-class instance counts and label hashes),
+which are merged into the run summary.
+
+Labels are written either as one .txt per image (the standard YOLO layout)
+or, with shards > 0, into a few large shard files plus an index mapping each
+image stem to (shard, byte offset, byte length). The sharded layout avoids
+creating 100k tiny files on network filesystems; read_sharded_label shows how
+a trainer can look labels up.
+"""
+
+import json
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from manifest import content_hash
+from yolo_labels import build_label_texts, select_rows
+
+
+SHARD_INDEX_NAME = "index.json"
+
+
+def shard_dir_for(labels_dir):
+    """Directory holding the sharded labels of a split (labels/<split>_shards)."""
+    labels_dir = Path(labels_dir)
+    return labels_dir.with_name(labels_dir.name + "_shards")
+
+
+def _label_stem(file_name):
+    return file_name.replace('.jpg', '')
+
+
+def _write_chunk(task):
+    """
+    Worker: format, hash and write the labels of one chunk of images.
+
+    Returns (class_counts, written_hashes, label_bytes, shard_entries) where
+    written_hashes maps image id -> label hash for every label file (re)written,
+    label_bytes maps image id -> label size and shard_entries maps label
+    stem -> (offset, length) in the chunk's shard.
+    """
+    table, coco_to_yolo, img_ids, file_names, labels_dir, previous_hashes, shard_path = task
+    texts, class_counts = build_label_texts(table, coco_to_yolo, img_ids)
+
+    written = {}
+    label_bytes = {}
+    shard_entries = {}
+    if shard_path is not None:
+        # Sharded mode rewrites the whole shard: concatenate the chunk's labels
+        offset = 0
+        with open(shard_path, 'wb') as f:
+            for img_id in img_ids:
+                data = texts[img_id].encode()
+                f.write(data)
+                shard_entries[_label_stem(file_names[img_id])] = (offset, len(data))
+                offset += len(data)
+                written[img_id] = content_hash(data)
+                label_bytes[img_id] = len(data)
+    else:
+        labels_dir = Path(labels_dir)
+        for img_id in img_ids:
+            text = texts[img_id]
+            label_hash = content_hash(text)
+            label_bytes[img_id] = len(text)
+            label_path = labels_dir / (_label_stem(file_names[img_id]) + '.txt')
+            if previous_hashes.get(img_id) != label_hash or not label_path.exists():
+                with open(label_path, 'w') as f:
+                    f.write(text)
+                written[img_id] = label_hash
+    return class_counts, written, label_bytes, shard_entries
+
+
+def write_labels(table, coco_to_yolo, img_ids, file_names, labels_dir,
+                 previous_hashes=None, processes=1, shards=0):
+    """
+    Convert and write the labels of img_ids, optionally in parallel and/or sharded.
+
+    Args:
+        table: Annotation table (yolo_labels.build_annotation_table format)
+        coco_to_yolo: Mapping of COCO category id -> YOLO class id
+        img_ids: Image ids to write labels for
+        file_names: Mapping of image id -> image file name
+        labels_dir: Per-file label directory (labels/<split>)
+        previous_hashes: Mapping of image id -> label hash from the last run; unchanged
+            per-file labels are not rewritten
+        processes: Number of worker processes (1 = run in this process)
+        shards: If > 0, write this many shard files instead of one file per image
+
+    Returns:
+        Tuple (class_counts, written_hashes, label_bytes): merged per-class instance
+        counts, {image id: label hash} for every label that was written and
+        {image id: label size in bytes} for every image.
+    """
+    previous_hashes = previous_hashes or {}
+    img_ids = np.sort(np.asarray(list(img_ids), dtype=np.int64))
+    table = select_rows(table, np.isin(table['image_id'], img_ids))
+    num_chunks = shards if shards > 0 else max(1, processes * 4)
+    shard_dir = shard_dir_for(labels_dir)
+    if shards > 0:
+        shard_dir.mkdir(parents=True, exist_ok=True)
+
+    # img_ids is sorted, so each chunk is a contiguous id range and every
+    # annotation row can be assigned to its chunk with one searchsorted
+    chunks = np.array_split(img_ids, num_chunks)
+    chunk_starts = np.array([c[0] if len(c) else np.iinfo(np.int64).max for c in chunks], dtype=np.int64)
+    row_chunk = np.searchsorted(chunk_starts, table['image_id'], side='right') - 1
+
+    tasks = []
+    for chunk_idx, chunk in enumerate(chunks):
+        if len(chunk) == 0 and shards == 0:
+            continue
+        chunk_ids = chunk.tolist()
+        tasks.append((
+            select_rows(table, row_chunk == chunk_idx),
+            coco_to_yolo,
+            chunk_ids,
+            {img_id: file_names[img_id] for img_id in chunk_ids},
+            str(labels_dir),
+            {img_id: previous_hashes[img_id] for img_id in chunk_ids if img_id in previous_hashes},
+            str(shard_dir / f"shard-{chunk_idx:05d}.txt") if shards > 0 else None,
+        ))
+
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_write_chunk, tasks))
+    else:
+        results = [_write_chunk(task) for task in tasks]
+
+    class_counts = np.zeros(len(coco_to_yolo), dtype=np.int64)
+    written = {}
+    label_bytes = {}
+    shard_index = {}
+    for chunk_idx, (chunk_counts, chunk_written, chunk_bytes, shard_entries) in enumerate(results):
+        class_counts += chunk_counts
+        written.update(chunk_written)
+        label_bytes.update(chunk_bytes)
+        for stem, (offset, length) in shard_entries.items():
+            shard_index[stem] = [chunk_idx, offset, length]
+
+    if shards > 0:
+        index = {
+            'shards': [Path(task[6]).name for task in tasks],
+            'labels': shard_index,
+        }
+        with open(shard_dir / SHARD_INDEX_NAME, 'w') as f:
+            json.dump(index, f)
+    return class_counts, written, label_bytes
+
+
+def read_sharded_label(shard_dir, stem, index=None):
+    """
+    Return the label text of one image from a sharded label directory.
+
+    Args:
+        shard_dir: labels/<split>_shards directory
+        stem: Image file name without extension
+        index: Parsed index.json (pass it in when reading many labels)
+    """
+    shard_dir = Path(shard_dir)
+    if index is None:
+        with open(shard_dir / SHARD_INDEX_NAME) as f:
+            index = json.load(f)
+    shard_idx, offset, length = index['labels'][stem]
+    with open(shard_dir / index['shards'][shard_idx], 'rb') as f:
+        f.seek(offset)
+        return f.read(length).decode()
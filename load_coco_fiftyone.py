@@ -1,56 +1,105 @@
-import fiftyone as fo
+import argparse
+from pathlib import Path
+
+from dataset_cache import directory_fingerprint, load_or_create_dataset
+from run_report import RunReport, report_path_for
 
 name = "coco-local"
-dataset_dir = "/Users/carolina1650/fiftyone-coco-project/quickstart"
-
-if name in fo.list_datasets():
-    fo.delete_dataset(name)
-
-dataset = fo.Dataset.from_dir(
-    dataset_dir=dataset_dir,
-    dataset_type=fo.types.FiftyOneDataset,
-    name=name,
-)
-
-# Filter for samples with car, person, or bicycle annotations
-target_labels = ["car", "person", "bicycle"]
-
-# Filter samples that have at least one detection with the target labels
-filtered_view = dataset.filter_labels(
-    "ground_truth", 
-    fo.ViewField("label").is_in(target_labels)
-).match(
-    fo.ViewField("ground_truth.detections").length() > 0
-)
-
-# Count all detections by label in the original dataset
-output_file = "classes_result_200.txt"
-
-with open(output_file, 'w') as f:
-    # Write to both console and file
-    def write_output(text):
-        print(text)
-        f.write(text + '\n')
-    
-    write_output("=== Label Counts in Original Dataset ===")
-    label_counts = dataset.count_values("ground_truth.detections.label")
-    write_output(f"Total samples: {len(dataset)}")
-    write_output(f"\nAll labels found:")
-    for label, count in sorted(label_counts.items(), key=lambda x: x[1], reverse=True):
-        write_output(f"  {label}: {count}")
-    
-    # Count target label detections
-    total_target_detections = sum(label_counts.get(label, 0) for label in target_labels)
-    write_output(f"\n=== Target Labels (car, person, bicycle) ===")
-    for label in target_labels:
-        count = label_counts.get(label, 0)
-        write_output(f"  {label}: {count}")
-    write_output(f"Total target detections: {total_target_detections}")
-    write_output(f"Filtered samples (images with target labels): {len(filtered_view)}")
-    
-    write_output("\n=== Filtered Dataset Info ===")
-    write_output(str(filtered_view))
-
-print(f"\nResults saved to: {output_file}")
-print("\nSample data:")
-print(filtered_view.head())
+DEFAULT_DATASET_DIR = str(Path(__file__).resolve().parent / "quickstart")
+TARGET_LABELS = ["car", "person", "bicycle"]
+
+
+def analyze_local(dataset_dir=DEFAULT_DATASET_DIR, output_file="classes_result_200.txt",
+                  target_labels=None):
+    """
+    Import a FiftyOneDataset export and count the target labels in it.
+
+    Args:
+        dataset_dir: Directory of the exported FiftyOneDataset (e.g. quickstart/)
+        output_file: Result text file (the run report is saved next to it)
+        target_labels: Labels to filter for (default: car, person, bicycle)
+    """
+    import fiftyone as fo
+
+    if target_labels is None:
+        target_labels = TARGET_LABELS
+    report = RunReport("load_coco_fiftyone", {"source": dataset_dir})
+
+    # Reuse the persistent dataset unless the files in dataset_dir changed
+    with report.stage("fiftyone_import") as record:
+        dataset, reused = load_or_create_dataset(
+            name,
+            {"source": dataset_dir, "dataset_type": "FiftyOneDataset"},
+            lambda: directory_fingerprint(dataset_dir),
+            lambda dataset_name: fo.Dataset.from_dir(
+                dataset_dir=dataset_dir,
+                dataset_type=fo.types.FiftyOneDataset,
+                name=dataset_name,
+            ),
+        )
+        record['reused'] = reused
+        record['items'] = len(dataset)
+    print(f"{'Reusing' if reused else 'Imported'} dataset: {dataset.name}")
+
+    # Filter samples that have at least one detection with the target labels
+    filtered_view = dataset.filter_labels(
+        "ground_truth",
+        fo.ViewField("label").is_in(target_labels)
+    ).match(
+        fo.ViewField("ground_truth.detections").length() > 0
+    )
+
+    # Count all detections by label in the original dataset
+    with open(output_file, 'w') as f:
+        # Write to both console and file
+        def write_output(text):
+            print(text)
+            f.write(text + '\n')
+
+        write_output("=== Label Counts in Original Dataset ===")
+        with report.stage("aggregation[count_values]") as record:
+            label_counts = dataset.count_values("ground_truth.detections.label")
+            record['items'] = sum(label_counts.values())
+        write_output(f"Total samples: {len(dataset)}")
+        write_output(f"\nAll labels found:")
+        for label, count in sorted(label_counts.items(), key=lambda x: x[1], reverse=True):
+            write_output(f"  {label}: {count}")
+
+        # Count target label detections
+        total_target_detections = sum(label_counts.get(label, 0) for label in target_labels)
+        write_output(f"\n=== Target Labels ({', '.join(target_labels)}) ===")
+        for label in target_labels:
+            count = label_counts.get(label, 0)
+            write_output(f"  {label}: {count}")
+        write_output(f"Total target detections: {total_target_detections}")
+        with report.stage("aggregation[filtered_count]") as record:
+            record['items'] = len(filtered_view)
+        write_output(f"Filtered samples (images with target labels): {record['items']}")
+
+        write_output("\n=== Filtered Dataset Info ===")
+        write_output(str(filtered_view))
+
+    print(f"\nResults saved to: {output_file}")
+    print(f"Run report saved to: {report.save(report_path_for(output_file))}")
+    print("\nSample data:")
+    print(filtered_view.head())
+
+
+def main(argv=None, prog=None):
+    """Command-line entry point; argv and prog are set when run through coco_cli.py."""
+    parser = argparse.ArgumentParser(prog=prog, description="Count target labels in a local FiftyOne dataset export")
+    parser.add_argument('--dataset-dir', type=str, default=DEFAULT_DATASET_DIR,
+                        help='Exported FiftyOneDataset directory (default: quickstart/ next to this script)')
+    parser.add_argument('--classes', nargs='+', default=TARGET_LABELS,
+                        help='Labels to filter for')
+    parser.add_argument('--output', type=str, default='classes_result_200.txt',
+                        help='Result text file')
+    args = parser.parse_args(argv)
+
+    if not Path(args.dataset_dir).is_dir():
+        parser.error(f"Dataset directory not found: {args.dataset_dir}")
+    analyze_local(args.dataset_dir, args.output, args.classes)
+
+
+if __name__ == "__main__":
+    main()
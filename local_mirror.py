@@ -0,0 +1,119 @@
+"""
+Local COCO mirror support for download_coco_filtered.py.
+
+On clusters without internet access the selected images are resolved in an
+existing COCO tree (e.g. /shared/coco/train2017/) and linked into
+images/<split> instead of being downloaded. No network access happens in
+this mode, so building the filtered set is a metadata-only operation.
+
+Link modes:
+    symlink   symbolic link to the mirror file (default, like COCO_BALANCING.md)
+    hardlink  hard link; falls back to a reflink/copy across filesystems
+    reflink   copy-on-write clone where the filesystem supports it, else a copy
+"""
+
+import os
+import errno
+import shutil
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+
+LINK_MODES = ('symlink', 'hardlink', 'reflink')
+
+# Linux ioctl that clones a file's extents (btrfs, XFS with reflink, ...)
+FICLONE = 0x40049409
+
+
+def mirror_dir(source_root, split):
+    """Directory holding the split's images: <root>/<split> if it exists, else <root>."""
+    source_root = Path(source_root)
+    split_dir = source_root / split
+    return split_dir if split_dir.is_dir() else source_root
+
+
+def reflink_copy(src, dest):
+    """Clone src to dest with FICLONE if possible, otherwise do a regular copy."""
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(src, dest)
+
+
+def link_image(src, dest, mode="symlink"):
+    """
+    Link (or clone) one image into place.
+
+    The link is created under a temporary name and renamed over dest, so stale
+    or broken links at dest are replaced atomically.
+    """
+    dest = Path(dest)
+    tmp = dest.with_name(f".{dest.name}.{threading.get_ident()}.part")
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+    if mode == "symlink":
+        os.symlink(os.path.abspath(src), tmp)
+    elif mode == "hardlink":
+        try:
+            os.link(src, tmp)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            # Hard links cannot cross filesystems: clone or copy instead
+            reflink_copy(src, tmp)
+    elif mode == "reflink":
+        reflink_copy(src, tmp)
+    else:
+        raise ValueError(f"Unknown link mode '{mode}', expected one of {LINK_MODES}")
+    os.replace(tmp, dest)
+
+
+def link_from_mirror(jobs, source_root, split, mode="symlink", workers=8):
+    """
+    Resolve and link images from a local COCO mirror.
+
+    Args:
+        jobs: Iterable of (key, file_name, dest) tuples
+        source_root: Root of the local COCO tree (containing <split>/ or the images directly)
+        split: Split name, e.g. 'train2017'
+        mode: One of LINK_MODES
+        workers: Threads used to create links (helps on network filesystems)
+
+    Returns:
+        Tuple (linked, missing, failed): linked is a list of keys, missing a list of
+        (key, file_name) not present in the mirror and failed maps key -> error.
+    """
+    directory = mirror_dir(source_root, split)
+    # One directory listing instead of a stat per image
+    available = {entry.name for entry in os.scandir(directory) if entry.is_file()}
+
+    tasks = []
+    missing = []
+    for key, file_name, dest in jobs:
+        if file_name in available:
+            tasks.append((key, directory / file_name, dest))
+        else:
+            missing.append((key, file_name))
+
+    def run(task):
+        key, src, dest = task
+        try:
+            link_image(src, dest, mode)
+            return key, None
+        except OSError as e:
+            return key, str(e)
+
+    linked = []
+    failed = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for key, error in pool.map(run, tasks):
+            if error is None:
+                linked.append(key)
+            else:
+                failed[key] = error
+    return linked, missing, failed
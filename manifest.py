@@ -0,0 +1,174 @@
+"""
+Per-image manifest for resumable, incremental runs of download_coco_filtered.py.
+
+The manifest is a small SQLite database in the output directory. For every
+image of every split it records the download status, the image file's size,
+mtime and checksum, and a hash of the label file that was last written. A
+re-run uses it to fetch only missing or failed images, to re-hash only image
+files whose size or mtime changed, and to rewrite only label files whose
+content would change. It also keeps the image selection of the latest run, so
+files left over from an earlier, wider selection can be told apart.
+"""
+
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+
+
+MANIFEST_NAME = "manifest.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    split TEXT NOT NULL,
+    image_id INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    checksum TEXT,
+    label_hash TEXT,
+    error TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (split, image_id)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    split TEXT NOT NULL,
+    classes TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    selected INTEGER,
+    downloaded INTEGER,
+    failed INTEGER,
+    labels_written INTEGER
+);
+CREATE TABLE IF NOT EXISTS selection (
+    split TEXT NOT NULL,
+    image_id INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    PRIMARY KEY (split, image_id)
+);
+"""
+
+
+def content_hash(data):
+    """Short BLAKE2 hex digest of bytes or text, as stored in the manifest."""
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """Checksum of a file's contents, comparable with image_fetch checksums."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    SQLite-backed record of per-image download and label state.
+
+    Args:
+        output_dir: Dataset output directory; the database is <output_dir>/manifest.sqlite
+        name: Database file name (multi-node shards each keep their own)
+    """
+
+    def __init__(self, output_dir, name=MANIFEST_NAME):
+        self.path = Path(output_dir) / name
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def records(self, split):
+        """Return {image_id: row dict} for every image recorded for a split."""
+        self.conn.row_factory = sqlite3.Row
+        try:
+            rows = self.conn.execute("SELECT * FROM images WHERE split = ?", (split,)).fetchall()
+        finally:
+            self.conn.row_factory = None
+        return {row['image_id']: dict(row) for row in rows}
+
+    def record_images(self, split, entries):
+        """
+        Upsert the image state of many images in one transaction.
+
+        Args:
+            split: Split name
+            entries: Iterable of dicts with 'image_id', 'file_name', 'status' and
+                optionally 'size', 'mtime_ns', 'checksum', 'error'
+        """
+        now = time.time()
+        rows = [
+            (split, e['image_id'], e['file_name'], e['status'], e.get('size'), e.get('mtime_ns'),
+             e.get('checksum'), e.get('error'), now)
+            for e in entries
+        ]
+        with self.conn:
+            self.conn.executemany(
+                """INSERT INTO images (split, image_id, file_name, status, size, mtime_ns, checksum, error, updated)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (split, image_id) DO UPDATE SET
+                       file_name = excluded.file_name, status = excluded.status, size = excluded.size,
+                       mtime_ns = excluded.mtime_ns, checksum = excluded.checksum,
+                       error = excluded.error, updated = excluded.updated""",
+                rows,
+            )
+
+    def record_labels(self, split, label_hashes):
+        """Store the hash of the label file written for each image id."""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE images SET label_hash = ?, updated = ? WHERE split = ? AND image_id = ?",
+                [(label_hash, now, split, img_id) for img_id, label_hash in label_hashes.items()],
+            )
+
+    def record_selection(self, split, file_names):
+        """Replace the split's recorded selection with {image_id: file_name} of the current run."""
+        with self.conn:
+            self.conn.execute("DELETE FROM selection WHERE split = ?", (split,))
+            self.conn.executemany(
+                "INSERT INTO selection (split, image_id, file_name) VALUES (?, ?, ?)",
+                [(split, img_id, file_name) for img_id, file_name in file_names.items()],
+            )
+
+    def selection(self, split):
+        """Return {image_id: file_name} of the images the latest run selected for a split."""
+        rows = self.conn.execute(
+            "SELECT image_id, file_name FROM selection WHERE split = ?", (split,)
+        ).fetchall()
+        return dict(rows)
+
+    def start_run(self, split, classes):
+        """Record the start of a run and return its id."""
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs (split, classes, started) VALUES (?, ?, ?)",
+                (split, ",".join(classes), time.time()),
+            )
+        return cur.lastrowid
+
+    def finish_run(self, run_id, selected, downloaded, failed, labels_written):
+        """Record the per-run processing counts."""
+        with self.conn:
+            self.conn.execute(
+                """UPDATE runs SET finished = ?, selected = ?, downloaded = ?, failed = ?, labels_written = ?
+                   WHERE id = ?""",
+                (time.time(), selected, downloaded, failed, labels_written, run_id),
+            )
@@ -0,0 +1,316 @@
+"""
+Pack a filtered YOLO dataset into large tar shards (WebDataset layout).
+
+download_coco_filtered.py produces images/<split>/*.jpg and
+labels/<split>/*.txt, i.e. hundreds of thousands of small files whose
+metadata traffic starves dataloaders on shared cluster filesystems. This
+export stage packs each image and its YOLO label lines into sequential tar
+shards of a configurable size:
+
+    <export>/<split>-00000.tar   000000000139.jpg, 000000000139.txt, ...
+    <export>/index.json          stem -> [shard, jpg offset, jpg size, txt offset, txt size]
+    <export>/dataset.yaml        dataset.yaml-style manifest listing the shards
+
+Samples sharing a key (the file stem) form one WebDataset sample, so the
+shards can be streamed sequentially with webdataset or plain tarfile; the
+index allows random access with one seek per member (read_packed_sample).
+
+Labels are read from labels/<split>/ or from the sharded labels in
+labels/<split>_shards/ (download_coco_filtered.py --label-shards). If both
+exist, the latest run report of the dataset decides which one is current
+(see resolve_label_source).
+"""
+
+import io
+import os
+import json
+import tarfile
+import argparse
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from label_writer import SHARD_INDEX_NAME, read_sharded_label, shard_dir_for
+from run_report import RunReport
+
+
+PACKED_INDEX_NAME = "index.json"
+LABEL_SOURCES = ('auto', 'files', 'shards')
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def _padded(size):
+    """Size of a tar member's data rounded up to whole 512-byte blocks."""
+    return (size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE
+
+
+def resolve_label_source(dataset_dir, split, label_source='auto'):
+    """
+    Decide whether labels are read from per-image files or from label shards.
+
+    'auto' takes the only source that exists. If labels/<split>/ and
+    labels/<split>_shards/ both hold labels, one of them is left over from an
+    earlier run; the label_shards setting in the dataset's run_report.json
+    decides if that report is for this split, otherwise ValueError is raised.
+
+    Args:
+        dataset_dir: Output directory of download_coco_filtered.py
+        split: 'val2017' or 'train2017'
+        label_source: 'auto', 'files' or 'shards'
+
+    Returns:
+        'files' or 'shards'
+    """
+    labels_dir = Path(dataset_dir) / "labels" / split
+    shard_dir = shard_dir_for(labels_dir)
+    has_shards = (shard_dir / SHARD_INDEX_NAME).exists()
+    if label_source == 'shards' and not has_shards:
+        raise ValueError(f"No label shards found in {shard_dir}")
+    if label_source != 'auto':
+        return label_source
+    if not has_shards:
+        return 'files'
+    has_files = False
+    if labels_dir.is_dir():
+        with os.scandir(labels_dir) as entries:
+            has_files = any(entry.name.endswith('.txt') for entry in entries)
+    if not has_files:
+        return 'shards'
+
+    report_file = Path(dataset_dir) / "run_report.json"
+    if report_file.exists():
+        with open(report_file) as f:
+            params = json.load(f).get('params', {})
+        if params.get('split') == split and 'label_shards' in params:
+            return 'shards' if params['label_shards'] else 'files'
+    raise ValueError(f"Both {labels_dir} and {shard_dir} contain labels and {report_file} does not "
+                     f"tell which the last {split} run wrote; choose with --label-source files|shards")
+
+
+class _LabelSource:
+    """Reads label text from labels/<split>/ ('files') or labels/<split>_shards/ ('shards')."""
+
+    def __init__(self, labels_dir, source):
+        self.labels_dir = Path(labels_dir)
+        self.shard_dir = shard_dir_for(labels_dir)
+        self.shard_index = None
+        if source == 'shards':
+            with open(self.shard_dir / SHARD_INDEX_NAME) as f:
+                self.shard_index = json.load(f)
+
+    def read(self, stem):
+        """Label text of an image; images without labels are YOLO background images ('')."""
+        if self.shard_index is not None:
+            if stem not in self.shard_index['labels']:
+                return ""
+            return read_sharded_label(self.shard_dir, stem, self.shard_index)
+        try:
+            with open(self.labels_dir / f"{stem}.txt") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+
+def _read_sample(args):
+    image_path, stem, labels = args
+    with open(image_path, 'rb') as f:
+        image = f.read()
+    return stem, image, labels.read(stem).encode()
+
+
+class _ShardWriter:
+    """Appends samples to numbered tar shards, starting a new one at the size limit."""
+
+    def __init__(self, export_dir, split, max_bytes):
+        self.export_dir = Path(export_dir)
+        self.split = split
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.index = {}
+        self.tar = None
+        self.tmp_path = None
+
+    def _open(self):
+        name = f"{self.split}-{len(self.shards):05d}.tar"
+        self.shards.append(name)
+        self.tmp_path = self.export_dir / f".{name}.part"
+        self.tar = tarfile.open(self.tmp_path, 'w', format=tarfile.USTAR_FORMAT)
+
+    def _close(self):
+        if self.tar is not None:
+            self.tar.close()
+            os.replace(self.tmp_path, self.export_dir / self.shards[-1])
+            self.tar = None
+
+    def _add_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+        # The member data ends the padded block run addfile just wrote
+        return self.tar.offset - _padded(len(data))
+
+    def add(self, stem, image, label):
+        sample_bytes = 2 * BLOCK_SIZE + _padded(len(image)) + _padded(len(label))
+        if self.tar is None or (self.tar.offset > 0 and self.tar.offset + sample_bytes > self.max_bytes):
+            self._close()
+            self._open()
+        image_offset = self._add_member(f"{stem}.jpg", image)
+        label_offset = self._add_member(f"{stem}.txt", label)
+        self.index[stem] = [len(self.shards) - 1, image_offset, len(image), label_offset, len(label)]
+
+    def close(self):
+        self._close()
+
+
+def pack_dataset(dataset_dir, split, export_dir, shard_size_mb=1024, shuffle=False, seed=0, workers=8,
+                 label_source='auto'):
+    """
+    Pack images and YOLO labels of a split into tar shards with a random-access index.
+
+    Args:
+        dataset_dir: Output directory of download_coco_filtered.py
+        split: 'val2017' or 'train2017'
+        export_dir: Directory receiving the shards, index.json and dataset.yaml
+        shard_size_mb: Target maximum shard size in MB (plus tar end padding; a single
+            larger sample gets its own shard)
+        shuffle: Shuffle samples across shards (deterministic for a seed)
+        seed: Shuffle seed
+        workers: Threads reading image and label files ahead of the writer
+        label_source: 'files', 'shards' or 'auto' (see resolve_label_source)
+
+    Returns:
+        Dict with 'shards', 'num_samples' and 'bytes'
+    """
+    dataset_dir = Path(dataset_dir)
+    export_dir = Path(export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    images_dir = dataset_dir / "images" / split
+    label_source = resolve_label_source(dataset_dir, split, label_source)
+    labels = _LabelSource(dataset_dir / "labels" / split, label_source)
+    report = RunReport("pack_shards", {'dataset_dir': str(dataset_dir), 'split': split,
+                                       'shard_size_mb': shard_size_mb, 'shuffle': shuffle, 'seed': seed,
+                                       'label_source': label_source})
+
+    with report.stage('scan') as record:
+        image_names = sorted(entry.name for entry in os.scandir(images_dir)
+                             if entry.name.endswith('.jpg') and not entry.name.startswith('.'))
+        record['items'] = len(image_names)
+    if shuffle:
+        order = np.random.default_rng(seed).permutation(len(image_names))
+        image_names = [image_names[i] for i in order.tolist()]
+
+    print(f"Packing {len(image_names)} samples from {images_dir} into {export_dir} "
+          f"(shards of up to {shard_size_mb} MB, labels from {label_source})...")
+    writer = _ShardWriter(export_dir, split, shard_size_mb * 1024 * 1024)
+    total_bytes = 0
+    batch_size = max(64, workers * 16)
+    with report.stage('pack', workers=workers) as record, ThreadPoolExecutor(max_workers=workers) as pool:
+        # Files are read ahead in ordered batches so memory stays bounded
+        for start in range(0, len(image_names), batch_size):
+            batch = [(images_dir / name, Path(name).stem, labels) for name in image_names[start:start + batch_size]]
+            for stem, image, label in pool.map(_read_sample, batch):
+                writer.add(stem, image, label)
+                total_bytes += len(image) + len(label)
+        writer.close()
+        record['items'] = len(writer.index)
+        record['bytes'] = total_bytes
+
+    with open(export_dir / PACKED_INDEX_NAME, 'w') as f:
+        json.dump({'shards': writer.shards, 'samples': writer.index}, f)
+    write_packed_manifest(dataset_dir, export_dir, split, writer.shards, len(writer.index))
+
+    for key, value in (('shards', len(writer.shards)), ('num_samples', len(writer.index)), ('bytes', total_bytes)):
+        report.count(key, value)
+    report.save(export_dir / "run_report.json")
+    return {'shards': writer.shards, 'num_samples': len(writer.index), 'bytes': total_bytes}
+
+
+def write_packed_manifest(dataset_dir, export_dir, split, shards, num_samples):
+    """Write a dataset.yaml-style manifest for the shards (class names from classes.txt)."""
+    with open(Path(dataset_dir) / "classes.txt") as f:
+        names = [line.strip() for line in f if line.strip()]
+    pattern = f"{split}-{{00000..{len(shards) - 1:05d}}}.tar" if shards else ""
+    yaml_content = f"""# COCO Filtered Dataset (packed WebDataset shards)
+path: {Path(export_dir).absolute()}
+format: webdataset
+train: {pattern}
+val: {pattern}
+index: {PACKED_INDEX_NAME}
+num_samples: {num_samples}
+shards: {shards}
+
+nc: {len(names)}
+names: {names}
+"""
+    yaml_file = Path(export_dir) / "dataset.yaml"
+    with open(yaml_file, 'w') as f:
+        f.write(yaml_content)
+    return yaml_file
+
+
+def read_packed_sample(export_dir, stem, index=None):
+    """
+    Return (image bytes, label text) of one sample from packed shards.
+
+    Args:
+        export_dir: Directory written by pack_dataset
+        stem: Image file name without extension
+        index: Parsed index.json (pass it in when reading many samples)
+    """
+    export_dir = Path(export_dir)
+    if index is None:
+        with open(export_dir / PACKED_INDEX_NAME) as f:
+            index = json.load(f)
+    shard_idx, image_offset, image_size, label_offset, label_size = index['samples'][stem]
+    with open(export_dir / index['shards'][shard_idx], 'rb') as f:
+        f.seek(image_offset)
+        image = f.read(image_size)
+        f.seek(label_offset)
+        label = f.read(label_size).decode()
+    return image, label
+
+
+def main(argv=None, prog=None):
+    """Command-line entry point; argv and prog are set when run through coco_cli.py."""
+    parser = argparse.ArgumentParser(prog=prog, description="Pack a filtered YOLO dataset into tar shards")
+    parser.add_argument('--input', type=str, default='./coco_filtered',
+                        help='Output directory of download_coco_filtered.py')
+    parser.add_argument('--split', type=str, default='val2017',
+                        choices=['val2017', 'train2017'],
+                        help='Split to pack')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Export directory (default: <input>/packed/<split>)')
+    parser.add_argument('--shard-size', type=int, default=1024,
+                        help='Maximum shard size in MB')
+    parser.add_argument('--shuffle', action='store_true',
+                        help='Shuffle samples across shards')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Shuffle seed')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Threads reading image and label files')
+    parser.add_argument('--label-source', type=str, default='auto', choices=LABEL_SOURCES,
+                        help='Read labels from labels/<split>/ (files) or labels/<split>_shards/ (shards); '
+                             'auto uses the one the last download run wrote')
+    args = parser.parse_args(argv)
+
+    if not (Path(args.input) / "images" / args.split).is_dir():
+        parser.error(f"No images found in {Path(args.input) / 'images' / args.split}")
+    if args.shard_size < 1:
+        parser.error("--shard-size must be at least 1 MB")
+    try:
+        label_source = resolve_label_source(args.input, args.split, args.label_source)
+    except ValueError as e:
+        parser.error(str(e))
+    export_dir = args.output or str(Path(args.input) / "packed" / args.split)
+    result = pack_dataset(args.input, args.split, export_dir, shard_size_mb=args.shard_size,
+                          shuffle=args.shuffle, seed=args.seed, workers=args.workers,
+                          label_source=label_source)
+    print(f"\nPacked {result['num_samples']} samples ({result['bytes'] / 1e6:.1f} MB) "
+          f"into {len(result['shards'])} shards")
+    print(f"Index: {Path(export_dir) / PACKED_INDEX_NAME}")
+    print(f"Manifest: {Path(export_dir) / 'dataset.yaml'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Quota-driven image sampler for the COCO balancing patch.
+
+Given per-class instance targets (e.g. bicycle=3000, person=5000, car=0), pick
+a small subset of images whose annotations meet every target, so COCO only
+adds as many instances as the combined dataset needs. Selection is a lazy
+greedy set-multicover over a precomputed image x class count matrix: each
+step takes the image that covers the most still-missing instances. The
+coverage gain of an image can only shrink as targets fill up, so stale heap
+entries are re-scored only when they reach the top.
+"""
+
+import heapq
+import numpy as np
+
+
+def parse_quota(specs, class_names):
+    """
+    Parse CLI quota specs like ['bicycle=3000', 'person=+5000'] into {class: target}.
+
+    Classes that are not mentioned get a target of 0 (no requirement).
+    """
+    quota = {name: 0 for name in class_names}
+    for spec in specs:
+        name, sep, value = spec.partition('=')
+        if not sep:
+            raise ValueError(f"Invalid quota '{spec}', expected <class>=<instances>")
+        if name not in quota:
+            raise ValueError(f"Quota class '{name}' is not one of the target classes {list(class_names)}")
+        quota[name] = int(value.lstrip('+'))
+        if quota[name] < 0:
+            raise ValueError(f"Quota for '{name}' must be >= 0")
+    return quota
+
+
+def image_class_matrix(image_ids, ann_image_ids, ann_category_ids, cat_ids):
+    """
+    Count annotations per (image, class).
+
+    Args:
+        image_ids: Sorted array of candidate image ids (matrix rows)
+        ann_image_ids: Image id of every annotation
+        ann_category_ids: Category id of every annotation
+        cat_ids: Category ids (matrix columns, in this order)
+
+    Returns:
+        len(image_ids) x len(cat_ids) int64 count matrix
+    """
+    image_ids = np.asarray(image_ids, dtype=np.int64)
+    cat_ids = np.asarray(cat_ids, dtype=np.int64)
+    col_order = np.argsort(cat_ids)
+    cols = col_order[np.searchsorted(cat_ids, ann_category_ids, sorter=col_order)]
+    rows = np.searchsorted(image_ids, ann_image_ids)
+    keep = (rows < len(image_ids)) & (image_ids[np.minimum(rows, len(image_ids) - 1)] == ann_image_ids)
+    flat = rows[keep] * len(cat_ids) + cols[keep]
+    counts = np.bincount(flat, minlength=len(image_ids) * len(cat_ids))
+    return counts.reshape(len(image_ids), len(cat_ids)).astype(np.int64)
+
+
+def select_by_quota(counts, targets):
+    """
+    Greedily select rows of counts until every column reaches its target.
+
+    Args:
+        counts: Images x classes instance count matrix
+        targets: Per-class instance targets (0 = no requirement)
+
+    Returns:
+        Tuple (selected, achieved): selected row indices in pick order and the
+        per-class instance totals of the selection.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    remaining = np.asarray(targets, dtype=np.int64).copy()
+    achieved = np.zeros(counts.shape[1], dtype=np.int64)
+    selected = []
+
+    gains = np.minimum(counts, remaining).sum(axis=1)
+    # Prefer images that bring fewer instances of classes we do not need
+    surplus = counts.sum(axis=1) - gains
+    heap = [(-int(g), int(sp), int(i)) for i, (g, sp) in enumerate(zip(gains, surplus)) if g > 0]
+    heapq.heapify(heap)
+
+    while heap and remaining.any():
+        neg_gain, _, i = heapq.heappop(heap)
+        gain = int(np.minimum(counts[i], remaining).sum())
+        if gain == 0:
+            continue
+        if gain < -neg_gain:
+            # Stale score: push back with the updated gain and try the next best
+            heapq.heappush(heap, (-gain, int(counts[i].sum()) - gain, i))
+            continue
+        selected.append(i)
+        achieved += counts[i]
+        remaining = np.maximum(remaining - counts[i], 0)
+    return np.array(selected, dtype=np.int64), achieved
@@ -0,0 +1,283 @@
+"""
+Pre-resized image cache at the training resolution.
+
+The trainer decodes every full-size COCO image and resizes it to the
+training resolution on each epoch, although the filtered set never changes
+between epochs. This stage does the resize once: a process pool decodes each
+image of images/<split>, scales it so its longer side equals the training
+size (aspect ratio kept, no padding) and re-encodes it into a cache keyed by
+the resolution:
+
+    <dataset>/resized/<imgsz>/images/<split>/*.jpg
+    <dataset>/resized/<imgsz>/labels/<split>  -> symlink to the original labels
+    <dataset>/resized/<imgsz>/dataset.yaml
+
+Because the images are only scaled, the normalized YOLO labels stay valid
+unchanged; the trainer's letterbox then only pads. Images already no larger
+than the target are hard-linked (or copied) instead of re-encoded. Each cached
+file carries its source's mtime, so re-runs skip images whose source is
+unchanged and only process new or modified ones; cached files whose source
+was removed (e.g. by image_dedup.py --remove) are deleted.
+"""
+
+import os
+import json
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from image_io import Image, decoder_available
+from local_mirror import link_image
+from run_report import RunReport
+
+
+CACHE_META_NAME = "cache_meta.json"
+CACHE_VERSION = 1
+
+
+def target_size(width, height, imgsz):
+    """(width, height) scaled so the longer side is imgsz; None if no downscale is needed."""
+    scale = imgsz / max(width, height)
+    if scale >= 1:
+        return None
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _resize_pil(src, dest, imgsz, quality):
+    with Image.open(src) as img:
+        size = target_size(img.width, img.height, imgsz)
+        if size is None:
+            return False
+        # JPEG draft mode decodes directly at a reduced scale (>= the target size)
+        img.draft('RGB', size)
+        img = img.convert('RGB').resize(size, Image.BILINEAR)
+        img.save(dest, 'JPEG', quality=quality)
+    return True
+
+
+def _resize_cv2(src, dest, imgsz, quality):
+    import cv2
+    # Keep the stored pixel layout (as Pillow does): labels refer to it, not to the EXIF orientation
+    img = cv2.imread(str(src), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        raise ValueError(f"Cannot decode {src}")
+    size = target_size(img.shape[1], img.shape[0], imgsz)
+    if size is None:
+        return False
+    img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError(f"Cannot encode {src}")
+    with open(dest, 'wb') as f:
+        f.write(data.tobytes())
+    return True
+
+
+def resize_image(src, dest, imgsz, quality=90):
+    """
+    Write src to dest with its longer side scaled down to imgsz.
+
+    The file is written under a temporary name and renamed into place, and it
+    gets the source's mtime so unchanged sources can be skipped later.
+
+    Returns:
+        'resized' or 'linked' (source already small enough)
+    """
+    dest = Path(dest)
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.part")
+    resize = _resize_pil if Image is not None else _resize_cv2
+    st = os.stat(src)
+    try:
+        resized = resize(src, tmp, imgsz, quality)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        raise
+    if resized:
+        os.replace(tmp, dest)
+        outcome = 'resized'
+    else:
+        # Renaming a hard link over another link to the same file is a no-op, so skip it
+        if not (os.path.exists(dest) and os.path.samefile(src, dest)):
+            link_image(os.path.realpath(src), dest, mode="hardlink")
+        outcome = 'linked'
+    os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return outcome
+
+
+def _resize_chunk(task):
+    """Worker: resize a chunk of images, returning ({outcome: count}, failed file names, bytes written)."""
+    names, images_dir, cache_images_dir, imgsz, quality = task
+    counts = {'resized': 0, 'linked': 0}
+    failed = []
+    written = 0
+    for name in names:
+        dest = Path(cache_images_dir) / name
+        try:
+            counts[resize_image(Path(images_dir) / name, dest, imgsz, quality)] += 1
+            written += dest.stat().st_size
+        except (OSError, ValueError):
+            failed.append(name)
+    return counts, failed, written
+
+
+def _is_current(src, dest):
+    try:
+        return os.stat(dest).st_mtime_ns == os.stat(src).st_mtime_ns
+    except OSError:
+        return False
+
+
+def cache_dir_for(dataset_dir, imgsz):
+    return Path(dataset_dir) / "resized" / str(imgsz)
+
+
+def build_resized_cache(dataset_dir, split, imgsz=640, quality=90, processes=1, cache_dir=None,
+                        chunk_size=64):
+    """
+    Resize the images of a split into the training-resolution cache.
+
+    Args:
+        dataset_dir: Output directory of download_coco_filtered.py
+        split: 'val2017' or 'train2017'
+        imgsz: Training resolution; the longer image side is scaled down to this
+        quality: JPEG quality of re-encoded images
+        processes: Worker processes for decoding, resizing and encoding
+        cache_dir: Cache directory (default: <dataset_dir>/resized/<imgsz>)
+        chunk_size: Images per worker task
+
+    Returns:
+        Dict with 'num_images', 'resized', 'linked', 'unchanged', 'removed' and 'failed'
+    """
+    dataset_dir = Path(dataset_dir)
+    cache_dir = Path(cache_dir) if cache_dir is not None else cache_dir_for(dataset_dir, imgsz)
+    images_dir = dataset_dir / "images" / split
+    cache_images_dir = cache_dir / "images" / split
+    cache_images_dir.mkdir(parents=True, exist_ok=True)
+    report = RunReport("resize_cache", {'split': split, 'imgsz': imgsz, 'quality': quality,
+                                        'processes': processes})
+
+    # Cached files made with other settings cannot be reused
+    meta = {'version': CACHE_VERSION, 'imgsz': imgsz, 'quality': quality}
+    meta_file = cache_dir / CACHE_META_NAME
+    force = True
+    if meta_file.exists():
+        with open(meta_file) as f:
+            force = json.load(f) != meta
+
+    with report.stage('scan') as record:
+        names = sorted(entry.name for entry in os.scandir(images_dir)
+                       if entry.name.endswith('.jpg') and not entry.name.startswith('.'))
+        todo = [name for name in names
+                if force or not _is_current(images_dir / name, cache_images_dir / name)]
+        present = set(names)
+        stale = [entry.path for entry in os.scandir(cache_images_dir) if entry.name not in present]
+        for path in stale:
+            os.unlink(path)
+        record['items'] = len(names)
+
+    counts = {'resized': 0, 'linked': 0}
+    failed = []
+    with report.stage('resize', processes=processes, items=len(todo)) as record:
+        tasks = [(todo[start:start + chunk_size], str(images_dir), str(cache_images_dir), imgsz, quality)
+                 for start in range(0, len(todo), chunk_size)]
+        if processes > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = list(pool.map(_resize_chunk, tasks))
+        else:
+            results = [_resize_chunk(task) for task in tasks]
+        written = 0
+        for chunk_counts, chunk_failed, chunk_bytes in results:
+            for key, value in chunk_counts.items():
+                counts[key] += value
+            failed.extend(chunk_failed)
+            written += chunk_bytes
+        record['bytes'] = written
+    with open(meta_file, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    # YOLO finds labels by replacing 'images' with 'labels' in the image path
+    labels_link = cache_dir / "labels" / split
+    labels_link.parent.mkdir(parents=True, exist_ok=True)
+    if not os.path.lexists(labels_link):
+        os.symlink(os.path.relpath(dataset_dir.absolute() / "labels" / split, labels_link.parent.absolute()),
+                   labels_link)
+    write_cache_yaml(dataset_dir, cache_dir, split, imgsz)
+
+    result = {'num_images': len(names), 'resized': counts['resized'], 'linked': counts['linked'],
+              'unchanged': len(names) - len(todo), 'removed': len(stale), 'failed': len(failed)}
+    for key, value in result.items():
+        report.count(key, value)
+    if failed:
+        report.add_outliers('failed_images', {name: 1 for name in failed}, top=len(failed))
+    report.save(cache_dir / "run_report.json")
+    return result
+
+
+def write_cache_yaml(dataset_dir, cache_dir, split, imgsz):
+    """dataset.yaml for the cache (class names from the dataset's classes.txt)."""
+    with open(Path(dataset_dir) / "classes.txt") as f:
+        names = [line.strip() for line in f if line.strip()]
+    yaml_content = f"""# COCO Filtered Dataset (pre-resized to {imgsz})
+path: {Path(cache_dir).absolute()}
+train: images/{split}
+val: images/{split}
+
+nc: {len(names)}
+names: {names}
+"""
+    yaml_file = Path(cache_dir) / "dataset.yaml"
+    with open(yaml_file, 'w') as f:
+        f.write(yaml_content)
+    return yaml_file
+
+
+def main(argv=None, prog=None):
+    """Command-line entry point; argv and prog are set when run through coco_cli.py."""
+    parser = argparse.ArgumentParser(prog=prog, description="Build a pre-resized training-resolution image cache")
+    parser.add_argument('--input', type=str, default='./coco_filtered',
+                        help='Output directory of download_coco_filtered.py')
+    parser.add_argument('--split', type=str, default='val2017',
+                        choices=['val2017', 'train2017'],
+                        help='Split to resize')
+    parser.add_argument('--imgsz', type=int, default=640,
+                        help='Training resolution (longer image side)')
+    parser.add_argument('--quality', type=int, default=90,
+                        help='JPEG quality of resized images')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for decoding, resizing and encoding')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Cache directory (default: <input>/resized/<imgsz>)')
+    args = parser.parse_args(argv)
+
+    if not (Path(args.input) / "images" / args.split).is_dir():
+        parser.error(f"No images found in {Path(args.input) / 'images' / args.split}")
+    if not (Path(args.input) / "classes.txt").exists():
+        parser.error(f"No classes.txt in {args.input}; run download_coco_filtered.py first")
+    if args.imgsz < 32:
+        parser.error("--imgsz must be at least 32")
+    if not 1 <= args.quality <= 100:
+        parser.error("--quality must be between 1 and 100")
+    if not decoder_available():
+        parser.error("Resizing needs Pillow or OpenCV (pip install pillow)")
+
+    cache_dir = Path(args.output) if args.output else cache_dir_for(args.input, args.imgsz)
+    result = build_resized_cache(args.input, args.split, imgsz=args.imgsz, quality=args.quality,
+                                 processes=args.processes, cache_dir=cache_dir)
+    print(f"\n{'='*50}")
+    print(f"Resize Cache Summary")
+    print(f"{'='*50}")
+    print(f"Images: {result['num_images']}")
+    print(f"Resized: {result['resized']}")
+    print(f"Linked (already <= {args.imgsz}px): {result['linked']}")
+    print(f"Unchanged (skipped): {result['unchanged']}")
+    if result['removed']:
+        print(f"Removed (source gone): {result['removed']}")
+    if result['failed']:
+        print(f"Failed: {result['failed']} (see run_report.json)")
+    print(f"\nImages: {cache_dir / 'images' / args.split}")
+    print(f"YOLO dataset config saved to: {cache_dir / 'dataset.yaml'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Per-stage instrumentation and machine-readable run reports.
+
+Each script wraps its stages (annotation load, category resolution, image
+selection, download, label write, FiftyOne import, aggregations, ...) in
+RunReport.stage(). A stage records its wall time, item and byte counts
+(with the derived rates) and the process's peak memory, and the report also
+keeps per-item outliers such as the slowest downloads or the largest label
+files. save() writes everything as JSON next to the script's results, so
+runs on the cluster can be compared without attaching a profiler.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb(who="self"):
+    """
+    High-water RSS in MB of this process ('self') or its finished children ('children').
+
+    ru_maxrss is KB on Linux and bytes on macOS; returns None where it is unavailable.
+    """
+    if resource is None:
+        return None
+    rusage = resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN
+    rss = resource.getrusage(rusage).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _rounded(value, digits=1):
+    return round(value, digits) if value is not None else None
+
+
+def stage(report, name, **fields):
+    """report.stage(name) if a report is given, otherwise a no-op context yielding a dict."""
+    return report.stage(name, **fields) if report is not None else nullcontext({})
+
+
+class RunReport:
+    """
+    Collects stage measurements, counters and outliers for one script run.
+
+    Args:
+        name: Script or job name stored in the report
+        params: JSON-serializable run parameters (split, classes, workers, ...)
+    """
+
+    def __init__(self, name, params=None):
+        self.name = name
+        self.params = params or {}
+        self.started = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self._start = time.perf_counter()
+        self.stages = []
+        self.counters = {}
+        self.outliers = {}
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """
+        Time a stage and record its throughput and memory.
+
+        Yields the stage's record dict; set 'items' and/or 'bytes' on it (or pass
+        them as keyword arguments) to get items/sec and MB/s. Any other keys are
+        stored as-is.
+        """
+        record = {'name': name}
+        record.update(fields)
+        peak_before = peak_rss_mb()
+        children_before = peak_rss_mb("children")
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            record['seconds'] = round(seconds, 4)
+            items = record.get('items')
+            if items is not None:
+                record['items_per_sec'] = round(items / seconds, 1) if seconds > 0 else None
+            nbytes = record.get('bytes')
+            if nbytes is not None:
+                record['mb_per_sec'] = round(nbytes / seconds / 1e6, 2) if seconds > 0 else None
+            peak_after = peak_rss_mb()
+            record['peak_rss_mb'] = _rounded(peak_after)
+            # Growth of the high-water mark: non-zero only for stages that set a new peak
+            if peak_before is not None:
+                record['peak_rss_growth_mb'] = _rounded(peak_after - peak_before)
+            # Worker processes that finished during the stage (e.g. label writing pools)
+            children_after = peak_rss_mb("children")
+            if children_after is not None and children_after > children_before:
+                record['children_peak_rss_mb'] = _rounded(children_after)
+            self.stages.append(record)
+
+    def count(self, name, value):
+        """Set a run-level counter (e.g. images failed, labels unchanged)."""
+        self.counters[name] = value
+
+    def add_outliers(self, name, values, top=10, unit=None):
+        """
+        Keep the top entries of a {key: value} mapping, largest first.
+
+        Args:
+            name: Outlier list name, e.g. 'slowest_downloads'
+            values: Dict mapping an item (file name, image id, ...) to a number
+            top: Number of entries kept
+            unit: Optional unit stored with the list, e.g. 'seconds'
+        """
+        largest = sorted(values.items(), key=lambda item: item[1], reverse=True)[:top]
+        self.outliers[name] = {
+            'unit': unit,
+            'entries': [{'key': key, 'value': value} for key, value in largest],
+        }
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'started': self.started,
+            'total_seconds': round(time.perf_counter() - self._start, 4),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': self.params,
+            'peak_rss_mb': _rounded(peak_rss_mb()),
+            'stages': self.stages,
+            'counters': self.counters,
+            'outliers': self.outliers,
+        }
+
+    def save(self, path):
+        """Write the report as JSON (via a temporary file) and return the path."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        os.replace(tmp_path, path)
+        return path
+
+
+def report_path_for(result_file):
+    """Report path next to a result file: 'coco_result.txt' -> 'coco_result_report.json'."""
+    root, _ = os.path.splitext(str(result_file))
+    return f"{root}_report.json"
@@ -0,0 +1,101 @@
+"""
+Parity tests for coco_stream.StreamingCOCO against pycocotools.coco.COCO.
+"""
+
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(REPO_ROOT / "benchmarks"))
+
+from coco_stream import DETECTION_FIELDS, _read_tail_categories, load_coco, read_categories, walk_top_level
+from synthetic_coco import generate_annotations
+
+pytest.importorskip('pycocotools')
+
+
+CLASSES = ['car', 'person', 'bicycle']
+
+
+@pytest.fixture(scope='module')
+def annotation_file(tmp_path_factory):
+    """Synthetic file with categories stored after the annotations, like the COCO releases."""
+    path = tmp_path_factory.mktemp("coco") / "instances_val2017.json"
+    generate_annotations(path, 400, seed=5)
+    return path
+
+
+@pytest.fixture(scope='module')
+def categories_first_file(annotation_file):
+    """The same content with 'categories' as the first top-level key."""
+    with open(annotation_file) as f:
+        data = json.load(f)
+    path = annotation_file.with_name("categories_first.json")
+    with open(path, 'w') as f:
+        json.dump({'categories': data['categories'], 'info': data['info'], 'images': data['images'],
+                   'annotations': data['annotations']}, f)
+    return path
+
+
+def target_subset(coco, cat_ids):
+    """Images and annotations of the target categories from a full pycocotools index."""
+    anns = {ann_id: ann for ann_id, ann in coco.anns.items() if ann['category_id'] in cat_ids}
+    img_ids = {ann['image_id'] for ann in anns.values()}
+    imgs = {img_id: img for img_id, img in coco.imgs.items() if img_id in img_ids}
+    return imgs, anns
+
+
+def test_tail_categories_found_only_at_end(annotation_file, categories_first_file):
+    with open(annotation_file) as f:
+        categories = json.load(f)['categories']
+    assert _read_tail_categories(annotation_file) == categories
+    assert _read_tail_categories(categories_first_file) is None
+    assert read_categories(categories_first_file) == categories
+
+
+@pytest.mark.parametrize('layout', ['categories_last', 'categories_first'])
+def test_streaming_loader_matches_pycocotools(annotation_file, categories_first_file, layout):
+    path = annotation_file if layout == 'categories_last' else categories_first_file
+    coco = load_coco(path, CLASSES, loader='coco')
+    stream = load_coco(path, CLASSES, loader='stream', ann_fields=None)
+
+    assert stream.cats == coco.cats
+    cat_ids = coco.getCatIds(catNms=CLASSES)
+    assert stream.getCatIds(catNms=CLASSES) == cat_ids
+    assert stream.loadCats(cat_ids) == coco.loadCats(cat_ids)
+
+    imgs, anns = target_subset(coco, set(cat_ids))
+    assert stream.imgs == imgs
+    assert stream.anns == anns
+    for cat_id in cat_ids:
+        assert sorted(stream.getImgIds(catIds=[cat_id])) == sorted(coco.getImgIds(catIds=[cat_id]))
+    assert sorted(stream.getImgIds(catIds=cat_ids)) == sorted(coco.getImgIds(catIds=cat_ids))
+
+    img_ids = sorted(imgs)[:25]
+    assert stream.loadImgs(img_ids) == coco.loadImgs(img_ids)
+    ann_ids = stream.getAnnIds(imgIds=img_ids, catIds=cat_ids)
+    assert sorted(ann_ids) == sorted(coco.getAnnIds(imgIds=img_ids, catIds=cat_ids))
+    assert stream.loadAnns(ann_ids) == coco.loadAnns(ann_ids)
+
+
+def test_detection_fields_drop_segmentation(annotation_file):
+    coco = load_coco(annotation_file, CLASSES, loader='coco')
+    stream = load_coco(annotation_file, CLASSES, loader='stream')
+    for ann_id, ann in stream.anns.items():
+        assert 'segmentation' not in ann
+        assert ann == {key: coco.anns[ann_id][key] for key in DETECTION_FIELDS}
+
+
+def test_walk_top_level_across_small_chunks(annotation_file):
+    with open(annotation_file) as f:
+        data = json.load(f)
+    seen = {'images': [], 'annotations': [], 'licenses': []}
+    others = walk_top_level(annotation_file, lambda key, element: seen.setdefault(key, []).append(element),
+                            chunk_size=97)
+    assert others == {'info': data['info']}
+    for key in ('images', 'annotations', 'categories', 'licenses'):
+        assert seen[key] == data[key]
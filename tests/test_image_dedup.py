@@ -0,0 +1,104 @@
+"""
+Tests for the near-duplicate search and selection in image_dedup.py.
+"""
+
+import sys
+import random
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from image_dedup import hamming, near_duplicate_pairs, select_duplicates
+
+
+def clustered_hashes(seed, num_bases=40, variants=4, max_flips=12):
+    """Random 64-bit hashes plus copies with 0..max_flips bits flipped, shuffled."""
+    rng = random.Random(seed)
+    hashes = []
+    for _ in range(num_bases):
+        base = rng.getrandbits(64)
+        hashes.append(base)
+        for _ in range(variants):
+            flips = rng.sample(range(64), rng.randint(0, max_flips))
+            hashes.append(base ^ sum(1 << bit for bit in flips))
+    rng.shuffle(hashes)
+    return np.array(hashes, dtype=np.uint64)
+
+
+def brute_force_pairs(query, index, max_distance, self_search):
+    pairs = set()
+    for i, a in enumerate(query.tolist()):
+        for j, b in enumerate(index.tolist()):
+            distance = bin(a ^ b).count('1')
+            if distance <= max_distance and (not self_search or i < j):
+                pairs.add((i, j, distance))
+    return pairs
+
+
+def test_hamming_matches_popcount():
+    a, b = clustered_hashes(0)[:50], clustered_hashes(1)[:50]
+    assert hamming(a, b).tolist() == [bin(x ^ y).count('1') for x, y in zip(a.tolist(), b.tolist())]
+
+
+@pytest.mark.parametrize('max_distance', range(11))
+def test_near_duplicate_pairs_match_brute_force(max_distance):
+    hashes = clustered_hashes(max_distance)
+    rows, cols, distances = near_duplicate_pairs(hashes, max_distance=max_distance)
+    found = list(zip(rows.tolist(), cols.tolist(), distances.tolist()))
+    assert len(found) == len(set(found))
+    assert set(found) == brute_force_pairs(hashes, hashes, max_distance, self_search=True)
+
+    query, index = hashes[:60], hashes[60:]
+    rows, cols, distances = near_duplicate_pairs(query, index, max_distance)
+    assert set(zip(rows.tolist(), cols.tolist(), distances.tolist())) == \
+        brute_force_pairs(query, index, max_distance, self_search=False)
+
+
+def test_near_duplicate_pairs_of_empty_input():
+    rows, cols, distances = near_duplicate_pairs(np.zeros(0, dtype=np.uint64), max_distance=4)
+    assert len(rows) == len(cols) == len(distances) == 0
+
+
+def test_select_duplicates_keeps_the_earliest_image():
+    hashes = np.array([0b0, 0b1, 0b111, 0b1, 0xF0F0], dtype=np.uint64)
+    # Row 2 is 2 bits from the dropped row 1 but 3 bits from row 0: kept at distance 2
+    assert select_duplicates(hashes, 2) == {1: ('duplicate', 0, 1), 3: ('duplicate', 0, 1)}
+    assert select_duplicates(hashes, 3) == {1: ('duplicate', 0, 1), 2: ('duplicate', 0, 3),
+                                            3: ('duplicate', 0, 1)}
+    assert select_duplicates(hashes, 0) == {3: ('duplicate', 1, 0)}
+
+
+def test_select_duplicates_with_reference_images():
+    hashes = np.array([0xFF00, 0xFF00, 0xFF02, 0x0003, 0x0001], dtype=np.uint64)
+    reference = np.array([0x1234, 0xFF01, 0x0003], dtype=np.uint64)
+    dropped = select_duplicates(hashes, 1, reference)
+    # Rows 0 and 1 match reference 1; row 2 is within 1 bit of them only, and they were dropped
+    assert dropped == {0: ('reference', 1, 1), 1: ('reference', 1, 1), 3: ('reference', 2, 0),
+                       4: ('reference', 2, 1)}
+    assert select_duplicates(hashes, 1, reference[:1]) == {1: ('duplicate', 0, 0), 2: ('duplicate', 0, 1),
+                                                          4: ('duplicate', 3, 1)}
+
+
+def test_select_duplicates_matches_greedy_oracle():
+    hashes = clustered_hashes(7)
+    # Some references are two bits away from candidates, the rest unrelated
+    reference = np.concatenate([hashes[::9] ^ np.uint64(0b101), clustered_hashes(8)[:20]])
+    max_distance = 6
+    dropped = select_duplicates(hashes, max_distance, reference)
+
+    kept = []
+    for row, value in enumerate(hashes.tolist()):
+        ref_distances = [bin(value ^ ref).count('1') for ref in reference.tolist()]
+        earlier = [j for j in kept if bin(value ^ int(hashes[j])).count('1') <= max_distance]
+        if min(ref_distances) <= max_distance:
+            assert dropped[row][0] == 'reference'
+            assert dropped[row][2] == min(ref_distances)
+        elif earlier:
+            assert dropped[row] == ('duplicate', earlier[0], bin(value ^ int(hashes[earlier[0]])).count('1'))
+        else:
+            assert row not in dropped
+            kept.append(row)
@@ -0,0 +1,105 @@
+"""
+Tests for image_fetch.ImageFetcher against the local fake image server.
+
+Run with: python -m pytest tests
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(REPO_ROOT / "benchmarks"))
+
+from image_fetch import MAX_REDIRECTS, FetchError, ImageFetcher
+from synthetic_coco import FAKE_JPEG, FakeImageServer
+
+
+IMAGE_BYTES = 256
+
+
+def expected_body(path):
+    return FAKE_JPEG + path.encode().ljust(IMAGE_BYTES, b'\0')
+
+
+def leftover_parts(directory):
+    return [path.name for path in Path(directory).iterdir() if path.name.endswith('.part')]
+
+
+def test_retries_retryable_status_with_backoff(tmp_path):
+    responses = {'/a.jpg': [(503, {}), (429, {})]}
+    with FakeImageServer(IMAGE_BYTES, responses) as server:
+        fetcher = ImageFetcher(workers=1, retries=3, backoff=0.01)
+        nbytes, _ = fetcher.fetch(f"{server.base_url}/a.jpg", tmp_path / "a.jpg")
+    assert server.requests == ['/a.jpg'] * 3
+    assert (tmp_path / "a.jpg").read_bytes() == expected_body('/a.jpg')
+    assert nbytes == len(expected_body('/a.jpg'))
+
+
+def test_gives_up_after_retries(tmp_path):
+    responses = {'/a.jpg': [(500, {})] * 5}
+    with FakeImageServer(IMAGE_BYTES, responses) as server:
+        fetcher = ImageFetcher(workers=1, retries=2, backoff=0.01)
+        with pytest.raises(FetchError, match="HTTP 500"):
+            fetcher.fetch(f"{server.base_url}/a.jpg", tmp_path / "a.jpg")
+    assert len(server.requests) == 3
+    assert not (tmp_path / "a.jpg").exists()
+    assert leftover_parts(tmp_path) == []
+
+
+def test_client_errors_are_not_retried(tmp_path):
+    responses = {'/missing.jpg': [(404, {})]}
+    with FakeImageServer(IMAGE_BYTES, responses) as server:
+        fetcher = ImageFetcher(workers=1, retries=3, backoff=0.01)
+        with pytest.raises(FetchError, match="HTTP 404"):
+            fetcher.fetch(f"{server.base_url}/missing.jpg", tmp_path / "missing.jpg")
+    assert server.requests == ['/missing.jpg']
+    assert not (tmp_path / "missing.jpg").exists()
+
+
+def test_follows_redirect_on_same_host(tmp_path):
+    responses = {'/old.jpg': [(301, {'Location': '/images/new.jpg'})]}
+    with FakeImageServer(IMAGE_BYTES, responses) as server:
+        fetcher = ImageFetcher(workers=1, retries=0)
+        fetcher.fetch(f"{server.base_url}/old.jpg", tmp_path / "a.jpg")
+    assert server.requests == ['/old.jpg', '/images/new.jpg']
+    assert (tmp_path / "a.jpg").read_bytes() == expected_body('/images/new.jpg')
+
+
+def test_follows_redirect_to_other_host(tmp_path):
+    with FakeImageServer(IMAGE_BYTES) as target:
+        responses = {'/a.jpg': [(302, {'Location': f"{target.base_url}/cdn/a.jpg"})]}
+        with FakeImageServer(IMAGE_BYTES, responses) as origin:
+            fetcher = ImageFetcher(workers=1, retries=0)
+            fetcher.fetch(f"{origin.base_url}/a.jpg", tmp_path / "a.jpg")
+    assert origin.requests == ['/a.jpg']
+    assert target.requests == ['/cdn/a.jpg']
+    assert (tmp_path / "a.jpg").read_bytes() == expected_body('/cdn/a.jpg')
+
+
+def test_redirect_loop_fails(tmp_path):
+    responses = {'/loop.jpg': [(307, {'Location': '/loop.jpg'})] * (MAX_REDIRECTS + 5)}
+    with FakeImageServer(IMAGE_BYTES, responses) as server:
+        fetcher = ImageFetcher(workers=1, retries=3, backoff=0.01)
+        with pytest.raises(FetchError, match="redirects"):
+            fetcher.fetch(f"{server.base_url}/loop.jpg", tmp_path / "loop.jpg")
+    assert len(server.requests) == MAX_REDIRECTS + 1
+    assert not (tmp_path / "loop.jpg").exists()
+
+
+def test_fetch_all_reuses_connections(tmp_path):
+    jobs = [(i, f"/images/{i:012d}.jpg", tmp_path / f"{i:012d}.jpg") for i in range(40)]
+    responses = {'/images/000000000007.jpg': [(404, {})]}
+    with FakeImageServer(IMAGE_BYTES, responses) as server:
+        fetcher = ImageFetcher(workers=4, retries=0)
+        fetched, failed = fetcher.fetch_all([(key, server.base_url + path, dest) for key, path, dest in jobs])
+    assert sorted(failed) == [7]
+    assert len(fetched) == 39
+    # One keep-alive connection per worker thread, not one per image
+    assert server.connections <= 4
+    assert leftover_parts(tmp_path) == []
+    for key, path, dest in jobs:
+        if key != 7:
+            assert dest.read_bytes() == expected_body(path)
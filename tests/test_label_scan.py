@@ -0,0 +1,114 @@
+"""
+Tests for the bulk YOLO label parser and the cached directory scan in label_scan.py.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from label_scan import detect_label_format, load_or_scan, parse_label_lines, scan_labels_dir
+
+
+BOX = b"0 0.5 0.5 0.2 0.4"
+# Triangle (0.1, 0.2) (0.5, 0.2) (0.3, 0.6): 0.4 wide and 0.4 high
+POLYGON = b"1 0.1 0.2 0.5 0.2 0.3 0.6"
+# Box followed by two keypoints with visibility (x y v)
+POSE = b"2 0.5 0.5 0.3 0.6 0.4 0.4 2 0.6 0.7 1"
+SHORT = b"3 0.5 0.5"
+HALF_POLYGON = b"4 0.1 0.2 0.5 0.2 0.3"
+
+
+def test_boxes_and_polygons():
+    class_ids, widths, heights, valid = parse_label_lines([BOX, POLYGON, SHORT, HALF_POLYGON])
+    assert valid.tolist() == [True, True, False, False]
+    assert class_ids.tolist() == [0, 1]
+    assert widths.tolist() == pytest.approx([0.2, 0.4])
+    assert heights.tolist() == pytest.approx([0.4, 0.4])
+
+
+def test_polygons_of_different_lengths():
+    square = b"5 0.2 0.2 0.7 0.2 0.7 0.3 0.2 0.3"
+    class_ids, widths, heights, valid = parse_label_lines([POLYGON, BOX, square, POLYGON])
+    assert valid.all()
+    assert class_ids.tolist() == [1, 0, 5, 1]
+    assert widths.tolist() == pytest.approx([0.4, 0.2, 0.5, 0.4])
+    assert heights.tolist() == pytest.approx([0.4, 0.4, 0.1, 0.4])
+
+
+def test_pose_lines_take_the_box_columns():
+    pose_2d = b"1 0.5 0.5 0.1 0.2 0.4 0.4 0.6 0.7"
+    class_ids, widths, heights, valid = parse_label_lines([POSE, pose_2d, SHORT], label_format='pose')
+    assert valid.tolist() == [True, True, False]
+    assert class_ids.tolist() == [2, 1]
+    assert widths.tolist() == pytest.approx([0.3, 0.1])
+    assert heights.tolist() == pytest.approx([0.6, 0.2])
+
+    # Read as detection labels, the same pose line is an (unrelated) polygon
+    _, widths, _, valid = parse_label_lines([POSE], label_format='detect')
+    assert valid.all() and widths[0] != pytest.approx(0.3)
+
+
+def test_non_numeric_tokens_use_the_slow_path():
+    rows = [BOX, b"1 0.5 abc 0.2 0.4", POLYGON, b"2 nan? 0.1 0.1 0.1", SHORT]
+    class_ids, widths, heights, valid = parse_label_lines(rows)
+    assert valid.tolist() == [True, False, True, False, False]
+    assert class_ids.tolist() == [0, 1]
+    assert widths.tolist() == pytest.approx([0.2, 0.4])
+    assert heights.tolist() == pytest.approx([0.4, 0.4])
+
+
+def write_labels(labels_dir, files):
+    labels_dir.mkdir(parents=True, exist_ok=True)
+    for name, rows in files.items():
+        (labels_dir / name).write_bytes(b"\n".join(rows) + b"\n")
+
+
+def test_scan_counts_skipped_lines(tmp_path):
+    labels_dir = tmp_path / "labels" / "train"
+    write_labels(labels_dir, {
+        'a.txt': [BOX, SHORT, POLYGON],
+        'b.txt': [b"", BOX, b"0 x 0.5 0.2 0.4"],
+        'c.txt': [],
+    })
+    (labels_dir / "classes.txt").write_text("person\nbicycle\n")
+    scan = scan_labels_dir(labels_dir)
+    assert scan['num_files'] == 3
+    assert scan['skipped_lines'] == 2
+    assert scan['class_ids'].tolist() == [0, 1, 0]
+    assert scan['file_idx'].tolist() == [0, 0, 1]
+
+
+def test_detect_label_format_reads_kpt_shape(tmp_path):
+    labels_dir = tmp_path / "pose" / "labels" / "train2017"
+    labels_dir.mkdir(parents=True)
+    assert detect_label_format(labels_dir) == 'detect'
+    (tmp_path / "pose" / "dataset.yaml").write_text("path: .\nnc: 1\nnames: ['person']\n")
+    assert detect_label_format(labels_dir) == 'detect'
+    (tmp_path / "pose" / "dataset.yaml").write_text("path: .\nkpt_shape: [17, 3]\nnc: 1\nnames: ['person']\n")
+    assert detect_label_format(labels_dir) == 'pose'
+
+
+def test_load_or_scan_caches_per_format(tmp_path):
+    labels_dir = tmp_path / "labels"
+    cache_dir = tmp_path / "cache"
+    write_labels(labels_dir, {'a.txt': [POSE, SHORT], 'b.txt': [BOX]})
+
+    scan, from_cache = load_or_scan(labels_dir, cache_dir=cache_dir, label_format='pose')
+    assert not from_cache
+    cached, from_cache = load_or_scan(labels_dir, cache_dir=cache_dir, label_format='pose')
+    assert from_cache
+    for key in ('class_ids', 'widths', 'heights', 'file_idx'):
+        assert np.array_equal(cached[key], scan[key])
+    assert (cached['num_files'], cached['skipped_lines']) == (2, 1)
+    assert sorted(path.suffix for path in cache_dir.iterdir()) == ['.json', '.npz']
+
+    # A different format or a changed directory is parsed again
+    assert not load_or_scan(labels_dir, cache_dir=cache_dir, label_format='detect')[1]
+    write_labels(labels_dir, {'c.txt': [BOX]})
+    scan, from_cache = load_or_scan(labels_dir, cache_dir=cache_dir, label_format='detect')
+    assert not from_cache and scan['num_files'] == 3
@@ -0,0 +1,91 @@
+"""
+Tests for the quota sampler and the image selection it draws from.
+"""
+
+import sys
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from coco_stream import load_coco
+from filtered_index import FilteredIndex, cache_dir_for
+from quota_sampler import image_class_matrix, parse_quota, select_by_quota
+
+
+CLASSES = ['car', 'person', 'bicycle']
+
+
+def test_parse_quota_accepts_plus_and_defaults_to_zero():
+    assert parse_quota(['bicycle=3000', 'person=+5000'], CLASSES) == {'car': 0, 'person': 5000, 'bicycle': 3000}
+
+
+@pytest.mark.parametrize('spec', ['bicycle', 'dog=5', 'car=-1', 'car=many', 'car='])
+def test_parse_quota_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        parse_quota([spec], CLASSES)
+
+
+def test_image_class_matrix_counts_and_ignores_other_images():
+    counts = image_class_matrix([10, 20, 30], [10, 10, 30, 99, 20], [3, 1, 2, 1, 3], [1, 2, 3])
+    assert counts.tolist() == [[1, 0, 1], [0, 0, 1], [0, 1, 0]]
+
+
+def test_select_by_quota_meets_every_target_greedily():
+    counts = np.array([
+        [5, 0, 0],   # many of class 0 only
+        [0, 2, 0],
+        [0, 2, 1],
+        [1, 1, 1],
+        [0, 0, 3],
+        [9, 0, 0],   # overshoots class 0
+    ])
+    selected, achieved = select_by_quota(counts, [5, 3, 3])
+    assert (achieved >= [5, 3, 3]).all()
+    assert achieved.tolist() == counts[selected].sum(axis=0).tolist()
+    # Row 0 fills class 0 without surplus, so row 5 (same gain, 4 surplus) is never taken
+    assert selected.tolist() == [0, 2, 3, 4]
+
+
+def test_select_by_quota_ignores_zero_targets_and_reports_unreachable():
+    counts = np.array([[3, 0], [0, 1], [4, 1]])
+    selected, achieved = select_by_quota(counts, [0, 5])
+    # Only class 1 is wanted: row 1 brings no surplus, row 2 brings four unneeded class-0 instances
+    assert selected.tolist() == [1, 2]
+    assert achieved.tolist() == [4, 2]
+    assert select_by_quota(counts, [0, 0])[0].tolist() == []
+
+
+def write_annotations(path):
+    """Images 1-4: car only, person only, car+person+bicycle, no target class."""
+    images = [{'id': i, 'file_name': f"{i:012d}.jpg", 'width': 100, 'height': 100,
+               'coco_url': f"http://x/{i}"} for i in range(1, 5)]
+    anns = [(1, 3), (2, 1), (3, 1), (3, 2), (3, 3), (4, 18)]
+    annotations = [{'id': n, 'image_id': img_id, 'category_id': cat_id, 'bbox': [10, 10, 20, 20],
+                    'area': 400.0, 'iscrowd': 0} for n, (img_id, cat_id) in enumerate(anns, 1)]
+    categories = [{'id': 1, 'name': 'person'}, {'id': 2, 'name': 'bicycle'}, {'id': 3, 'name': 'car'},
+                  {'id': 18, 'name': 'dog'}]
+    with open(path, 'w') as f:
+        json.dump({'images': images, 'annotations': annotations, 'categories': categories}, f)
+    return path
+
+
+@pytest.mark.parametrize('loader', ['coco', 'stream'])
+def test_match_any_selects_union_and_all_intersection(tmp_path, loader):
+    if loader == 'coco':
+        pytest.importorskip('pycocotools')
+    coco = load_coco(write_annotations(tmp_path / "instances.json"), CLASSES, loader=loader)
+    assert FilteredIndex.from_coco(coco, CLASSES, match='any').img_ids == [1, 2, 3]
+    assert FilteredIndex.from_coco(coco, CLASSES, match='all').img_ids == [3]
+
+
+def test_cache_dir_depends_on_match_but_not_class_order(tmp_path):
+    any_dir = cache_dir_for(tmp_path, 'val2017', CLASSES, 'any')
+    all_dir = cache_dir_for(tmp_path, 'val2017', CLASSES, 'all')
+    assert any_dir != all_dir
+    assert all_dir == cache_dir_for(tmp_path, 'val2017', list(reversed(CLASSES)))
+    assert any_dir == cache_dir_for(tmp_path, 'val2017', sorted(CLASSES), 'any')
@@ -0,0 +1,115 @@
+"""
+Tests for annotation predicate filters and for moving deselected files aside.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from annotation_filters import TRUNCATION_MARGIN, active_filters, annotation_mask, predicate_columns
+from download_coco_filtered import deselected_dir_for, prune_deselected, restore_deselected, write_image_list
+
+
+def make_table():
+    """Five boxes in 100 x 50 images: normal, tiny, crowd, touching the border, very elongated."""
+    bbox = np.array([
+        [20.0, 10.0, 30.0, 20.0],
+        [40.0, 20.0, 2.0, 1.0],
+        [10.0, 10.0, 40.0, 30.0],
+        [0.0, 5.0, 30.0, 20.0],
+        [10.0, 20.0, 80.0, 2.0],
+    ])
+    table = {
+        'id': np.arange(1, 6),
+        'bbox': bbox,
+        'iscrowd': np.array([0, 0, 1, 0, 0], dtype=np.int8),
+        'width': np.full(5, 100.0),
+        'height': np.full(5, 50.0),
+    }
+    table.update(predicate_columns(table))
+    return table
+
+
+def test_predicate_columns():
+    table = make_table()
+    assert table['rel_area'][0] == pytest.approx(600 / 5000)
+    assert table['rel_width'][0] == pytest.approx(0.3)
+    assert table['rel_height'][0] == pytest.approx(0.4)
+    assert table['aspect'][4] == pytest.approx(40.0)
+    assert table['border_dist'].tolist() == [10.0, 20.0, 10.0, 0.0, 10.0]
+
+
+def test_predicate_columns_handles_zero_height():
+    table = {'bbox': np.array([[10.0, 10.0, 5.0, 0.0]]), 'width': np.array([100.0]), 'height': np.array([100.0])}
+    assert np.isinf(predicate_columns(table)['aspect'][0])
+
+
+@pytest.mark.parametrize('filters, kept', [
+    ({}, [1, 2, 3, 4, 5]),
+    ({'min_area': 0.01}, [1, 3, 4, 5]),
+    ({'max_area': 0.2}, [1, 2, 4, 5]),
+    ({'min_size': 5}, [1, 3, 4]),
+    ({'max_aspect': 4}, [1, 2, 3, 4]),
+    ({'exclude_crowd': True}, [1, 2, 4, 5]),
+    ({'exclude_truncated': True}, [1, 2, 3, 5]),
+    ({'min_area': 0.01, 'exclude_crowd': True, 'exclude_truncated': True}, [1, 5]),
+])
+def test_annotation_mask(filters, kept):
+    table = make_table()
+    assert table['id'][annotation_mask(table, filters)].tolist() == kept
+
+
+def test_truncation_margin_is_inclusive():
+    table = make_table()
+    table['border_dist'] = np.array([TRUNCATION_MARGIN, TRUNCATION_MARGIN - 0.01, 5.0, 5.0, 5.0])
+    assert annotation_mask(table, {'exclude_truncated': True}).tolist() == [True, False, True, True, True]
+
+
+def test_active_filters_drops_unset_options():
+    assert active_filters(min_area=0.001, exclude_crowd=True) == {'min_area': 0.001, 'exclude_crowd': True}
+    assert active_filters() == {}
+
+
+def make_dataset(root, split, names):
+    for kind, suffix in (('images', '.jpg'), ('labels', '.txt')):
+        (root / kind / split).mkdir(parents=True, exist_ok=True)
+        for name in names:
+            (root / kind / split / (name + suffix)).write_text(f"{kind} {name}")
+
+
+def listing(root, kind, split):
+    return sorted(path.name for path in (root / kind / split).iterdir())
+
+
+def test_prune_and_restore_round_trip(tmp_path):
+    split = 'val2017'
+    make_dataset(tmp_path, split, ['a', 'b', 'c'])
+    # A label without an image (e.g. from an interrupted run) is moved as well
+    (tmp_path / 'labels' / split / 'd.txt').write_text("labels d")
+
+    assert prune_deselected(tmp_path, split, {'a.jpg'}) == 2
+    assert listing(tmp_path, 'images', split) == ['a.jpg']
+    assert listing(tmp_path, 'labels', split) == ['a.txt']
+    deselected = deselected_dir_for(tmp_path, split)
+    assert sorted(path.name for path in (deselected / 'images').iterdir()) == ['b.jpg', 'c.jpg']
+    assert sorted(path.name for path in (deselected / 'labels').iterdir()) == ['b.txt', 'c.txt', 'd.txt']
+
+    assert restore_deselected(tmp_path, split, 'b.jpg')
+    assert not restore_deselected(tmp_path, split, 'x.jpg')
+    assert listing(tmp_path, 'images', split) == ['a.jpg', 'b.jpg']
+    assert listing(tmp_path, 'labels', split) == ['a.txt', 'b.txt']
+    assert (tmp_path / 'images' / split / 'b.jpg').read_text() == "images b"
+
+    # Pruning to the same selection again moves nothing
+    assert prune_deselected(tmp_path, split, {'a.jpg', 'b.jpg'}) == 0
+
+
+def test_write_image_list_lists_selected_files_on_disk(tmp_path):
+    make_dataset(tmp_path, 'val2017', ['a', 'b'])
+    assert write_image_list(tmp_path, 'val2017', {'b.jpg', 'a.jpg', 'missing.jpg'}) == 2
+    assert (tmp_path / 'val2017.txt').read_text() == "./images/val2017/a.jpg\n./images/val2017/b.jpg\n"
@@ -0,0 +1,95 @@
+"""
+Tests that a multi-node run (N shards plus --merge) produces the single-node dataset.
+"""
+
+import sys
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(REPO_ROOT / "benchmarks"))
+
+from download_coco_filtered import download_filtered_coco, merge_shards, shard_image_ids
+from synthetic_coco import generate_annotations
+
+
+SPLIT = 'val2017'
+CLASSES = ['car', 'person', 'bicycle']
+
+
+def test_shard_image_ids_partition_the_selection():
+    img_ids = np.array([1, 2, 3, 7, 8, 12, 15, 20])
+    shards = [shard_image_ids(img_ids, 3, index).tolist() for index in range(3)]
+    assert shards == [[3, 12, 15], [1, 7], [2, 8, 20]]
+    assert sorted(sum(shards, [])) == img_ids.tolist()
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    """Synthetic annotation file plus a local image mirror holding every image."""
+    root = tmp_path_factory.mktemp("source")
+    annotation_file = root / f"instances_{SPLIT}.json"
+    generate_annotations(annotation_file, 600, seed=3)
+    mirror = root / "mirror" / SPLIT
+    mirror.mkdir(parents=True)
+    with open(annotation_file) as f:
+        for img in json.load(f)['images']:
+            (mirror / img['file_name']).write_bytes(img['file_name'].encode())
+    return annotation_file, root / "mirror"
+
+
+def build(output, source, **kwargs):
+    """Run the download script on the synthetic source, linking images from the mirror."""
+    annotation_file, mirror = source
+    (output / "annotations").mkdir(parents=True, exist_ok=True)
+    (output / "annotations" / annotation_file.name).write_bytes(annotation_file.read_bytes())
+    download_filtered_coco(split=SPLIT, output_dir=str(output), target_classes=CLASSES, loader='stream',
+                           source_images=str(mirror), match='any', **kwargs)
+
+
+def tree(output, kind):
+    return {path.name: path.read_bytes() for path in sorted((output / kind / SPLIT).iterdir())}
+
+
+def yaml_without_path(output):
+    return [line for line in (output / "dataset.yaml").read_text().splitlines() if not line.startswith('path:')]
+
+
+@pytest.mark.parametrize('num_shards', [2, 3])
+def test_shards_and_merge_match_single_node(tmp_path, source, num_shards):
+    single = tmp_path / "single"
+    build(single, source)
+
+    sharded = tmp_path / "sharded"
+    for shard_index in range(num_shards):
+        build(sharded, source, num_shards=num_shards, shard_index=shard_index)
+    assert not (sharded / "classes.txt").exists()
+    assert merge_shards(str(sharded), SPLIT, num_shards)
+
+    assert len(tree(single, 'labels')) > 0
+    assert tree(sharded, 'labels') == tree(single, 'labels')
+    assert sorted(tree(sharded, 'images')) == sorted(tree(single, 'images'))
+    assert (sharded / "classes.txt").read_text() == (single / "classes.txt").read_text()
+    assert yaml_without_path(sharded) == yaml_without_path(single)
+
+
+def test_merge_refuses_missing_and_mismatched_shards(tmp_path, source):
+    output = tmp_path / "out"
+    build(output, source, num_shards=2, shard_index=0)
+    assert not merge_shards(str(output), SPLIT, 2)
+    build(output, source, num_shards=2, shard_index=1, filters={'min_area': 0.01})
+    assert not merge_shards(str(output), SPLIT, 2)
+
+
+def test_dataset_yaml_names_follow_label_ids(tmp_path, source):
+    output = tmp_path / "out"
+    build(output, source)
+    class_names = (output / "classes.txt").read_text().split()
+    # Label ids follow sorted COCO category ids: person=1, bicycle=2, car=3
+    assert class_names == ['person', 'bicycle', 'car']
+    assert f"names: {class_names}" in yaml_without_path(output)
+    assert "nc: 3" in yaml_without_path(output)
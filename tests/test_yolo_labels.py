@@ -0,0 +1,85 @@
+"""
+Tests for the vectorized COCO -> YOLO conversion in yolo_labels.py.
+
+The label text must stay byte-identical to the original per-annotation writer
+(download_coco_filtered.convert_bbox_to_yolo plus str() formatting).
+"""
+
+import sys
+import random
+from types import SimpleNamespace
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from download_coco_filtered import convert_bbox_to_yolo
+from yolo_labels import build_annotation_table, build_label_texts, convert_bboxes_to_yolo, format_yolo_lines
+
+
+def make_coco(seed=0, num_images=20, num_annotations=150):
+    """Small COCO-like object with awkward box values (thirds, tiny and full-image boxes)."""
+    rng = random.Random(seed)
+    imgs = {}
+    for img_id in rng.sample(range(1, 10000), num_images):
+        imgs[img_id] = {'id': img_id, 'width': rng.choice([640, 427, 333, 1]) if img_id % 7 else 500,
+                        'height': rng.choice([480, 640, 375, 3]), 'file_name': f"{img_id:012d}.jpg"}
+    anns = {}
+    img_ids = list(imgs)
+    for ann_id in range(1, num_annotations + 1):
+        img = imgs[rng.choice(img_ids)]
+        x = rng.choice([0, rng.uniform(0, img['width']), img['width'] / 3])
+        y = rng.choice([0, rng.uniform(0, img['height']), 1e-7])
+        w = rng.choice([img['width'], rng.uniform(0, img['width']), 0.1])
+        h = rng.choice([img['height'], round(rng.uniform(0, img['height']), 2), 1 / 3])
+        anns[ann_id] = {'id': ann_id, 'image_id': img['id'], 'category_id': rng.choice([1, 2, 3, 18]),
+                        'bbox': [x, y, w, h], 'area': w * h, 'iscrowd': 0}
+    return SimpleNamespace(anns=anns, imgs=imgs)
+
+
+def legacy_label_texts(coco, cat_ids, coco_to_yolo, img_ids):
+    """Label files as the original per-image loop wrote them."""
+    texts = {}
+    for img_id in img_ids:
+        img = coco.imgs[img_id]
+        lines = []
+        for ann in coco.anns.values():
+            if ann['image_id'] == img_id and ann['category_id'] in cat_ids:
+                yolo_bbox = convert_bbox_to_yolo(ann['bbox'], img['width'], img['height'])
+                lines.append(f"{coco_to_yolo[ann['category_id']]} {' '.join(map(str, yolo_bbox))}\n")
+        texts[img_id] = "".join(lines)
+    return texts
+
+
+def test_vectorized_boxes_match_scalar_conversion():
+    coco = make_coco()
+    table = build_annotation_table(coco, [1, 2, 3, 18])
+    boxes = convert_bboxes_to_yolo(table['bbox'], table['width'], table['height'])
+    for row, ann_id in enumerate(table['id'].tolist()):
+        ann = coco.anns[ann_id]
+        img = coco.imgs[ann['image_id']]
+        assert boxes[row].tolist() == convert_bbox_to_yolo(ann['bbox'], img['width'], img['height'])
+
+
+def test_label_texts_are_byte_identical_to_legacy_writer():
+    coco = make_coco(seed=1)
+    cat_ids = [1, 2, 3]
+    coco_to_yolo = {cat_id: idx for idx, cat_id in enumerate(sorted(cat_ids))}
+    # Includes images without any target annotation (empty label files)
+    img_ids = sorted(coco.imgs)
+    table = build_annotation_table(coco, cat_ids)
+    texts, class_counts = build_label_texts(table, coco_to_yolo, img_ids)
+
+    expected = legacy_label_texts(coco, cat_ids, coco_to_yolo, img_ids)
+    assert texts.keys() == expected.keys()
+    for img_id in img_ids:
+        assert texts[img_id].encode() == expected[img_id].encode()
+    expected_counts = [sum(ann['category_id'] == cat_id for ann in coco.anns.values()) for cat_id in sorted(cat_ids)]
+    assert class_counts.tolist() == expected_counts
+
+
+def test_format_yolo_lines_uses_python_float_repr():
+    lines = format_yolo_lines(np.array([2]), np.array([[0.1 + 0.2, 1 / 3, 1.0, 5e-08]]))
+    assert lines == [f"2 {0.1 + 0.2} {1 / 3} 1.0 5e-08\n"]
@@ -0,0 +1,40 @@
+"""
+Tests for the keypoint filtering and formatting in yolo_pose.py.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from yolo_pose import NUM_KEYPOINTS, format_pose_rows, labeled_mask, normalize_keypoints
+
+
+def make_keypoints(visibilities):
+    """(N, 17, 3) keypoints at (10, 20) with the given per-instance visibility flags."""
+    keypoints = np.zeros((len(visibilities), NUM_KEYPOINTS, 3))
+    keypoints[:, :, 0], keypoints[:, :, 1] = 10.0, 20.0
+    for row, flags in enumerate(visibilities):
+        keypoints[row, :len(flags), 2] = flags
+    return keypoints
+
+
+def test_labeled_mask_counts_occluded_and_visible_keypoints():
+    keypoints = make_keypoints([[2, 2], [1, 1], [2, 0, 1], [0], [2, 2, 2]])
+    assert labeled_mask(keypoints, 2).tolist() == [True, True, True, False, True]
+    assert labeled_mask(keypoints, 3).tolist() == [False, False, False, False, True]
+    assert labeled_mask(keypoints, 0).all()
+    iscrowd = np.array([0, 0, 0, 0, 1])
+    assert labeled_mask(keypoints, 2, iscrowd).tolist() == [True, True, True, False, False]
+
+
+def test_unlabeled_keypoints_are_zeroed_and_flags_written_as_integers():
+    keypoints = normalize_keypoints(make_keypoints([[2, 1, 0]]), np.array([40.0]), np.array([80.0]))
+    assert keypoints[0, :3].tolist() == [[0.25, 0.25, 2], [0.25, 0.25, 1], [0.0, 0.0, 0]]
+    row = format_pose_rows(np.array([[0.5, 0.5, 0.2, 0.4]]), keypoints)[0]
+    assert row.startswith("0 0.500000 0.500000 0.200000 0.400000 0.250000 0.250000 2 0.250000 0.250000 1 "
+                          "0.000000 0.000000 0 ")
+    assert len(row.split()) == 5 + NUM_KEYPOINTS * 3
@@ -0,0 +1,135 @@
+"""
+Tests for the YOLO-segmentation export in yolo_seg.py.
+"""
+
+import sys
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from yolo_seg import cap_vertices, export_segmentation, merge_parts, polygon_parts
+
+
+SPLIT = 'val2017'
+WIDTH, HEIGHT = 100, 80
+
+
+def test_cap_vertices_keeps_evenly_spaced_points():
+    points = np.arange(20, dtype=np.float64).reshape(10, 2)
+    assert cap_vertices(points, 0) is points
+    assert cap_vertices(points, 10) is points
+    assert cap_vertices(points, 5)[:, 0].tolist() == [0, 4, 8, 12, 16]
+    assert cap_vertices(points, 3)[:, 0].tolist() == [0, 6, 12]
+
+
+def test_merge_parts_bridges_at_closest_vertices():
+    square = np.array([[0, 0], [10, 0], [10, 10], [0, 10]], dtype=np.float64)
+    triangle = np.array([[30, 30], [12, 11], [30, 11]], dtype=np.float64)
+    merged = merge_parts([square, triangle])
+    # Square up to (10, 10), around the triangle from (12, 11) and back, then the rest of the square
+    assert merged.tolist() == [[0, 0], [10, 0], [10, 10], [12, 11], [30, 11], [30, 30], [12, 11],
+                               [10, 10], [0, 10]]
+    assert merge_parts([square]) is square
+    assert merge_parts([]).shape == (0, 2)
+
+
+def test_polygon_parts_drops_degenerate_parts():
+    parts = polygon_parts([[0, 0, 10, 0, 10, 10], [5, 5, 6, 6]])
+    assert len(parts) == 1 and parts[0].shape == (3, 2)
+
+
+def rectangle_mask(x0, y0, x1, y1):
+    mask = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+    mask[y0:y1 + 1, x0:x1 + 1] = 1
+    return mask
+
+
+def uncompressed_rle(mask):
+    """Column-major run lengths starting with a run of zeros, as in iscrowd annotations."""
+    flat = mask.flatten(order='F')
+    changes = np.flatnonzero(np.diff(flat)) + 1
+    bounds = np.concatenate([[0], changes, [len(flat)]])
+    counts = np.diff(bounds).tolist()
+    if flat[0]:
+        counts = [0] + counts
+    return {'size': [HEIGHT, WIDTH], 'counts': counts}
+
+
+def make_dataset(root, annotations):
+    """Annotation file plus downloaded image stubs for images 1-3."""
+    images = [{'id': i, 'file_name': f"{i:012d}.jpg", 'width': WIDTH, 'height': HEIGHT} for i in (1, 2, 3)]
+    for n, ann in enumerate(annotations, 1):
+        ann.update(id=n, area=1.0, bbox=[0, 0, 1, 1])
+    categories = [{'id': 1, 'name': 'person'}, {'id': 2, 'name': 'bicycle'}, {'id': 3, 'name': 'car'}]
+    annotation_file = root / "annotations" / f"instances_{SPLIT}.json"
+    annotation_file.parent.mkdir(parents=True)
+    with open(annotation_file, 'w') as f:
+        json.dump({'images': images, 'annotations': annotations, 'categories': categories}, f)
+    (root / "images" / SPLIT).mkdir(parents=True)
+    for img in images:
+        (root / "images" / SPLIT / img['file_name']).write_bytes(b"jpg")
+    return annotation_file
+
+
+def read_points(path):
+    """(class id, (n, 2) pixel coordinates) of every line of a label file."""
+    lines = []
+    for line in path.read_text().splitlines():
+        values = line.split()
+        points = np.array(values[1:], dtype=np.float64).reshape(-1, 2) * [WIDTH, HEIGHT]
+        lines.append((int(values[0]), points))
+    return lines
+
+
+@pytest.mark.parametrize('loader', ['coco', 'stream'])
+def test_export_polygons(tmp_path, loader):
+    if loader == 'coco':
+        pytest.importorskip('pycocotools')
+    annotation_file = make_dataset(tmp_path, [
+        {'image_id': 1, 'category_id': 1, 'iscrowd': 0, 'segmentation': [[10, 10, 30, 10, 30, 40, 10, 40]]},
+        {'image_id': 1, 'category_id': 3, 'iscrowd': 0,
+         'segmentation': [[50, 10, 60, 10, 60, 20], [70, 10, 80, 10, 80, 20], [1, 2]]},
+        {'image_id': 2, 'category_id': 18, 'iscrowd': 0, 'segmentation': [[10, 10, 30, 10, 30, 40]]},
+    ])
+    result = export_segmentation(annotation_file, tmp_path, SPLIT, ['car', 'person'], loader=loader)
+    assert result['class_names'] == ['person', 'car']
+    assert result['instance_counts'] == {'person': 1, 'car': 1}
+    assert result['polygons'] == 2
+
+    labels_dir = tmp_path / "segment" / "labels" / SPLIT
+    # Images without target instances get no label lines (an empty file with the coco loader)
+    assert {path.name for path in labels_dir.iterdir() if path.read_text()} == {"000000000001.txt"}
+    (person_id, person), (car_id, car) = read_points(labels_dir / "000000000001.txt")
+    assert (person_id, car_id) == (0, 1)
+    assert person.round(3).tolist() == [[10, 10], [30, 10], [30, 40], [10, 40]]
+    # Two triangles joined over a zero-width bridge: 3 + 3 vertices plus both bridge ends
+    assert len(car) == 8
+    assert (tmp_path / "segment" / "images" / SPLIT).resolve() == (tmp_path / "images" / SPLIT).resolve()
+    assert "names: ['person', 'car']" in (tmp_path / "segment" / "dataset.yaml").read_text()
+
+
+def test_export_rle_masks(tmp_path):
+    pytest.importorskip('cv2')
+    mask_utils = pytest.importorskip('pycocotools.mask')
+    crowd = rectangle_mask(20, 10, 59, 39)
+    compressed = mask_utils.encode(np.asfortranarray(rectangle_mask(5, 50, 24, 69)))
+    compressed['counts'] = compressed['counts'].decode()
+    annotation_file = make_dataset(tmp_path, [
+        {'image_id': 2, 'category_id': 3, 'iscrowd': 1, 'segmentation': uncompressed_rle(crowd)},
+        {'image_id': 2, 'category_id': 1, 'iscrowd': 0, 'segmentation': compressed},
+        {'image_id': 3, 'category_id': 1, 'iscrowd': 0, 'segmentation': [[10, 10, 30, 10, 30, 40]]},
+    ])
+    result = export_segmentation(annotation_file, tmp_path, SPLIT, ['car', 'person'])
+    assert result['rle'] == 2 and result['polygons'] == 1
+    assert result.get('rle_skipped', 0) == 0 and result['empty'] == 0
+
+    labels = read_points(tmp_path / "segment" / "labels" / SPLIT / "000000000002.txt")
+    assert [class_id for class_id, _ in labels] == [1, 0]
+    for (_, points), corners in zip(labels, [[[20, 10], [20, 39], [59, 39], [59, 10]],
+                                             [[5, 50], [5, 69], [24, 69], [24, 50]]]):
+        assert sorted(points.round(3).tolist()) == sorted(corners)
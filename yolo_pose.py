@@ -0,0 +1,216 @@
+"""
+Export COCO person keypoints as YOLO-pose labels.
+
+Each kept person annotation becomes one label line
+
+    0 x_center y_center width height px1 py1 v1 ... px17 py17 v17
+
+with the box and all 17 keypoints normalized by the image size. The
+keypoints of every person annotation in the split are loaded into one
+(N, 17, 3) array, normalized in a single vectorized pass, and instances with
+too few labeled keypoints are dropped with an array mask before the rows
+are grouped by image and written.
+
+The export is written next to the detection dataset:
+
+    <dataset>/pose/images/<split>  -> symlink to ../../images/<split>
+    <dataset>/pose/labels/<split>/*.txt
+    <dataset>/pose/<split>.txt     images with at least one kept person
+    <dataset>/pose/dataset.yaml    with kpt_shape and flip_idx
+
+Only images listed in <split>.txt are used for training, so images whose
+people were all filtered out are not mistaken for person-free backgrounds.
+"""
+
+import os
+import argparse
+import numpy as np
+from pathlib import Path
+
+from coco_stream import DETECTION_FIELDS, load_coco
+from run_report import RunReport
+from yolo_labels import build_annotation_table, convert_bboxes_to_yolo, group_by_image, select_rows
+
+
+POSE_FIELDS = DETECTION_FIELDS + ('keypoints', 'num_keypoints')
+NUM_KEYPOINTS = 17
+KPT_SHAPE = [NUM_KEYPOINTS, 3]
+# COCO keypoint order: nose, eyes, ears, shoulders, elbows, wrists, hips, knees, ankles (left, right)
+FLIP_IDX = [0, 2, 1, 4, 3, 6, 5, 8, 7, 10, 9, 12, 11, 14, 13, 16, 15]
+
+
+def keypoint_array(coco, cat_ids):
+    """
+    Keypoints of every annotation of the given categories as an (N, 17, 3) array.
+
+    Rows are in the same order as yolo_labels.build_annotation_table.
+    """
+    cat_set = set(cat_ids)
+    anns = [ann for ann in coco.anns.values() if ann['category_id'] in cat_set]
+    flat = np.zeros((len(anns), NUM_KEYPOINTS * 3), dtype=np.float64)
+    for row, ann in enumerate(anns):
+        keypoints = ann.get('keypoints')
+        if keypoints:
+            flat[row] = keypoints
+    return flat.reshape(-1, NUM_KEYPOINTS, 3)
+
+
+def normalize_keypoints(keypoints, img_widths, img_heights):
+    """
+    Normalize (N, 17, 3) pixel keypoints by the image sizes in one pass.
+
+    Coordinates of unlabeled keypoints (visibility 0) are set to 0 as in the
+    YOLO-pose convention; visibility flags are kept as-is.
+    """
+    normalized = keypoints.copy()
+    normalized[:, :, 0] /= img_widths[:, None]
+    normalized[:, :, 1] /= img_heights[:, None]
+    normalized[:, :, :2] = np.clip(normalized[:, :, :2], 0.0, 1.0)
+    normalized[keypoints[:, :, 2] == 0, :2] = 0.0
+    return normalized
+
+
+def labeled_mask(keypoints, min_labeled, iscrowd=None):
+    """
+    Boolean mask of instances with at least min_labeled labeled keypoints (crowd regions excluded).
+
+    A keypoint counts as labeled with visibility 1 (occluded) or 2 (visible),
+    the same count as COCO's num_keypoints.
+    """
+    mask = np.count_nonzero(keypoints[:, :, 2] > 0, axis=1) >= min_labeled
+    if iscrowd is not None:
+        mask &= iscrowd == 0
+    return mask
+
+
+def format_pose_rows(yolo_boxes, keypoints):
+    """Label lines 'class box keypoints' for (N, 4) boxes and (N, 17, 3) normalized keypoints."""
+    values = np.concatenate([yolo_boxes, keypoints.reshape(len(keypoints), -1)], axis=1)
+    text = np.char.mod('%.6f', values)
+    # Visibility flags are integers in the YOLO-pose format
+    text[:, 4 + 2::3] = np.char.mod('%d', values[:, 4 + 2::3].astype(np.int64))
+    return ["0 " + " ".join(row) + "\n" for row in text.tolist()]
+
+
+def export_pose(annotation_file, dataset_dir, split, min_labeled=1, loader="coco"):
+    """
+    Write YOLO-pose labels for the downloaded images of a split.
+
+    Args:
+        annotation_file: COCO person_keypoints JSON of the split
+        dataset_dir: Output directory of download_coco_filtered.py
+        split: 'val2017' or 'train2017'
+        min_labeled: Drop person instances with fewer labeled keypoints than this
+        loader: Annotation loader, 'coco' or 'stream'
+
+    Returns:
+        Dict with 'num_images', 'instances', 'dropped' and 'images_with_people'
+    """
+    dataset_dir = Path(dataset_dir)
+    images_dir = dataset_dir / "images" / split
+    pose_dir = dataset_dir / "pose"
+    labels_dir = pose_dir / "labels" / split
+    labels_dir.mkdir(parents=True, exist_ok=True)
+    report = RunReport("yolo_pose", {'split': split, 'min_labeled': min_labeled, 'loader': loader})
+
+    with report.stage('annotation_load', loader=loader) as record:
+        coco = load_coco(annotation_file, ['person'], loader=loader, ann_fields=POSE_FIELDS)
+        record['items'] = len(coco.anns)
+    cat_ids = coco.getCatIds(catNms=['person'])
+
+    with report.stage('keypoint_table') as record:
+        table = build_annotation_table(coco, cat_ids)
+        keypoints = keypoint_array(coco, cat_ids)
+        present = {entry.name for entry in os.scandir(images_dir) if entry.name.endswith('.jpg')}
+        file_names = {img_id: img['file_name'] for img_id, img in coco.imgs.items() if img['file_name'] in present}
+        record['items'] = len(keypoints)
+    del coco
+
+    with report.stage('normalize_filter') as record:
+        in_dataset = np.isin(table['image_id'], np.fromiter(file_names, dtype=np.int64, count=len(file_names)))
+        keep = in_dataset & labeled_mask(keypoints, min_labeled, table['iscrowd'])
+        dropped = int(np.count_nonzero(in_dataset & ~keep))
+        table = select_rows(table, keep)
+        keypoints = normalize_keypoints(keypoints[keep], table['width'], table['height'])
+        yolo_boxes = convert_bboxes_to_yolo(table['bbox'], table['width'], table['height'])
+        record['items'] = len(keypoints)
+
+    with report.stage('label_write') as record:
+        order, unique_ids, starts, ends = group_by_image(table['image_id'])
+        lines = format_pose_rows(yolo_boxes[order], keypoints[order])
+        image_list = []
+        for img_id, start, end in zip(unique_ids.tolist(), starts.tolist(), ends.tolist()):
+            file_name = file_names[img_id]
+            with open(labels_dir / (Path(file_name).stem + '.txt'), 'w') as f:
+                f.write("".join(lines[start:end]))
+            image_list.append(f"./images/{split}/{file_name}")
+        record['items'] = len(image_list)
+
+    link = pose_dir / "images" / split
+    link.parent.mkdir(parents=True, exist_ok=True)
+    if not os.path.lexists(link):
+        os.symlink(os.path.relpath(images_dir, link.parent), link)
+    with open(pose_dir / f"{split}.txt", 'w') as f:
+        f.write("".join(f"{path}\n" for path in image_list))
+    yaml_content = f"""# COCO Filtered Dataset (YOLO pose)
+path: {pose_dir.absolute()}
+train: {split}.txt
+val: {split}.txt
+
+kpt_shape: {KPT_SHAPE}
+flip_idx: {FLIP_IDX}
+
+nc: 1
+names: ['person']
+"""
+    with open(pose_dir / "dataset.yaml", 'w') as f:
+        f.write(yaml_content)
+
+    result = {'num_images': len(file_names), 'instances': len(keypoints), 'dropped': dropped,
+              'images_with_people': len(image_list)}
+    for key, value in result.items():
+        report.count(key, value)
+    report.save(pose_dir / "run_report.json")
+    return result
+
+
+def main(argv=None, prog=None):
+    """Command-line entry point; argv and prog are set when run through coco_cli.py."""
+    parser = argparse.ArgumentParser(prog=prog, description="Export COCO person keypoints as YOLO-pose labels")
+    parser.add_argument('--split', type=str, default='val2017',
+                        choices=['val2017', 'train2017'],
+                        help='Dataset split')
+    parser.add_argument('--output', type=str, default='./coco_filtered',
+                        help='Output directory of download_coco_filtered.py')
+    parser.add_argument('--min-labeled', type=int, default=1,
+                        help='Drop person instances with fewer labeled keypoints (visible or occluded, '
+                             'v > 0) than this')
+    parser.add_argument('--loader', type=str, default='coco', choices=['coco', 'stream'],
+                        help="Annotation loader ('stream' keeps only person annotations in memory)")
+    args = parser.parse_args(argv)
+
+    annotation_file = Path(args.output) / "annotations" / f"person_keypoints_{args.split}.json"
+    if not annotation_file.exists():
+        parser.error(f"Keypoint annotation file not found: {annotation_file} "
+                     f"(it is part of annotations_trainval2017.zip)")
+    if not (Path(args.output) / "images" / args.split).is_dir():
+        parser.error(f"No downloaded images in {Path(args.output) / 'images' / args.split}; "
+                     f"run download_coco_filtered.py first")
+    if not 0 <= args.min_labeled <= NUM_KEYPOINTS:
+        parser.error(f"--min-labeled must be between 0 and {NUM_KEYPOINTS}")
+
+    result = export_pose(annotation_file, args.output, args.split, min_labeled=args.min_labeled, loader=args.loader)
+    pose_dir = Path(args.output) / "pose"
+    print(f"\n{'='*50}")
+    print(f"Pose Export Summary")
+    print(f"{'='*50}")
+    print(f"Downloaded images: {result['num_images']}")
+    print(f"Images with kept people: {result['images_with_people']}")
+    print(f"Person instances written: {result['instances']}")
+    print(f"Dropped (< {args.min_labeled} labeled keypoints or crowd): {result['dropped']}")
+    print(f"\nLabels: {pose_dir / 'labels' / args.split}")
+    print(f"YOLO dataset config saved to: {pose_dir / 'dataset.yaml'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Export COCO instance masks as YOLO-segmentation labels.
+
+Each annotation of the target classes becomes one label line
+
+    <class id> x1 y1 x2 y2 ... xn yn
+
+with polygon vertices normalized by the image size. Polygon segmentations
+are used directly; an instance split into several polygon parts is joined
+into a single outline with zero-width bridges between the parts. RLE
+segmentations (iscrowd masks, compressed or not) are decoded in one
+pycocotools call per image and traced into contours with OpenCV. Images are
+split into chunks that a process pool converts and writes, so the mask
+decoding and contour work runs on every core.
+
+The export is written next to the detection dataset:
+
+    <dataset>/segment/images/<split>  -> symlink to ../../images/<split>
+    <dataset>/segment/labels/<split>/*.txt
+    <dataset>/segment/classes.txt, dataset.yaml, run_report.json
+
+Requires pycocotools and opencv-python(-headless) for RLE masks only; without
+them RLE annotations are skipped and counted in the summary.
+"""
+
+import os
+import argparse
+import importlib.util
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from coco_stream import DETECTION_FIELDS, load_coco
+from run_report import RunReport
+
+
+SEG_FIELDS = DETECTION_FIELDS + ('segmentation',)
+
+
+def polygon_parts(segmentation):
+    """Polygon segmentation [[x1, y1, ...], ...] -> list of (n, 2) arrays with at least 3 vertices."""
+    parts = [np.asarray(poly, dtype=np.float64).reshape(-1, 2) for poly in segmentation]
+    return [part for part in parts if len(part) >= 3]
+
+
+def _closest_pair(a, b, block=256):
+    """Indices (i, j) minimizing |a[i] - b[j]|, computed in blocks to bound memory."""
+    best = (np.inf, 0, 0)
+    for start in range(0, len(b), block):
+        dist = ((a[:, None, :] - b[None, start:start + block, :]) ** 2).sum(axis=2)
+        i, j = np.unravel_index(np.argmin(dist), dist.shape)
+        if dist[i, j] < best[0]:
+            best = (dist[i, j], i, start + j)
+    return best[1], best[2]
+
+
+def merge_parts(parts):
+    """
+    Join several polygon parts into one outline.
+
+    Each further part is spliced in at the pair of vertices closest to the
+    outline built so far: the path goes over to the part, around it and back
+    along the same (zero-width) bridge.
+    """
+    if not parts:
+        return np.zeros((0, 2))
+    merged = parts[0]
+    for part in parts[1:]:
+        i, j = _closest_pair(merged, part)
+        loop = np.roll(part, -j, axis=0)
+        merged = np.concatenate([merged[:i + 1], loop, loop[:1], merged[i:]])
+    return merged
+
+
+def cap_vertices(points, max_vertices):
+    """Keep at most max_vertices evenly spaced vertices of an outline (0 = no cap)."""
+    if max_vertices <= 0 or len(points) <= max_vertices:
+        return points
+    keep = np.linspace(0, len(points), max_vertices, endpoint=False).astype(np.int64)
+    return points[keep]
+
+
+def mask_outlines(masks, simplify=1.0):
+    """
+    Trace the outline of each decoded mask.
+
+    Args:
+        masks: (height, width, n) uint8 array as returned by pycocotools.mask.decode
+        simplify: Douglas-Peucker tolerance in pixels (0 = keep every contour point)
+
+    Returns:
+        List of n (k, 2) arrays (empty for masks without a traceable region)
+    """
+    import cv2
+
+    outlines = []
+    for k in range(masks.shape[2]):
+        contours = cv2.findContours(np.ascontiguousarray(masks[:, :, k]), cv2.RETR_EXTERNAL,
+                                    cv2.CHAIN_APPROX_SIMPLE)[-2]
+        parts = []
+        for contour in contours:
+            if simplify > 0:
+                contour = cv2.approxPolyDP(contour, simplify, True)
+            if len(contour) >= 3:
+                parts.append(contour.reshape(-1, 2).astype(np.float64))
+        # Largest region first so the bridges start from the main body
+        parts.sort(key=len, reverse=True)
+        outlines.append(merge_parts(parts))
+    return outlines
+
+
+def decode_rles(segmentations, height, width):
+    """Decode a batch of RLE segmentations of one image into a (height, width, n) mask array."""
+    from pycocotools import mask as mask_utils
+
+    rles = []
+    for segm in segmentations:
+        if isinstance(segm['counts'], list):
+            rles.append(mask_utils.frPyObjects(segm, height, width))
+        else:
+            counts = segm['counts']
+            rles.append({'size': segm['size'], 'counts': counts.encode() if isinstance(counts, str) else counts})
+    return mask_utils.decode(rles)
+
+
+def format_seg_line(class_id, points, width, height):
+    """One YOLO-seg label line with coordinates normalized and clipped to [0, 1]."""
+    normalized = np.clip(points / np.array([width, height], dtype=np.float64), 0.0, 1.0)
+    return f"{class_id} " + " ".join(np.char.mod('%.6f', normalized.ravel()).tolist())
+
+
+def _rle_support():
+    """True if pycocotools and OpenCV are installed (needed to trace RLE masks)."""
+    return importlib.util.find_spec('cv2') is not None and importlib.util.find_spec('pycocotools') is not None
+
+
+def _convert_chunk(task):
+    """
+    Worker: convert and write the segmentation labels of one chunk of images.
+
+    Returns (per-class instance counts, dict of conversion counters).
+    """
+    images, labels_dir, num_classes, max_vertices = task
+    labels_dir = Path(labels_dir)
+    rle_ok = _rle_support()
+    counts = np.zeros(num_classes, dtype=np.int64)
+    stats = {'polygons': 0, 'rle': 0, 'rle_skipped': 0, 'empty': 0, 'capped': 0, 'vertices': 0}
+
+    for stem, width, height, anns in images:
+        outlines = {}
+        rle_anns = []
+        for idx, (class_id, segm) in enumerate(anns):
+            if isinstance(segm, list):
+                outlines[idx] = merge_parts(polygon_parts(segm))
+                stats['polygons'] += 1
+            elif isinstance(segm, dict) and rle_ok:
+                rle_anns.append(idx)
+            else:
+                stats['rle_skipped'] += 1
+        if rle_anns:
+            # One decode call for all RLE masks of the image
+            masks = decode_rles([anns[idx][1] for idx in rle_anns], height, width)
+            for idx, outline in zip(rle_anns, mask_outlines(masks)):
+                outlines[idx] = outline
+            stats['rle'] += len(rle_anns)
+
+        lines = []
+        for idx, (class_id, _) in enumerate(anns):
+            outline = outlines.get(idx)
+            if outline is None or len(outline) < 3:
+                if outline is not None:
+                    stats['empty'] += 1
+                continue
+            if max_vertices and len(outline) > max_vertices:
+                outline = cap_vertices(outline, max_vertices)
+                stats['capped'] += 1
+            stats['vertices'] += len(outline)
+            counts[class_id] += 1
+            lines.append(format_seg_line(class_id, outline, width, height))
+        with open(labels_dir / f"{stem}.txt", 'w') as f:
+            f.write("".join(line + "\n" for line in lines))
+    return counts, stats
+
+
+def export_segmentation(annotation_file, dataset_dir, split, target_classes, processes=1,
+                        max_vertices=0, loader="coco"):
+    """
+    Write YOLO-seg labels for every downloaded image of a split.
+
+    Args:
+        annotation_file: COCO instances JSON of the split (with segmentations)
+        dataset_dir: Output directory of download_coco_filtered.py
+        split: 'val2017' or 'train2017'
+        target_classes: Class names to export (class ids follow classes.txt order)
+        processes: Worker processes for mask decoding, contour tracing and writing
+        max_vertices: Maximum vertices per polygon (0 = no cap)
+        loader: Annotation loader, 'coco' or 'stream'
+
+    Returns:
+        Dict with 'class_names', 'instance_counts' and the conversion counters
+    """
+    dataset_dir = Path(dataset_dir)
+    images_dir = dataset_dir / "images" / split
+    seg_dir = dataset_dir / "segment"
+    labels_dir = seg_dir / "labels" / split
+    labels_dir.mkdir(parents=True, exist_ok=True)
+    report = RunReport("yolo_seg", {'split': split, 'classes': target_classes, 'processes': processes,
+                                    'max_vertices': max_vertices, 'loader': loader})
+
+    with report.stage('annotation_load', loader=loader) as record:
+        coco = load_coco(annotation_file, target_classes, loader=loader, ann_fields=SEG_FIELDS)
+        record['items'] = len(coco.anns)
+    cat_ids = sorted(coco.getCatIds(catNms=target_classes))
+    coco_to_yolo = {cat_id: idx for idx, cat_id in enumerate(cat_ids)}
+    class_names = [coco.loadCats(cat_id)[0]['name'] for cat_id in cat_ids]
+
+    # Label every image the download produced (whatever quota/shard selected it)
+    with report.stage('image_selection') as record:
+        present = {entry.name for entry in os.scandir(images_dir) if entry.name.endswith('.jpg')}
+        images = []
+        for img in coco.imgs.values():
+            if img['file_name'] not in present:
+                continue
+            anns = [(coco_to_yolo[ann['category_id']], ann['segmentation'])
+                    for ann in coco.imgToAnns.get(img['id'], [])
+                    if ann['category_id'] in coco_to_yolo and ann.get('segmentation')]
+            images.append((Path(img['file_name']).stem, img['width'], img['height'], anns))
+        images.sort(key=lambda image: image[0])
+        record['items'] = len(images)
+    del coco
+
+    num_chunks = max(1, processes * 4)
+    bounds = np.linspace(0, len(images), num_chunks + 1).astype(np.int64)
+    tasks = [(images[a:b], str(labels_dir), len(class_names), max_vertices)
+             for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    print(f"Converting segmentations of {len(images)} images with {processes} processes...")
+    with report.stage('convert_write', processes=processes) as record:
+        if processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = list(pool.map(_convert_chunk, tasks))
+        else:
+            results = [_convert_chunk(task) for task in tasks]
+        record['items'] = len(images)
+
+    instance_counts = np.zeros(len(class_names), dtype=np.int64)
+    totals = {}
+    for counts, stats in results:
+        instance_counts += counts
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+
+    # Ultralytics derives label paths from image paths, so link the images next to the labels
+    link = seg_dir / "images" / split
+    link.parent.mkdir(parents=True, exist_ok=True)
+    if not os.path.lexists(link):
+        os.symlink(os.path.relpath(images_dir, link.parent), link)
+    with open(seg_dir / "classes.txt", 'w') as f:
+        for name in class_names:
+            f.write(f"{name}\n")
+    yaml_content = f"""# COCO Filtered Dataset (YOLO segmentation)
+path: {seg_dir.absolute()}
+train: images/{split}
+val: images/{split}
+
+nc: {len(class_names)}
+names: {class_names}
+"""
+    with open(seg_dir / "dataset.yaml", 'w') as f:
+        f.write(yaml_content)
+
+    for key, value in totals.items():
+        report.count(key, value)
+    report.save(seg_dir / "run_report.json")
+    return dict(totals, class_names=class_names, num_images=len(images),
+                instance_counts=dict(zip(class_names, instance_counts.tolist())))
+
+
+def main(argv=None, prog=None):
+    """Command-line entry point; argv and prog are set when run through coco_cli.py."""
+    parser = argparse.ArgumentParser(prog=prog, description="Export COCO masks as YOLO-segmentation labels")
+    parser.add_argument('--split', type=str, default='val2017',
+                        choices=['val2017', 'train2017'],
+                        help='Dataset split')
+    parser.add_argument('--output', type=str, default='./coco_filtered',
+                        help='Output directory of download_coco_filtered.py')
+    parser.add_argument('--classes', nargs='+', default=['car', 'person', 'bicycle'],
+                        help='Classes to export')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for RLE decoding, contour tracing and writing')
+    parser.add_argument('--max-vertices', type=int, default=0,
+                        help='Cap each polygon at N evenly spaced vertices (0 = no cap)')
+    parser.add_argument('--loader', type=str, default='coco', choices=['coco', 'stream'],
+                        help="Annotation loader ('stream' keeps only the target classes in memory)")
+    args = parser.parse_args(argv)
+
+    annotation_file = Path(args.output) / "annotations" / f"instances_{args.split}.json"
+    if not annotation_file.exists():
+        parser.error(f"Annotation file not found: {annotation_file}")
+    if not (Path(args.output) / "images" / args.split).is_dir():
+        parser.error(f"No downloaded images in {Path(args.output) / 'images' / args.split}; "
+                     f"run download_coco_filtered.py first")
+
+    result = export_segmentation(annotation_file, args.output, args.split, args.classes,
+                                 processes=args.processes, max_vertices=args.max_vertices, loader=args.loader)
+    seg_dir = Path(args.output) / "segment"
+    print(f"\n{'='*50}")
+    print(f"Segmentation Export Summary")
+    print(f"{'='*50}")
+    print(f"Images: {result['num_images']}")
+    print(f"Polygon annotations: {result.get('polygons', 0)}")
+    print(f"RLE masks traced: {result.get('rle', 0)}")
+    if result.get('rle_skipped'):
+        print(f"RLE masks skipped: {result['rle_skipped']} (install pycocotools and opencv-python-headless)")
+    print(f"Empty outlines dropped: {result.get('empty', 0)}")
+    if args.max_vertices:
+        print(f"Polygons capped at {args.max_vertices} vertices: {result.get('capped', 0)}")
+    print(f"\nInstance counts:")
+    for name, count in result['instance_counts'].items():
+        print(f"  {name}: {count}")
+    print(f"\nLabels: {seg_dir / 'labels' / args.split}")
+    print(f"YOLO dataset config saved to: {seg_dir / 'dataset.yaml'}")
+
+
+if __name__ == "__main__":
+    main()